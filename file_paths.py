@@ -25,6 +25,7 @@ unit_record_folder = base_data_folder / "NOM unit record data"
 individual_movements_folder = unit_record_folder / "NOM individual movements"
 abs_nom_propensity = unit_record_folder / "ABS propensity"
 abs_traveller_characteristics = unit_record_folder / "Traveller Characteristics Parquet"
+nom_column_cache = unit_record_folder / "NOM column cache"
 
 # Grant data
 grant_data_folder = base_data_folder / "Grant"
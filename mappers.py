@@ -68,4 +68,54 @@ nom_group_label_dict = {
         "skill": "Skilled: perm",
         "other": "Unknown",
         "other_permanent": "Other: perm",
-    }
\ No newline at end of file
+    }
+
+# Standard Australian Classification of Countries (SACC) 2016
+# country codes are 4 digits: the 1st digit is the major group (region),
+# the first 2 digits the minor group (sub-region). Codes starting with 0 are
+# supplementary: 00xx (eg 0000 inadequately described, 0001 at sea, 0003 not stated) and
+# 09xx (areas spanning several groups, not further defined, eg 0911 Europe nfd)
+sacc_region = {
+    0: "Supplementary codes",
+    1: "Oceania and Antarctica",
+    2: "North-West Europe",
+    3: "Southern and Eastern Europe",
+    4: "North Africa and the Middle East",
+    5: "South-East Asia",
+    6: "North-East Asia",
+    7: "Southern and Central Asia",
+    8: "Americas",
+    9: "Sub-Saharan Africa",
+}
+
+sacc_sub_region = {
+    0: "Supplementary codes",
+    9: "Supplementary codes: not further defined",
+    11: "Australia (includes External Territories)",
+    12: "New Zealand",
+    13: "Melanesia",
+    14: "Micronesia",
+    15: "Polynesia (excludes Hawaii)",
+    16: "Antarctica",
+    21: "United Kingdom, Channel Islands and Isle of Man",
+    22: "Ireland",
+    23: "Western Europe",
+    24: "Northern Europe",
+    31: "Southern Europe",
+    32: "South Eastern Europe",
+    33: "Eastern Europe",
+    41: "North Africa",
+    42: "Middle East",
+    51: "Mainland South-East Asia",
+    52: "Maritime South-East Asia",
+    61: "Chinese Asia (includes Mongolia)",
+    62: "Japan and the Koreas",
+    71: "Southern Asia",
+    72: "Central Asia",
+    81: "Northern America",
+    82: "South America",
+    83: "Central America",
+    84: "Caribbean",
+    91: "Central and West Africa",
+    92: "Southern and East Africa",
+}
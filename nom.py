@@ -3,12 +3,14 @@
 Utilities for examining ABS NOM unit record
 '''
 
-import pickle
 from pathlib import Path
 import pandas as pd
 import matplotlib as mpl
 from matplotlib import pyplot as plt
 
+import nom_forecast
+import nom_lookups
+
 
 def get_visa_code_descriptions(vsc_list):
     '''
@@ -22,18 +24,12 @@ def get_visa_code_descriptions(vsc_list):
     returns
     -------
     a dictionary matching visa subcode to description
-    '''
-
-    dict_folder = Path(
-        '/Users/christopher/Documents/Analysis/Australian economy/Data/Visa/Dictionaries/')
-
-    with open(dict_folder / 'dict_visa_code_descriptions.pickle', 'rb') as pickle_file:
-        dict_visa_code_descriptions = pickle.load(pickle_file)
 
-    for vsc in vsc_list:
-        print(dict_visa_code_descriptions[vsc])
+    See nom_lookups.get_visa_code_descriptions, which reads the descriptions from the
+    dictionary folder in file_paths
+    '''
 
-    return dict_visa_code_descriptions
+    return nom_lookups.get_visa_code_descriptions(vsc_list)
 
 
 def get_monthly(df, net_erp_effect):
@@ -175,45 +171,13 @@ def get_NOM(data_folder, abs_visa_group, nom_fields, abs_visagroup_exists=False)
 #                            )
 #                      )
 
-def get_NOM_query():
-    """[summary]
-    """
-    nom_fields = [
-        'person_id',
-        'duration_movement_date',
-        'visa_subclass',
-        'net_erp_effect',
-        "country_of_citizenship",
-        "country_of_stay",
-    ]
-
-    # query_visa = "(visa_subclass=='573') | (visa_subclass=='572')"
-    # query_citizenship = "(country_of_citizenship==6101) | (country_of_citizenship==7103) | (country_of_citizenship==7105)"
-    # query_citizenship = "(country_of_citizenship==6203)"
-    # query = f"({query_visa}) and ({query_citizenship}) and net_erp_effect > 0" #or country_of_birth==6101
-
-
-    # Define the groupby
-    def gen_get_query(df_fields):
-        for df in df_fields:
-            yield df #.query(query_citizenship)  #query
-
-    # establish the generators
-    file_paths = nom.gen_nom_files(data_folder, abs_visagroup_exists=False)
-    df_fields = nom.gen_nom_fields(file_paths, nom_fields)
-    df_query = gen_get_query(df_fields)
-
-
-    df = (pd.concat(df_query, axis=0, ignore_index=True, sort=False)
-            .rename({'duration_movement_date': 'date'}, axis='columns')
-            .assign(abs_visa_group = lambda x: x.visa_subclass.map(abs_mapper))
-            .assign(country_of_citizenship = lambda x: x.country_of_citizenship.map(sacc_nom))
-            .assign(country_of_stay = lambda x: x.country_of_stay.map(sacc_nom))
-        )
-
-
+def get_NOM_query(data_folder, vsc_list=None, countries=None, nom_final=True):
+    '''
+    Return NOM movements for selected subclasses and countries of citizenship
 
-    return df
+    See nom_forecast.NomQuery to build other queries of the unit record files
+    '''
+    return nom_forecast.get_NOM_query(data_folder, vsc_list, countries, nom_final)
 
 
 def gen_nom_files(data_folder, abs_visagroup_exists=False):
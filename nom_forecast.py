@@ -2,10 +2,16 @@
 Utilities for examining ABS NOM unit record
 """
 
-import pickle
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import matplotlib as mpl
 from matplotlib import pyplot as plt
 
@@ -17,6 +23,43 @@ from matplotlib.patches import Patch
 from chris_utilities import adjust_chart
 
 import file_paths
+from nom_ingestion import (
+    apply_nom_schema,
+    get_cache_source,
+    get_file_year_quarter,
+    get_nom_writer_schema,
+    get_person_index_path,
+    get_staging_path,
+    nom_partition_status,
+    nom_row_group_size,
+    person_index_folder_name,
+    publish_outfile,
+    read_cache_source,
+    set_cache_source,
+    write_person_index,
+)
+from nom_lookups import (
+    decode_sacc,
+    get_abs_3412_mapper,
+    get_visa_registry,
+    get_visa_subclass_codes,
+    map_visa_subclass,
+)
+from nom_polars import (
+    collect_nom_polars,
+    get_daily_polars,
+    get_monthly_polars,
+    get_nom_backend,
+    scan_nom_polars,
+)
+
+# moved to nom_ingestion and nom_lookups, imported here for existing callers
+from nom_ingestion import process_original_ABS_data, write_outfile  # noqa: F401
+from nom_lookups import (  # noqa: F401
+    get_ABS_visa_grouping,
+    get_visa_code_descriptions,
+    get_vsc_reference,
+)
 
 
 # the data storage
@@ -26,6 +69,7 @@ unit_record_folder = file_paths.unit_record_folder
 individual_movements_folder = file_paths.individual_movements_folder
 abs_nom_propensity = file_paths.abs_nom_propensity
 abs_traveller_characteristics_folder = file_paths.abs_traveller_characteristics
+nom_column_cache_folder = file_paths.nom_column_cache
 grant_data_folder = file_paths.grant_data_folder
 dict_data_folder = file_paths.dict_data_folder
 program_data_folder = file_paths.program_data_folder
@@ -36,219 +80,354 @@ forecasting_data_folder = Path("data/forecasting")
 forecasting_input_folder = forecasting_data_folder / "input"
 
 
-### Utilities to read in raw ABS data:
+# Columns read by nearly every analysis, cached uncompressed (Arrow IPC) for memory mapping
+nom_hot_fields = ["person_id", "duration_movement_date", "visa_subclass", "net_erp_effect"]
 
+# Monthly arrivals and departures by visa subclass from the unique movement files,
+# kept beside them and rebuilt when they change
+nom_monthly_cube_name = "NOM monthly cube.parquet"
 
-def process_original_ABS_data(abs_original_data_folder, analysis_folder):
-    """Process the SAS data, include removing previous preliminary parquet 
-       and replace with final parquet, and add new preliminary parquet for latest quarter
+
+def read_nom_parquet(
+    file_path, nom_fields=None, schema=None, filters=None, cache_folder=None
+):
+    """
+    Read a NOM unit record parquet file, with the schema dtypes if a schema is given
 
     Parameters
     ----------
-    abs_original_data_folder : Path ojbect
-        SAS data directory
-    analysis_folder : Path object
-        ABS Traveller characteristics folder pat
+    file_path: Path object to a NOM parquet file
+    nom_fields: None or list of fields to select, if None all fields
+    schema: None or dict, see read_nom_schema and apply_nom_schema
+    filters: None or pyarrow compute expression, eg from make_nom_filter
+        applied by the pyarrow dataset scanner: row groups whose statistics rule out
+        a match are skipped and non-matching rows are never converted to pandas.
+        Filter fields don't need to be in nom_fields
+    cache_folder: None or Path object to the column cache (see build_nom_column_cache)
+        if the file's cache is current and has nom_fields and the fields used by
+        filters, read the memory mapped cache instead of the parquet file
 
     Returns
     -------
-    None
+    dataframe
+    """
+
+    table = None
+    if cache_folder is not None:
+        table = read_nom_column_cache(file_path, cache_folder, nom_fields, filters)
+
+    if table is not None:
+        # split_blocks lets numeric columns without nulls use the mapped memory
+        df = table.to_pandas(split_blocks=True)
+    elif filters is None:
+        df = pd.read_parquet(file_path, columns=nom_fields)
+    else:
+        df = (
+            ds.dataset(file_path, format="parquet")
+            .to_table(columns=nom_fields, filter=filters)
+            .to_pandas()
+        )
+
+    return apply_nom_schema(df, schema)
 
-    Raises
-    ------
-    ValueError
-        Check ABS NOM files must commence with p or f
-        This differentiates between preliminary and final NOM
-        Raise error to advice user that RTS file name convention not in place
+
+def get_column_cache_path(file_path, cache_folder=None):
     """
-    # TODO: read from the zip file rather than unzipped data
+    Return the path of a NOM parquet file's column cache
 
-    # variables to convert to ints or strings
-    ints_preliminary = [
-        "person_id",
-        "sex",
-        "country_of_birth",
-        "country_of_citizenship",
-        "country_of_stay",
-        "initial_erp_flag",
-        "final_erp_flag",
-        "duration_movement_sort_key",
-        "nom_direction",
-        "duration_in_australia_category",
-        "count_of_movements",
-        "initial_category_of_travel",
-        "age",
-        "status_flag",
-        "reason_for_journey",
-        "odb_time_code",
-    ]
+    Parameters
+    ----------
+    file_path: Path object to a NOM parquet file
+    cache_folder: None or Path object to the column cache, if None nom_column_cache_folder
 
-    ## For preliminary leave as floats: 'rky_val'
+    Returns
+    -------
+    Path object
+    """
 
-    ints_final = [
-        "person_id",
-        "sex",
-        "country_of_birth",
-        "country_of_citizenship",
-        "country_of_stay",
-        "initial_erp_flag",
-        "final_erp_flag",
-        "duration_movement_sort_key",
-        "nom_direction",
-        "duration_in_australia_category",
-        "count_of_movements",
-        "initial_category_of_travel",
-        "age",
-        "status_flag",
-        "reason_for_journey",
-        "odb_time_code",
-        "net_erp_effect",
-        "nom_propensity",
-    ]
+    if cache_folder is None:
+        cache_folder = nom_column_cache_folder
 
-    # string vars are the same across preliminary and final
-    string_vars = [
-        "visa_group",
-        "visa_subclass",
-        "visa_applicant_type",
-        "visa_stream_code",
-        "stream_code_out",
-        "state",
-        "direction",
-    ]
+    return cache_folder / f"{file_path.stem}.arrow"
+
+
+def write_nom_column_cache(file_path, cache_folder=None, nom_fields=None):
+    """
+    Write the hot columns of a NOM parquet file as an uncompressed Arrow IPC (feather)
+    file, read by memory mapping it. Only used while the parquet file is unchanged
 
-    date_times = ["Duration_movement_date"]
+    Parameters
+    ----------
+    file_path: Path object to a NOM parquet file
+    cache_folder: None or Path object to the column cache, if None nom_column_cache_folder
+    nom_fields: None or list of fields to cache, if None nom_hot_fields
 
-    ### For unzipped sas data filess files
-    ### Requires both options - older folders may not have the zipped version
-    # for abs_filepath in sorted(abs_original_data_folder.glob("*.sas7bdat")):
-        # print(abs_filepath.stem)
+    Returns
+    -------
+    cache_path: Path object of the cache file
+    """
 
-        # df = pd.read_sas(abs_filepath, encoding="latin-1", format="sas7bdat").rename(
-        #     columns=str.lower
-        # )
+    if nom_fields is None:
+        nom_fields = nom_hot_fields
 
+    cache_path = get_column_cache_path(file_path, cache_folder)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    staging_path = get_staging_path(cache_path)
 
-    for abs_filepath in sorted(abs_original_data_folder.glob("*.sas7bdat")):
-        print(abs_filepath.stem)
+    # the source is recorded before reading, so a file replaced mid read isn't cached as current
+    source = get_cache_source(file_path)
 
-        df = pd.read_sas(abs_filepath, encoding="latin-1", format="sas7bdat").rename(
-            columns=str.lower
-        )
-    # for zip_filename in sorted(abs_original_data_folder.glob("*.zip")):
-    #     zipped_file = zipfile.ZipFile(zip_filename, 'r')
+    table = pq.read_table(
+        file_path,
+        columns=[col for col in nom_fields if col in pq.read_schema(file_path).names],
+    )
+    table = set_cache_source(table, source)
 
-    #     # There's only expected to be one file in each zip
-    #     if len(zipped_file.namelist()) != 1:
-    #         raise ValueError("Chris: zipped file has more than one file...recode!")
-    #     sasfile = zipfile.open(zipped_file.namelist()[0])
-        
-    #     print(sasfile.stem)
+    with pa.OSFile(str(staging_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
 
-    #     df = pd.read_sas(sasfile, encoding="latin-1", format="sas7bdat").rename(
-    #         columns=str.lower
-    #     )
+    publish_outfile(staging_path, [cache_path])
 
-        ### need to fix all abs_filepath below
+    return cache_path
 
-        # adjust datatypes and write out:
 
-        # string vars are the same across preliminary and final
-        for col in string_vars:
-            df[col] = df[col].astype("category")
+def build_nom_column_cache(
+    data_folder=abs_traveller_characteristics_folder, cache_folder=None, nom_fields=None
+):
+    """
+    Cache the hot columns of every final and preliminary NOM parquet file, see
+    write_nom_column_cache. Files whose cache is current are skipped, and caches of
+    files no longer in data_folder are removed
 
-        # integer variables differ across final and preliminary data
-        if abs_filepath.stem[0] == "p":  # preliminary NOM
-            for col in ints_preliminary:
-                df[col] = df[col].astype(int)
+    Parameters
+    ----------
+    data_folder: Path object to folder of NOM unit record parquet files
+    cache_folder: None or Path object to the column cache, if None nom_column_cache_folder
+    nom_fields: None or list of fields to cache, if None nom_hot_fields
 
-        elif abs_filepath.stem[0] == "f":  # final NOM
-            for col in ints_final:
-                df[col] = df[col].astype(int)
+    Returns
+    -------
+    list of Path objects of the cache files
+    """
 
-        else:
-            raise ValueError(
-                "Chris - ABS NOM files must commence with p or f: {abs_filepath.stem} does not!"
-            )
+    if cache_folder is None:
+        cache_folder = nom_column_cache_folder
 
-        write_outfile(df, abs_filepath, abs_original_data_folder, analysis_folder)
+    cache_paths = []
 
-    return None
+    for nom_final in [True, False]:
+        for file_path in gen_nom_files(data_folder, nom_final=nom_final):
+            cache_path = get_column_cache_path(file_path, cache_folder)
+
+            if read_cache_source(cache_path) != get_cache_source(file_path):
+                print(file_path.stem)
+                write_nom_column_cache(file_path, cache_folder, nom_fields)
+
+            cache_paths.append(cache_path)
+
+    for cache_path in cache_folder.glob("*.arrow"):
+        if cache_path not in cache_paths:
+            cache_path.unlink()
+
+    return cache_paths
+
+
+def read_nom_column_cache(file_path, cache_folder=None, nom_fields=None, filters=None):
+    """
+    Read a NOM parquet file's fields from its memory mapped column cache
+
+    Parameters
+    ----------
+    file_path: Path object to a NOM parquet file
+    cache_folder: None or Path object to the column cache, if None nom_column_cache_folder
+    nom_fields: list of fields to select
+    filters: None or pyarrow compute expression, eg from make_nom_filter
+
+    Returns
+    -------
+    pyarrow table, or None if the cache is not current or doesn't have nom_fields
+    and the fields used by filters
+    """
+
+    if nom_fields is None:
+        return None
 
+    cache_path = get_column_cache_path(file_path, cache_folder)
 
-def write_outfile(df, abs_filepath, abs_original_data_folder, analysis_folder):
+    if read_cache_source(cache_path) != get_cache_source(file_path):
+        return None
+
+    with pa.memory_map(str(cache_path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    if not set(nom_fields).issubset(table.column_names):
+        return None
+
+    if filters is None:
+        return table.select(nom_fields)
+
+    # the filter is bound to the cache's fields when the scanner is made (before
+    # anything is read) - a filter on a field that isn't cached fails to bind
+    try:
+        scanner = ds.dataset(table).scanner(columns=nom_fields, filter=filters)
+    except pa.ArrowInvalid:
+        return None
+
+    return scanner.to_table()
+
+
+def build_person_index(analysis_folder=abs_traveller_characteristics_folder):
     """
-    write out the processed ABS data to the ABS data folder and the analysis folder
+    Index every final and preliminary NOM parquet file by person_id (see write_person_index)
+    Files whose index is current are skipped, and indexes of files no longer in
+    analysis_folder are removed
 
     Parameters
     ----------
-    df: pandas dataframe to write out
-    abs_filepath: Path object of original ABS file
-    abs_original_data_folder: Path object of path to ABS data folder
     analysis_folder: Path to folder containing all NOM unit record parquet files
 
     Returns
     -------
-    None
+    list of Path objects of the person indexes
     """
 
-    # ABS NOM filenames are of the type xxxx2018q1.sas...
-    # Want to extract the date compenent: 2018q1
-    date_start = abs_filepath.stem.find("2")
+    index_paths = []
 
-    if date_start != -1:  # if a '2' is found
-        filename_date = abs_filepath.stem[date_start:]
+    for nom_final in [True, False]:
+        for file_path in gen_nom_files(analysis_folder, nom_final=nom_final):
+            index_path = get_person_index_path(file_path, analysis_folder)
 
-        ## append '_p' if it's a preliminary file
-        if abs_filepath.stem[0] == "p":
-            filename_date = filename_date + "_p"
-    else:
-        raise ValueError(
-            f"Chris - filename {abs_filepath.stem} does not appear to have a 20XXqY date in it"
-        )
+            if read_cache_source(index_path) != get_cache_source(file_path):
+                print(file_path.stem)
+                write_person_index(file_path, analysis_folder)
+
+            index_paths.append(index_path)
+
+    for index_path in (analysis_folder / person_index_folder_name).glob("*.arrow"):
+        if index_path not in index_paths:
+            index_path.unlink()
+
+    return index_paths
+
+
+def get_person_history(
+    person_ids,
+    analysis_folder=abs_traveller_characteristics_folder,
+    nom_fields=None,
+    nom_final=True,
+    schema=None,
+):
+    """
+    Return the NOM unit records of the given people, reading only the row groups
+    holding them (see write_person_index). A missing or stale index is rebuilt first
+
+    Parameters
+    ----------
+    person_ids: list of person_id
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+    nom_fields: None or list of fields to select, if None all fields
+    nom_final: boolean, True for final NOM files, False for preliminary NOM files
+    schema: None or dict, see read_nom_schema and apply_nom_schema
+
+    Returns
+    -------
+    dataframe: the records in file order, with a file column of the parquet file name
+    """
+
+    person_ids = np.unique(np.asarray(person_ids, dtype="int64"))
+
+    if nom_fields is not None and "person_id" not in nom_fields:
+        nom_fields = ["person_id"] + list(nom_fields)
+
+    dfs = []
+
+    for file_path in gen_nom_files(analysis_folder, nom_final=nom_final):
+        index_path = get_person_index_path(file_path, analysis_folder)
+
+        if read_cache_source(index_path) != get_cache_source(file_path):
+            print(f"{file_path.stem}: person index is missing or stale, rebuilding")
+            write_person_index(file_path, analysis_folder)
+
+        with pa.memory_map(str(index_path)) as source:
+            person_index = pa.ipc.open_file(source).read_all()
 
-    filename = "traveller_characteristics" + filename_date + ".parquet"
+        indexed_ids = person_index.column("person_id").to_numpy()
 
-    # Write to original ABS folder:
-    #    to keep as history for comparison with updated preliminary/final files
-    df.to_parquet(abs_original_data_folder / filename)
+        # entries of each person are contiguous in the sorted index
+        starts = np.searchsorted(indexed_ids, person_ids, side="left")
+        stops = np.searchsorted(indexed_ids, person_ids, side="right")
 
-    # Write to folder for analysis
-    df.to_parquet(analysis_folder / filename)
+        entries = np.concatenate(
+            [np.arange(start, stop) for start, stop in zip(starts, stops)] + [[]]
+        ).astype("int64")
 
-    # if a final file replaces a preliminary file - delete it from the analysis file
-    if abs_filepath.stem[0] == "f":
-        preliminary_filename = (
-            "traveller_characteristics" + filename_date + "_p" + ".parquet"
+        if not len(entries):
+            continue
+
+        locations = (
+            person_index.take(entries)
+            .select(["row_group", "row_start", "row_stop"])
+            .to_pandas()
+            .groupby("row_group")
+            .agg({"row_start": "min", "row_stop": "max"})
         )
-        preliminary_path = analysis_folder / preliminary_filename
-        if preliminary_path.exists():
-            preliminary_path.unlink()
 
-    return None
+        parquet_file = pq.ParquetFile(file_path)
+
+        for row_group, (row_start, row_stop) in locations.iterrows():
+            table = parquet_file.read_row_group(int(row_group), columns=nom_fields)
+            table = table.slice(int(row_start), int(row_stop - row_start))
+            table = table.filter(
+                pc.is_in(table.column("person_id"), value_set=pa.array(person_ids))
+            )
+
+            dfs.append(
+                apply_nom_schema(table.to_pandas(), schema).assign(file=file_path.name)
+            )
+
+    if not dfs:
+        return pd.DataFrame(columns=nom_fields)
+
+    return pd.concat(dfs, ignore_index=True)
 
 
-def get_visa_code_descriptions(vsc_list):
+def make_nom_filter(vsc_list=None, net_erp_effect=False, filters=None):
     """
-    get visa code descriptions
+    Make a pyarrow filter expression to select NOM unit records in the parquet scan
 
-    parameters
+    Parameters
     ----------
-    vsc_list: list
-       visa suc codes as strings
+    vsc_list: None or list of visa subclasses to select, if None select all
+    net_erp_effect: boolean, default False
+        if True, only select records with a NOM effect (net_erp_effect != 0)
+    filters: None or pyarrow compute expression to combine (and) with the above,
+        eg pc.field("duration_movement_date") >= pd.Timestamp("2015-01-01")
 
-    returns
+    Returns
     -------
-    a dictionary matching visa subcode to description
+    pyarrow compute expression, or None if there's nothing to filter
     """
 
-    with open(dict_data_folder / "dict_visa_code_descriptions.pickle", "rb") as pickle_file:
-        dict_visa_code_descriptions = pickle.load(pickle_file)
+    expressions = []
+
+    if vsc_list is not None:
+        expressions.append(pc.field("visa_subclass").isin(list(vsc_list)))
 
-    for vsc in vsc_list:
-        print(dict_visa_code_descriptions[vsc])
+    if net_erp_effect:
+        expressions.append(pc.field("net_erp_effect") != 0)
 
-    return dict_visa_code_descriptions
+    if filters is not None:
+        expressions.append(filters)
+
+    if not expressions:
+        return None
+
+    nom_filter = expressions[0]
+    for expression in expressions[1:]:
+        nom_filter = nom_filter & expression
+
+    return nom_filter
 
 
 def get_monthly(
@@ -268,7 +447,12 @@ def get_monthly(
     return summary.resample("M").sum()
 
 
-def read_single_NOM_file(data_folder, file_name, field_list=None):
+def read_single_NOM_file(data_folder, file_name, field_list=None, cache_folder=None):
+
+    if cache_folder is not None:
+        table = read_nom_column_cache(data_folder / file_name, cache_folder, field_list)
+        if table is not None:
+            return table.to_pandas(split_blocks=True)
 
     if field_list is None:
         df = pd.read_parquet(data_folder / file_name)
@@ -400,7 +584,31 @@ def append_nom_columns(df):
     return df
 
 
-def make_unique_movement_files(characteristcis_folder=abs_traveller_characteristics_folder, nom_final=True):
+def make_unique_movement_files(
+    characteristcis_folder=abs_traveller_characteristics_folder,
+    nom_final=True,
+    prefetch=0,
+    backend="pandas",
+):
+    """
+    Write all final (or preliminary) NOM movements, sorted by date and person_id
+
+    See make_unique_movement_files_external to sort movements that don't fit in memory
+
+    Parameters
+    ----------
+    characteristcis_folder: Path object to folder of NOM unit record parquet files
+    nom_final: boolean, True for final NOM files, False for preliminary NOM files
+    prefetch: int, default=0
+        number of files read ahead on a thread pool, see gen_nom_fields
+    backend: str, default "pandas"
+        if "polars", the movements are read and sorted in one multi-threaded polars
+        query (see scan_nom_polars)
+
+    Returns
+    -------
+    dataframe
+    """
     nom_fields = [
         "person_id",
         "duration_movement_date",
@@ -415,147 +623,246 @@ def make_unique_movement_files(characteristcis_folder=abs_traveller_characterist
         abs_visagroup_exists=False,
         nom_final=nom_final)
 
-    df_get_fields = gen_nom_fields(get_file_paths, nom_fields)
-    df_visa_group = gen_get_visa_group(df_get_fields, vsc_list=None)
-
+    if get_nom_backend(backend) == "polars":
+        df = collect_nom_polars(
+            scan_nom_polars(get_file_paths, nom_fields)
+            .rename({"duration_movement_date": "date"})
+            .sort(["date", "person_id"])
+        )
 
-    # build the NOM dataframe
-    df = (pd.concat(df_visa_group, axis="index", ignore_index=True, sort=False)
-                    .rename({"duration_movement_date": "date"}, axis="columns")
-                    .sort_values(["date", "person_id"])
-                )
-    
-    if nom_final:
-        file_name = "NOM unique movement - final.parquet"
     else:
-        file_name = "NOM unique movement - preliminary.parquet"
-
-    df.to_parquet(individual_movements_folder / file_name)
+        df_get_fields = gen_nom_fields(get_file_paths, nom_fields, prefetch=prefetch)
+        df_visa_group = gen_get_visa_group(df_get_fields, vsc_list=None)
 
-    return df
+        # build the NOM dataframe
+        df = (pd.concat(df_visa_group, axis="index", ignore_index=True, sort=False)
+                        .rename({"duration_movement_date": "date"}, axis="columns")
+                        .sort_values(["date", "person_id"])
+                    )
 
+    df.to_parquet(individual_movements_folder / get_unique_movement_file_name(nom_final))
 
+    return df
 
 
-# Dictionary utilities
-def get_vsc_reference(file_path=None):
+def make_unique_movement_files_external(
+    characteristcis_folder=abs_traveller_characteristics_folder,
+    nom_final=True,
+    prefetch=0,
+    batch_rows=nom_row_group_size,
+):
     """
-    Return a dataframe containing definitions and groupings for visa subclasses
-    The reference definitions and groupings is the sql table 'REF_VISA_SUBCLASS'
-    It is maintained by the visa stats team.
+    Write all final (or preliminary) NOM movements, sorted by date and person_id,
+    as make_unique_movement_files does, by sorting each NOM file to disk and merging
+    the sorted runs (see merge_sorted_runs)
 
-    Parameters:
-    -----------
-    file_path: Path or str object
-        filepath to parquet file
+    Parameters
+    ----------
+    characteristcis_folder: Path object to folder of NOM unit record parquet files
+    nom_final: boolean, True for final NOM files, False for preliminary NOM files
+    prefetch: int, default=0
+        number of files read ahead on a thread pool, see gen_nom_fields
+    batch_rows: int, rows read from each sorted run at a time
 
-    Returns:
+    Returns
     -------
-    dataframe
+    Path object of the file written
     """
+    nom_fields = [
+        "person_id",
+        "duration_movement_date",
+        "visa_subclass",
+        "net_erp_effect",
+    ]
 
-    if file_path == None:
-        file_path = dict_data_folder / "REF_VISA_SUBCLASS.parquet"
-
-    reference_visa_dict = (
-        pd.read_parquet(file_path)
-        .rename(columns=str.lower)
-        .rename(columns=lambda x: x.replace(" ", "_"))
+    get_file_paths = gen_nom_files(
+        characteristcis_folder, abs_visagroup_exists=False, nom_final=nom_final
     )
+    df_get_fields = gen_nom_fields(get_file_paths, nom_fields, prefetch=prefetch)
+    df_visa_group = gen_get_visa_group(df_get_fields, vsc_list=None)
+
+    file_path = individual_movements_folder / get_unique_movement_file_name(nom_final)
+    staging_path = get_staging_path(file_path)
+
+    # spill the runs beside the output, the system temp folder may be too small
+    with tempfile.TemporaryDirectory(dir=individual_movements_folder) as run_folder:
+        try:
+            run_paths = write_sorted_runs(
+                (
+                    df.rename({"duration_movement_date": "date"}, axis="columns")
+                    for df in df_visa_group
+                ),
+                ["date", "person_id"],
+                Path(run_folder),
+            )
+            merge_sorted_runs(run_paths, ["date", "person_id"], staging_path, batch_rows)
+
+        except BaseException:
+            if staging_path.exists():
+                staging_path.unlink()
+            raise
+
+        finally:
+            for run_path in Path(run_folder).glob("run_*.parquet"):
+                run_path.unlink()
+
+    publish_outfile(staging_path, [file_path])
 
-    return reference_visa_dict
+    return file_path
 
 
-def get_ABS_visa_grouping(file_path=None):
+def get_unique_movement_file_name(nom_final=True):
+    """
+    Return the name of the final (or preliminary) unique movement file
     """
-    Return a dataframe with ABS visa groupings (in cat no. 3412) by subclass
-    See ABS Migration unit for updated copies of excel file
 
-    Parameters:
-    -----------
-    file_path: None or Path object to 'ABS - Visacode3412mapping.xlsx'
+    if nom_final:
+        return "NOM unique movement - final.parquet"
 
-    Returns:
+    return "NOM unique movement - preliminary.parquet"
+
+
+def write_sorted_runs(dfs, sort_columns, run_folder):
+    """
+    Sort each dataframe and write it to a parquet file (a sorted run)
+
+    Parameters
+    ----------
+    dfs: iterable of dataframes
+    sort_columns: list of columns to sort by
+    run_folder: Path object of the folder to write the runs to
+
+    Returns
     -------
-    dataframe
+    list of Path objects of the runs, in the order of dfs
     """
 
-    if file_path is None:
-        file_path = dict_data_folder / "ABS - Visacode3412mapping.xlsx"
+    run_paths = []
 
-    abs_3412 = (
-        pd.read_excel(file_path)
-        .rename(columns=str.lower)
-        .rename(columns=lambda x: x.replace(" ", "_"))
-        # make sure visa subclass code is a string
-        .assign(visa_subclass_code=lambda x: x.visa_subclass_code.astype(str))
-    )
+    for df in dfs:
+        if df.empty:
+            continue
 
-    return abs_3412
+        run_path = run_folder / f"run_{len(run_paths):05d}.parquet"
 
+        df.sort_values(sort_columns, kind="mergesort").to_parquet(run_path, index=False)
+        run_paths.append(run_path)
 
-def get_abs_3412_mapper(df_abs_3412=None):
+    return run_paths
+
+
+def merge_sorted_runs(run_paths, sort_columns, file_path, batch_rows=nom_row_group_size):
     """
-    Return a dictionary to map subclass strings to modified ABS groupings
+    k-way merge sorted parquet runs into one sorted parquet file, holding one batch
+    of each run in memory. As with sort_values, rows with equal keys aren't ordered
 
     Parameters
     ----------
-    df_abs_3412: dataframe, output from get_ABS_visa_grouping
-        3 columns in the dataframe: visa_subclass_code,
-                                    visa_subclass_label,
-                                    migration_publication_category
+    run_paths: list of Path objects of the sorted runs, with the same columns
+    sort_columns: list of columns the runs are sorted by
+    file_path: Path object of the parquet file to write
+    batch_rows: int, rows read from each run at a time
 
-    Returns:
-    --------
-    abs_3412_mapper
+    Returns
+    -------
+    None
     """
-    # TODO: add in test that dataframe contains the expected columns
-
-    if df_abs_3412 is None:
-        df_abs_3412 = get_ABS_visa_grouping()
 
-    idx = ["visa_subclass_code", "migration_publication_category"]
-    abs_3412_mapper = df_abs_3412[idx].set_index("visa_subclass_code").squeeze()
+    run_files = {run_path: pq.ParquetFile(run_path) for run_path in run_paths}
 
-    # Thhe ABS migration_publication_category splits students out - put them back into one group
-    student_mapper = {
-        "Higher education sector": "Student",
-        "Student  VET": "Student",
-        "Student other": "Student",
+    batches = {
+        run_path: run_file.iter_batches(batch_size=batch_rows)
+        for run_path, run_file in run_files.items()
     }
 
-    abs_3412_mapper[abs_3412_mapper.isin(student_mapper.keys())] = "Student"
-
-    ## break out a bridging category
-    bridging = {
-        "10": "Bridging",
-        "010": "Bridging",
-        "020": "Bridging",
-        "20": "Bridging",
-        "030": "Bridging",
-        "30": "Bridging",
-        "040": "Bridging",
-        "40": "Bridging",
-        "041": "Bridging",
-        "41": "Bridging",
-        "42": "Bridging",
-        "042": "Bridging",
-        "050": "Bridging",
-        "50": "Bridging",
-        "051": "Bridging",
-        "51": "Bridging",
-        "060": "Bridging",
-        "60": "Bridging",
-        "070": "Bridging",
-    }
+    # runs hold different categories, so their dictionary index widths differ
+    schema = pa.unify_schemas(
+        [
+            get_nom_writer_schema(run_file.schema_arrow)
+            for run_file in run_files.values()
+        ]
+    )
+
+    def read_batch(run_path):
+        # the next batch of the run, or None when the run is used up
+        for batch in batches[run_path]:
+            if batch.num_rows:
+                return batch.to_pandas()
+
+        return None
+
+    buffers = {}
+    parquet_writer = None
+
+    try:
+        for run_path in run_paths:
+            df = read_batch(run_path)
+            if df is not None:
+                buffers[run_path] = df
 
-    idx = abs_3412_mapper.index.isin(bridging.keys())
-    abs_3412_mapper[idx] = "Bridging"
+        while buffers:
+            # the smallest of the last keys
+            bound = min(
+                (tuple(df[sort_columns].iloc[-1]) for df in buffers.values())
+            )
+
+            merged = []
+            for run_path in list(buffers):
+                df = buffers[run_path]
+                up_to_bound = is_key_up_to(df, sort_columns, bound)
+
+                merged.append(df[up_to_bound])
+
+                if up_to_bound.all():
+                    df = read_batch(run_path)
+                    if df is None:
+                        del buffers[run_path]
+                    else:
+                        buffers[run_path] = df
+                else:
+                    buffers[run_path] = df[~up_to_bound]
+
+            table = pa.Table.from_pandas(
+                pd.concat(merged, ignore_index=True).sort_values(
+                    sort_columns, kind="mergesort"
+                ),
+                schema=schema,
+                preserve_index=False,
+            )
+
+            if parquet_writer is None:
+                parquet_writer = pq.ParquetWriter(file_path, schema)
+
+            parquet_writer.write_table(table)
+
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+
+        # release the runs, so they can be deleted
+        for run_file in run_files.values():
+            run_file.close()
+
+    if parquet_writer is None:
+        raise ValueError(f"Chris - no rows to write to {file_path.name}")
+
+    return None
+
+
+def is_key_up_to(df, sort_columns, bound):
+    """
+    Return a boolean series, True where the row's sort_columns are <= bound
+    (compared in order, like tuples)
+    """
+
+    up_to = pd.Series(False, index=df.index)
+    equal = pd.Series(True, index=df.index)
 
-    # as the mapper is used to generate variable names (in columns), make lowercase, no breaks
-    abs_3412_mapper = abs_3412_mapper.str.lower().str.replace(" ", "_")
+    for col, value in zip(sort_columns, bound):
+        up_to |= equal & (df[col] < value)
+        equal &= df[col] == value
 
-    return abs_3412_mapper
+    return up_to | equal
 
 
 def get_ABS_3412_definitions(abs_3412_excel_path):
@@ -1171,59 +1478,164 @@ def get_NOM_final_preliminary(data_folder=individual_movements_folder, arrival=T
     return nom
 
 
-def make_vsc_multiIndex(df, mapper=None):
+def get_NOM_monthly_cube(data_folder=individual_movements_folder):
     """
-    generate multiIndex by mapping vsc (column labels of df) via a dict
-
-    Parameters:
-    -----------
-    df: dataframe whose column names are visa subclass codes
+    Return the monthly cube of the final and preliminary unique movement files,
+    building it if it is missing or the unique movement files have changed
 
-    mapper: a Series mapping subclass codes to labels, usually would be get_abs_3412_mapper
+    Parameters
+    ----------
+    data_folder: Path object to the folder of the unique movement files
 
-    Returns:
-    --------
-    dataframe: original dataframe with multiIndex columns
+    Returns
+    -------
+    tidy dataframe with columns: date (month end), visa_subclass, direction, net_erp_effect
     """
 
-    if mapper is None:
-        mapper = get_abs_3412_mapper()
+    cube_path = data_folder / nom_monthly_cube_name
 
-    # check no unmapped visa subclasses
-    # ie test whether every vsc element df.columns is in the mapper index
-    col_set = set(df.columns)
-    map_set = set(mapper.index)
+    if read_cache_source(cube_path) == get_NOM_monthly_cube_source(data_folder):
+        return pd.read_parquet(cube_path)
 
-    if not map_set.issuperset(col_set):
-        vsc_missing = col_set.difference(map_set)
-        error_msg = f"Unmapped visa subclass for {vsc_missing}. \nAdjust file: ABS - Visacode3412mapping.xlsx"
-        print(f"{error_msg}")
-        raise ValueError(f"\nChris: {error_msg}")
+    return build_NOM_monthly_cube(data_folder)
 
-    m_index = mapper.loc[df.columns]
 
-    # check no unmapped visa subclasses
-    idx = m_index.isna()
+def get_NOM_monthly_cube_source(data_folder):
+    """
+    Return the size and modification time of each unique movement file the cube is built from
+    """
 
-    if idx.any():
-        print("Unmapped visa subclasses for:")
-        print(f"{m_index.loc[idx]}")
-        raise ValueError(f"Chris: Unmapped visa subclass for {m_index.loc[idx]}")
+    return {
+        file_name: get_cache_source(data_folder / file_name)
+        for file_name in [
+            "NOM unique movement - final.parquet",
+            "NOM unique movement - preliminary.parquet",
+        ]
+    }
 
-    df.columns = pd.MultiIndex.from_tuples(
-        zip(m_index.values, m_index.index), names=["abs_visa_group", "vsc"]
-    )
-    return df.sort_index(axis=1)
 
+def build_NOM_monthly_cube(data_folder=individual_movements_folder):
+    """
+    Sum the final and preliminary unique movement files to a monthly cube of
+    visa subclass by direction (unrounded), and write it to data_folder
 
-def nom_year_ending(df):
-    """Generate a dataframe with multinidex columns given by variables 
-        abs_visa_group and direction, value is calculated as yearending
-    
     Parameters
     ----------
-    df : dataframe
-        contains 4 columns; date, abs_visa_group, direction, value
+    data_folder: Path object to the folder of the unique movement files
+
+    Returns
+    -------
+    tidy dataframe with columns: date (month end), visa_subclass, direction, net_erp_effect
+    """
+
+    cube_source = get_NOM_monthly_cube_source(data_folder)
+
+    partials = []
+    for file_name in cube_source:
+        df = pd.read_parquet(
+            data_folder / file_name, columns=["date", "visa_subclass", "net_erp_effect"]
+        )
+        df = df[df.net_erp_effect != 0]
+
+        partials.append(
+            df.assign(
+                date=df.date.dt.to_period("M"),
+                direction=np.where(df.net_erp_effect > 0, "arrival", "departure"),
+            )
+            .groupby(["date", "visa_subclass", "direction"], observed=True)
+            .net_erp_effect.sum()
+            .reset_index()
+            .astype({"visa_subclass": str})
+        )
+
+    cube = (
+        pd.concat(partials, ignore_index=True)
+        .groupby(["date", "visa_subclass", "direction"])
+        .net_erp_effect.sum()
+        .reset_index()
+    )
+    # month periods to month end dates, as from resample("M")
+    cube["date"] = cube.date.dt.to_timestamp(how="end").dt.normalize()
+
+    table = set_cache_source(
+        pa.Table.from_pandas(cube, preserve_index=False), cube_source
+    )
+
+    cube_path = data_folder / nom_monthly_cube_name
+    staging_path = get_staging_path(cube_path)
+    pq.write_table(table, staging_path)
+    publish_outfile(staging_path, [cube_path])
+
+    return cube
+
+
+def make_vsc_multiIndex(df, mapper=None):
+    """
+    generate multiIndex by mapping vsc (column labels of df) via a dict
+
+    Parameters:
+    -----------
+    df: dataframe whose column names are visa subclass codes
+
+    mapper: a Series mapping subclass codes to labels, usually would be get_abs_3412_mapper
+        if None, map to the ABS groups by the visa registry's integer codes
+        (see map_visa_subclass)
+
+    Returns:
+    --------
+    dataframe: original dataframe with multiIndex columns
+    """
+
+    if mapper is None:
+        abs_groups = map_visa_subclass(df.columns, "abs_group")
+        unmapped = abs_groups.isna()
+
+        if unmapped.any():
+            vsc_missing = set(df.columns[unmapped])
+            error_msg = f"Unmapped visa subclass for {vsc_missing}. \nAdjust file: ABS - Visacode3412mapping.xlsx"
+            print(f"{error_msg}")
+            raise ValueError(f"\nChris: {error_msg}")
+
+        df.columns = pd.MultiIndex.from_arrays(
+            [np.asarray(abs_groups), df.columns], names=["abs_visa_group", "vsc"]
+        )
+        return df.sort_index(axis=1)
+
+    # check no unmapped visa subclasses
+    # ie test whether every vsc element df.columns is in the mapper index
+    col_set = set(df.columns)
+    map_set = set(mapper.index)
+
+    if not map_set.issuperset(col_set):
+        vsc_missing = col_set.difference(map_set)
+        error_msg = f"Unmapped visa subclass for {vsc_missing}. \nAdjust file: ABS - Visacode3412mapping.xlsx"
+        print(f"{error_msg}")
+        raise ValueError(f"\nChris: {error_msg}")
+
+    m_index = mapper.loc[df.columns]
+
+    # check no unmapped visa subclasses
+    idx = m_index.isna()
+
+    if idx.any():
+        print("Unmapped visa subclasses for:")
+        print(f"{m_index.loc[idx]}")
+        raise ValueError(f"Chris: Unmapped visa subclass for {m_index.loc[idx]}")
+
+    df.columns = pd.MultiIndex.from_tuples(
+        zip(m_index.values, m_index.index), names=["abs_visa_group", "vsc"]
+    )
+    return df.sort_index(axis=1)
+
+
+def nom_year_ending(df):
+    """Generate a dataframe with multinidex columns given by variables 
+        abs_visa_group and direction, value is calculated as yearending
+    
+    Parameters
+    ----------
+    df : dataframe
+        contains 4 columns; date, abs_visa_group, direction, value
         data is monthly
 
     Returns
@@ -1384,7 +1796,9 @@ def get_nom_forecast(nom_forecast_filepath, grouping=["date", "abs_visa_group",
 
 
 ######### Preparing NOM monthly forecasting data: Generators #######
-def gen_nom_files(data_folder, abs_visagroup_exists=False, nom_final=True):
+def gen_nom_files(
+    data_folder, abs_visagroup_exists=False, nom_final=True, year_start=None, year_end=None
+):
     """
         A generator to the file path to nom unit record file
 
@@ -1403,12 +1817,32 @@ def gen_nom_files(data_folder, abs_visagroup_exists=False, nom_final=True):
             True if extracting unique NOM from final NOM file
             False if extracting unique propensity NOM from preliminary NOM file
 
+        year_start, year_end: None or int
+            first and last year (of the 20XXqY date in the file names) to select
+            if None, no limit
+
+        Files in a partitioned data_folder (status=final|preliminary/year=YYYY/quarter=Q/)
+        are selected by folder - only the folders for nom_final and the years are listed
+
         Yields
         -------
-        file_path: path object to parquet file
+        file_path: path object to parquet file, in file name order
     """
 
-    for file_path in sorted(data_folder.glob("*.parquet")):
+    file_paths = list(data_folder.glob("*.parquet"))
+
+    status_folder = data_folder / f"status={nom_partition_status['f' if nom_final else 'p']}"
+
+    for year_folder in status_folder.glob("year=*"):
+        if is_year_selected(int(year_folder.name[len("year="):]), year_start, year_end):
+            file_paths.extend(year_folder.glob("quarter=*/*.parquet"))
+
+    for file_path in sorted(file_paths, key=lambda x: x.name):
+        if year_start is not None or year_end is not None:
+            year, _ = get_file_year_quarter(file_path)
+            if year is None or not is_year_selected(year, year_start, year_end):
+                continue
+
         if abs_visagroup_exists:
             # The field 'visagroup' exists only in post 2011Q3 files
             # Only loop over these files
@@ -1424,7 +1858,29 @@ def gen_nom_files(data_folder, abs_visagroup_exists=False, nom_final=True):
                 yield file_path
 
 
-def gen_nom_fields(file_paths, nom_fields, net_erp_effect=True):
+def is_year_selected(year, year_start=None, year_end=None):
+    """
+    Check whether year is in [year_start, year_end] - where None is no limit
+    """
+
+    if year_start is not None and year < year_start:
+        return False
+
+    if year_end is not None and year > year_end:
+        return False
+
+    return True
+
+
+def gen_nom_fields(
+    file_paths,
+    nom_fields,
+    net_erp_effect=True,
+    filters=None,
+    prefetch=0,
+    cache_folder=None,
+    schema=None,
+):
     """
         A generator to return DataFrames where NOM event triggered
         for given fields in a unit record file
@@ -1441,18 +1897,70 @@ def gen_nom_fields(file_paths, nom_fields, net_erp_effect=True):
           if True, only return if net_erp = 1 or -1
           if False, return all net_erp values
 
+        filters: None or pyarrow compute expression, eg make_nom_filter(vsc_list)
+          pushed down (with the net_erp_effect selection) into the parquet scan,
+          so rows not selected are never read into pandas
+
+        prefetch: int, default=0
+          if 0, read each file when the previous DataFrame has been consumed
+          else, read up to prefetch files ahead on a thread pool while the current
+          DataFrame is consumed. At most prefetch DataFrames are held in
+          addition to the current one, and files are yielded in file_paths order
+
+        cache_folder: None or Path object to the column cache, see read_nom_parquet
+
+        schema: None or dict, see read_nom_schema
+          if None, return columns as read
+          else, cast columns to the schema dtypes, see apply_nom_schema
+
         Yields
         -------
         df: DataFrame containing selected fields
     """
-    for file_path in file_paths:
-        print(file_path.stem)
+    scan_filter = make_nom_filter(net_erp_effect=net_erp_effect, filters=filters)
 
-        df = pd.read_parquet(file_path, columns=nom_fields)
-        if net_erp_effect:
-            yield df.query("net_erp_effect != 0")
-        else:
-            yield df
+    if not prefetch:
+        for file_path in file_paths:
+            print(file_path.stem)
+
+            yield read_nom_parquet(
+                file_path, nom_fields, schema, scan_filter, cache_folder
+            )
+
+        return
+
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        # files being read, in file_paths order
+        in_flight = deque()
+
+        for file_path in file_paths:
+            # submit the next file before yielding, so it's read while the
+            # yielded DataFrame is consumed
+            in_flight.append(
+                (
+                    file_path,
+                    executor.submit(
+                        read_nom_parquet,
+                        file_path,
+                        nom_fields,
+                        schema,
+                        scan_filter,
+                        cache_folder,
+                    ),
+                )
+            )
+
+            if len(in_flight) > prefetch:
+                file_path_read, df_future = in_flight.popleft()
+                print(file_path_read.stem)
+
+                yield df_future.result()
+
+        while in_flight:
+            file_path_read, df_future = in_flight.popleft()
+            print(file_path_read.stem)
+
+            yield df_future.result()
 
 
 def gen_get_visa_group(df_fields, vsc_list=None):
@@ -1466,6 +1974,9 @@ def gen_get_visa_group(df_fields, vsc_list=None):
 
     vsc_list: a list or None
       A list of visa sub class numbers to be selected, or, if None, select all
+
+    To select visa subclasses before rows are read into pandas, pass
+    filters=make_nom_filter(vsc_list) to gen_nom_fields instead
     """
 
     for df in df_fields:
@@ -1475,45 +1986,323 @@ def gen_get_visa_group(df_fields, vsc_list=None):
             yield df.query("visa_subclass == @vsc_list")
 
 
-def get_NOM_query():
-    """[summary]
+class NomQuery:
+    """
+    A query of the NOM unit record parquet files: select fields, filter, group and
+    aggregate, compiled into one pyarrow dataset scan
+
+    Parameters
+    ----------
+    data_folder: Path object to folder of NOM unit record parquet files (flat or partitioned)
+    nom_final: boolean, default True
+        True for final NOM files, False for preliminary NOM files
+    net_erp_effect: boolean, default True
+        if True, only select records with a NOM effect (net_erp_effect != 0)
+
+    Example
+    -------
+    monthly_arrivals = (
+        NomQuery()
+        .select(["duration_movement_date", "visa_subclass", "net_erp_effect"])
+        .where_visa_subclass(["500", "572", "573"])
+        .where_date(start="2015-01-01")
+        .where_direction("arrival")
+        .group_by(["visa_subclass"], freq="M")
+        .agg({"net_erp_effect": "sum"})
+        .run()
+    )
+    """
+
+    def __init__(
+        self,
+        data_folder=abs_traveller_characteristics_folder,
+        nom_final=True,
+        net_erp_effect=True,
+    ):
+        self.data_folder = data_folder
+        self.nom_final = nom_final
+        self.net_erp_effect = net_erp_effect
+        self.nom_fields = None
+        self.filters = []
+        self.group_fields = None
+        self.freq = None
+        self.aggregations = None
+
+    def final(self):
+        """Query the final NOM files"""
+        self.nom_final = True
+        return self
+
+    def preliminary(self):
+        """Query the preliminary NOM files"""
+        self.nom_final = False
+        return self
+
+    def select(self, nom_fields):
+        """
+        Select the fields to return, if not called all fields are returned
+
+        Parameters
+        ----------
+        nom_fields: list of fields
+        """
+        self.nom_fields = list(nom_fields)
+        return self
+
+    def where(self, expression):
+        """
+        Add a filter (and-ed with any other filters)
+
+        Parameters
+        ----------
+        expression: pyarrow compute expression,
+            eg pc.field("country_of_birth") == 1101
+        """
+        self.filters.append(expression)
+        return self
+
+    def where_visa_subclass(self, vsc_list):
+        """
+        Select visa subclasses
+
+        Parameters
+        ----------
+        vsc_list: list of visa subclasses as strings
+        """
+        return self.where(pc.field("visa_subclass").isin(list(vsc_list)))
+
+    def where_date(self, start=None, end=None):
+        """
+        Select movements with duration_movement_date in [start, end]
+
+        Parameters
+        ----------
+        start, end: None, str or Timestamp - if None, no limit
+        """
+        if start is not None:
+            self.where(pc.field("duration_movement_date") >= pd.Timestamp(start))
+
+        if end is not None:
+            self.where(pc.field("duration_movement_date") <= pd.Timestamp(end))
+
+        return self
+
+    def where_direction(self, direction):
+        """
+        Select arrivals or departures
+
+        Parameters
+        ----------
+        direction: str, "arrival" (net_erp_effect > 0) or "departure" (net_erp_effect < 0)
+        """
+        if direction == "arrival":
+            return self.where(pc.field("net_erp_effect") > 0)
+
+        if direction == "departure":
+            return self.where(pc.field("net_erp_effect") < 0)
+
+        raise ValueError(
+            f"Chris - direction is 'arrival' or 'departure', not {direction}"
+        )
+
+    def where_citizenship(self, countries):
+        """
+        Select countries of citizenship
+
+        Parameters
+        ----------
+        countries: list of SACC country codes, eg [6101, 7103]
+        """
+        return self.where(pc.field("country_of_citizenship").isin(list(countries)))
+
+    def group_by(self, group_fields, freq=None):
+        """
+        Group the selected records
+
+        Parameters
+        ----------
+        group_fields: list of fields to group by
+        freq: None or pandas frequency string, eg "M"
+            if not None, also group duration_movement_date by this frequency
+        """
+        self.group_fields = list(group_fields)
+        self.freq = freq
+        return self
+
+    def agg(self, aggregations):
+        """
+        Aggregate each group, if not called the number of records in each group is returned
+
+        Parameters
+        ----------
+        aggregations: dict of field to pandas aggregation, eg {"net_erp_effect": "sum"}
+        """
+        self.aggregations = dict(aggregations)
+        return self
+
+    def get_file_paths(self):
+        """Return a list of the parquet files to be scanned"""
+        return list(gen_nom_files(self.data_folder, nom_final=self.nom_final))
+
+    def get_columns(self):
+        """
+        Return the list of fields to be read, or None if all fields are read
+        """
+        if self.group_fields is None:
+            return self.nom_fields
+
+        columns = list(self.group_fields)
+
+        if self.freq is not None:
+            columns.append("duration_movement_date")
+
+        if self.aggregations is not None:
+            columns.extend(self.aggregations)
+
+        # drop duplicates, keeping order
+        return list(dict.fromkeys(columns))
+
+    def compile(self):
+        """
+        Return the pyarrow scanner for the query, over the schema unified from the
+        parquet footers (files may differ in integer widths or missing fields)
+        """
+        file_paths = self.get_file_paths()
+
+        if not file_paths:
+            raise ValueError(f"Chris - no NOM parquet files in {self.data_folder}")
+
+        schema = pa.unify_schemas(
+            [pq.read_schema(file_path) for file_path in file_paths],
+            promote_options="permissive",
+        )
+
+        query_filter = None
+        for expression in self.filters:
+            if query_filter is None:
+                query_filter = expression
+            else:
+                query_filter = query_filter & expression
+
+        return ds.dataset(file_paths, schema=schema, format="parquet").scanner(
+            columns=self.get_columns(),
+            filter=make_nom_filter(
+                net_erp_effect=self.net_erp_effect, filters=query_filter
+            ),
+        )
+
+    def run(self, schema=None):
+        """
+        Run the query
+
+        Parameters
+        ----------
+        schema: None or dict, see read_nom_schema and apply_nom_schema
+
+        Returns
+        -------
+        dataframe: with duration_movement_date renamed to date.
+            if grouped, a tidy dataframe with a column for the group fields and
+            each aggregation (or count)
+        """
+        df = (
+            apply_nom_schema(self.compile().to_table().to_pandas(), schema)
+            .rename({"duration_movement_date": "date"}, axis="columns")
+        )
+
+        if self.group_fields is None:
+            return df
+
+        grouping = [
+            "date" if field == "duration_movement_date" else field
+            for field in self.group_fields
+        ]
+
+        if self.freq is not None:
+            grouping = [pd.Grouper(key="date", freq=self.freq)] + [
+                field for field in grouping if field != "date"
+            ]
+
+        grouped = df.groupby(grouping, observed=True)
+
+        if self.aggregations is None:
+            return grouped.size().rename("count").reset_index()
+
+        return grouped.agg(self.aggregations).reset_index()
+
+
+def get_NOM_query(
+    data_folder=abs_traveller_characteristics_folder,
+    vsc_list=None,
+    countries=None,
+    nom_final=True,
+):
+    """
+    Return NOM movements, with their ABS visa group, for selected subclasses and
+    countries of citizenship
+
+    Parameters
+    ----------
+    data_folder: Path object to folder of NOM unit record parquet files
+    vsc_list: None or list of visa subclasses, if None all subclasses
+    countries: None or list of SACC country of citizenship codes, if None all countries
+    nom_final: boolean, True for final NOM files, False for preliminary NOM files
+
+    Returns
+    -------
+    dataframe
     """
     nom_fields = [
-        'person_id',
-        'duration_movement_date',
-        'visa_subclass',
-        'net_erp_effect',
+        "person_id",
+        "duration_movement_date",
+        "visa_subclass",
+        "net_erp_effect",
         "country_of_citizenship",
         "country_of_stay",
     ]
 
-    # query_visa = "(visa_subclass=='573') | (visa_subclass=='572')"
-    # query_citizenship = "(country_of_citizenship==6101) | (country_of_citizenship==7103) | (country_of_citizenship==7105)"
-    # query_citizenship = "(country_of_citizenship==6203)"
-    # query = f"({query_visa}) and ({query_citizenship}) and net_erp_effect > 0" #or country_of_birth==6101
+    query = NomQuery(data_folder, nom_final).select(nom_fields)
 
+    if vsc_list is not None:
+        query.where_visa_subclass(vsc_list)
 
-    # Define the groupby
-    def gen_get_query(df_fields):
-        for df in df_fields:
-            yield df #.query(query_citizenship)  #query
+    if countries is not None:
+        query.where_citizenship(countries)
 
-    # establish the generators
-    file_paths = nom.gen_nom_files(data_folder, abs_visagroup_exists=False)
-    df_fields = nom.gen_nom_fields(file_paths, nom_fields)
-    df_query = gen_get_query(df_fields)
+    abs_mapper = get_abs_3412_mapper()
 
+    return query.run().assign(
+        abs_visa_group=lambda x: x.visa_subclass.astype(str).map(abs_mapper),
+        country_of_citizenship=lambda x: decode_sacc(x.country_of_citizenship),
+        country_of_stay=lambda x: decode_sacc(x.country_of_stay),
+    )
 
-    df = (pd.concat(df_query, axis=0, ignore_index=True, sort=False)
-            .rename({'duration_movement_date': 'date'}, axis='columns')
-            .assign(abs_visa_group = lambda x: x.visa_subclass.map(abs_mapper))
-            .assign(country_of_citizenship = lambda x: x.country_of_citizenship.map(sacc_nom))
-            .assign(country_of_stay = lambda x: x.country_of_stay.map(sacc_nom))
-        )
 
+def get_nom_parquet_files(data_folder, abs_visagroup_exists=False):
+    """
+    Return the final and preliminary NOM parquet files of a flat or partitioned
+    (status=final|preliminary/year=YYYY/quarter=Q/) folder, in file name order
 
+    Parameters
+    ----------
+    data_folder: path object (pathlib.Path) to folder of parquet files
+    abs_visagroup_exists: boolean, True if only post 2011Q2 files (not ROADS files)
 
-    return df
+    Returns
+    -------
+    list of Path objects
+    """
+
+    file_paths = list(data_folder.glob("*.parquet")) + list(
+        data_folder.glob("status=*/year=*/quarter=*/*.parquet")
+    )
+
+    return [
+        file_path
+        for file_path in sorted(file_paths, key=lambda x: x.name)
+        # Only loop over post 2011Q3 files
+        if not (abs_visagroup_exists and "ROADS" in file_path.stem)
+    ]
 
 
 def get_nom_file_fields(data_folder, nom_fields, abs_visagroup_exists=False):
@@ -1523,7 +2312,7 @@ def get_nom_file_fields(data_folder, nom_fields, abs_visagroup_exists=False):
         Parameters:
         -----------
         data_folder: string, path object (pathlib.Path)
-        assumes folder contains parquet files
+        assumes folder contains parquet files (flat or partitioned)
 
         nom_fields: list of fields to select
 
@@ -1536,12 +2325,7 @@ def get_nom_file_fields(data_folder, nom_fields, abs_visagroup_exists=False):
         dataframe: of NOM grouped by ABS visa group, year and visa subclass
     """
 
-    for file_path in sorted(data_folder.glob("*.parquet")):
-
-        # Only loop over post 2011Q3 files
-        if abs_visagroup_exists:
-            if "ROADS" in file_path.stem:
-                continue
+    for file_path in get_nom_parquet_files(data_folder, abs_visagroup_exists):
         print(file_path.stem)
 
         df = pd.read_parquet(file_path, columns=nom_fields)
@@ -1563,6 +2347,8 @@ def get_visa_groups(
     individual_movements_folder,
     net_erp_effect=True,
     abs_visagroup_exists=False,
+    prefetch=0,
+    backend="pandas",
 ):
     """
     Return a dataframe containing each unique NOM movement for a given visa group
@@ -1593,21 +2379,43 @@ def get_visa_groups(
             True if only loop over post 2011Q2 files
             These files contains the visa_group olumn
 
+    prefetch: int, default=0
+            number of files read ahead on a thread pool, see gen_nom_fields
+
+    backend: str, default "pandas"
+            "pandas" reads the files one at a time (see gen_nom_fields),
+            "polars" reads all the files in one multi-threaded query (see scan_nom_polars)
+
+    To extract several visa groups, write_visa_groups reads each NOM file once
+    rather than once per visa group
+
     Returns
     -------
     a dataframe
     """
 
-    # establish the generators
     file_paths = gen_nom_files(abs_nom_data_folder, abs_visagroup_exists=False)
-    df_with_fields = gen_nom_fields(file_paths, nom_fields)
 
-    df_visa_group = gen_get_visa_group(df_with_fields, vsc_list)
+    if get_nom_backend(backend) == "polars":
+        df = collect_nom_polars(
+            scan_nom_polars(file_paths, nom_fields, net_erp_effect, vsc_list)
+        ).rename({"duration_movement_date": "date"}, axis="columns")
 
-    # concatenate over the generators
-    df = pd.concat(df_visa_group, axis=0, ignore_index=True, sort=False).rename(
-        {"duration_movement_date": "date"}, axis="columns"
-    )
+    else:
+        # establish the generators
+        # the visa subclasses are selected in the parquet scan
+        df_visa_group = gen_nom_fields(
+            file_paths,
+            nom_fields,
+            net_erp_effect,
+            filters=make_nom_filter(vsc_list),
+            prefetch=prefetch,
+        )
+
+        # concatenate over the generators
+        df = pd.concat(df_visa_group, axis=0, ignore_index=True, sort=False).rename(
+            {"duration_movement_date": "date"}, axis="columns"
+        )
 
     df.to_parquet(
         individual_movements_folder / f"{ABS_nom_group} unique movement.parquet"
@@ -1616,8 +2424,120 @@ def get_visa_groups(
     return df
 
 
+def write_visa_groups(
+    visa_groups,
+    nom_fields,
+    abs_nom_data_folder,
+    individual_movements_folder,
+    net_erp_effect=True,
+    prefetch=0,
+):
+    """
+    Write the unique NOM movements of every visa group, as get_visa_groups does for
+    each visa group, reading each NOM file once
+
+    Parameters
+    ----------
+    visa_groups: dict
+      ABS visa group name to list of visa subclasses, eg {"Student": ["500", "572"]}
+
+    nom_fields: list of fields to select, must include visa_subclass
+
+    abs_nom_data_folder: path object
+      directory location of ABS unit record NOM files, assumes contains parquet files
+
+    individual_movements_folder: path object
+      directory location for storing dataframes for each visa group
+
+    net_erp_effect: boolean, default=True
+          if True, only return if net_erp = 1 or -1
+          if False, return all net_erp values
+
+    prefetch: int, default=0
+            number of files read ahead on a thread pool, see gen_nom_fields
+
+    Returns
+    -------
+    dict: ABS visa group to the path of its unique movement file
+    """
+
+    if "visa_subclass" not in nom_fields:
+        raise ValueError("Chris - write_visa_groups needs visa_subclass in nom_fields")
+
+    all_vsc = sorted({vsc for vsc_list in visa_groups.values() for vsc in vsc_list})
+
+    file_paths = gen_nom_files(abs_nom_data_folder, abs_visagroup_exists=False)
+    df_fields = gen_nom_fields(
+        file_paths,
+        nom_fields,
+        net_erp_effect,
+        filters=make_nom_filter(all_vsc),
+        prefetch=prefetch,
+    )
+
+    outfiles = {
+        ABS_nom_group: individual_movements_folder
+        / f"{ABS_nom_group} unique movement.parquet"
+        for ABS_nom_group in visa_groups
+    }
+    parquet_writers = {}
+
+    try:
+        for df in df_fields:
+            df = df.rename({"duration_movement_date": "date"}, axis="columns")
+
+            for ABS_nom_group, vsc_list in visa_groups.items():
+                df_group = df[df.visa_subclass.isin(vsc_list)]
+
+                if df_group.empty:
+                    continue
+
+                parquet_writer = parquet_writers.get(ABS_nom_group)
+
+                # the first rows set the schema (with int32 dictionary indices), later
+                # rows are cast to it
+                table = pa.Table.from_pandas(
+                    df_group,
+                    schema=None if parquet_writer is None else parquet_writer.schema,
+                    preserve_index=False,
+                )
+
+                if parquet_writer is None:
+                    table = table.cast(get_nom_writer_schema(table.schema))
+                    parquet_writer = pq.ParquetWriter(
+                        get_staging_path(outfiles[ABS_nom_group]), table.schema
+                    )
+                    parquet_writers[ABS_nom_group] = parquet_writer
+
+                parquet_writer.write_table(table)
+
+    except BaseException:
+        for ABS_nom_group, parquet_writer in parquet_writers.items():
+            parquet_writer.close()
+            get_staging_path(outfiles[ABS_nom_group]).unlink()
+        raise
+
+    for ABS_nom_group, parquet_writer in parquet_writers.items():
+        parquet_writer.close()
+        publish_outfile(
+            get_staging_path(outfiles[ABS_nom_group]), [outfiles[ABS_nom_group]]
+        )
+
+    for ABS_nom_group in visa_groups:
+        if ABS_nom_group not in parquet_writers:
+            print(f"{ABS_nom_group}: no NOM movements, file not written")
+
+    return {
+        ABS_nom_group: outfiles[ABS_nom_group] for ABS_nom_group in parquet_writers
+    }
+
+
 def get_NOM_monthly(
-    ABS_nom_group, individual_movements_folder, monthly_data_folder, df=None
+    ABS_nom_group,
+    individual_movements_folder,
+    monthly_data_folder,
+    df=None,
+    backend="pandas",
 ):
     """
     Convert individual daily data to monthly arrivals & departures by vsc and create data for the ABS visa grouping
@@ -1636,27 +2556,180 @@ def get_NOM_monthly(
     df: dataframe or None
       if None, read in dataframe
 
+    backend: str, default "pandas"
+      if "polars", the daily sums are a multi-threaded polars query (see
+      get_daily_polars) - the unique movement file is scanned, not read into pandas
+
+    See get_NOM_monthly_streamed to aggregate the unit record files directly,
+    without the unique movement dataframe
+
     returns
     -------
     monthly: dataframe
     """
 
-    if df is None:
-        df = pd.read_parquet(
-            individual_movements_folder / f"{ABS_nom_group} unique movement.parquet"
+    file_path = individual_movements_folder / f"{ABS_nom_group} unique movement.parquet"
+
+    if get_nom_backend(backend) == "polars":
+        import polars as pl
+
+        if df is None:
+            lazy_frame = pl.scan_parquet(file_path)
+        else:
+            lazy_frame = pl.from_pandas(
+                df[["date", "visa_subclass", "net_erp_effect"]]
+            ).lazy()
+
+        daily = get_daily_polars(lazy_frame)
+
+    else:
+        if df is None:
+            df = pd.read_parquet(file_path)
+
+        daily = (
+            df.assign(direction=df.net_erp_effect.map({-1: "departure", 1: "arrival"}))
+            .groupby(["date", "visa_subclass", "direction"])
+            .net_erp_effect.sum()
         )
 
     monthly = (
-        df.assign(direction=df.net_erp_effect.map({-1: "departure", 1: "arrival"}))
-        .groupby(["date", "visa_subclass", "direction"])
-        .net_erp_effect.sum()
-        .unstack(["visa_subclass", "direction"])
+        daily.unstack(["visa_subclass", "direction"])
         .sort_index(axis="columns")
         .resample("M")
         .sum()
         .astype(int)
     )
 
+    return write_NOM_monthly(monthly, ABS_nom_group, monthly_data_folder)
+
+
+def get_NOM_monthly_streamed(
+    ABS_nom_group,
+    vsc_list,
+    abs_nom_data_folder,
+    monthly_data_folder,
+    nom_final=True,
+    prefetch=0,
+    backend="pandas",
+):
+    """
+    Return monthly arrivals & departures by vsc for the ABS visa grouping, summing
+    each file's records as it is read rather than concatenating the unit records.
+    Equals get_visa_groups then get_NOM_monthly, with visa_subclass as strings
+
+    Parameters
+    ----------
+    ABS_nom_group: str
+      The ABS visa group being extracted from the unit record data
+
+    vsc_list: a list
+      contains visa sub class numbers to be selected
+
+    abs_nom_data_folder: path object
+      directory location of ABS unit record NOM files, assumes contains parquet files
+
+    monthly_data_folder: path object
+      directory location of monthly data used for forecasting
+
+    nom_final: boolean, True for final NOM files, False for preliminary NOM files
+
+    prefetch: int, default=0
+      number of files read ahead on a thread pool, see gen_nom_fields
+
+    backend: str, default "pandas"
+      if "polars", all the files are aggregated in one multi-threaded, streaming
+      polars query (see get_monthly_polars)
+
+    returns
+    -------
+    monthly: dataframe
+    """
+
+    nom_fields = ["duration_movement_date", "visa_subclass", "net_erp_effect"]
+
+    file_paths = gen_nom_files(abs_nom_data_folder, nom_final=nom_final)
+
+    if get_nom_backend(backend) == "polars":
+        monthly = get_monthly_polars(scan_nom_polars(file_paths, nom_fields, True, vsc_list))
+
+    else:
+        df_fields = gen_nom_fields(
+            file_paths, nom_fields, filters=make_nom_filter(vsc_list), prefetch=prefetch
+        )
+
+        monthly = None
+        for partial in gen_monthly_partials(df_fields):
+            if monthly is None:
+                monthly = partial
+            else:
+                monthly = pd.concat([monthly, partial]).groupby(level=[0, 1, 2]).sum()
+
+    if monthly is None:
+        raise ValueError(f"Chris - no NOM records for {ABS_nom_group}")
+
+    monthly = monthly.unstack(["visa_subclass", "direction"], fill_value=0)
+
+    # month periods to month end dates, as from resample("M")
+    monthly.index = monthly.index.to_timestamp(how="end").normalize()
+    monthly.index.name = "date"
+
+    monthly = monthly.sort_index(axis="columns").resample("M").sum().astype(int)
+
+    return write_NOM_monthly(monthly, ABS_nom_group, monthly_data_folder)
+
+
+def gen_monthly_partials(df_fields):
+    """
+    A generator to sum each DataFrame of NOM records by month, visa subclass and direction
+
+    Parameters
+    ----------
+    df_fields: dataframe generator
+      NOM records with duration_movement_date, visa_subclass and net_erp_effect
+
+    Yields
+    -------
+    series: net_erp_effect summed by (month period, visa_subclass, direction)
+    """
+
+    for df in df_fields:
+        partial = (
+            df.assign(
+                month=df.duration_movement_date.dt.to_period("M"),
+                direction=df.net_erp_effect.map({-1: "departure", 1: "arrival"}),
+            )
+            .groupby(["month", "visa_subclass", "direction"], observed=True)
+            .net_erp_effect.sum()
+        )
+
+        # subclasses as strings, so partials merge whatever their categories
+        partial.index = partial.index.set_levels(
+            partial.index.levels[1].astype(str), level="visa_subclass"
+        )
+
+        yield partial
+
+
+def write_NOM_monthly(monthly, ABS_nom_group, monthly_data_folder):
+    """
+    Add the visa group totals to monthly arrivals & departures by vsc and write as tidy data
+
+    Parameters
+    ----------
+    monthly: dataframe
+      monthly arrivals & departures, with columns (visa_subclass, direction)
+
+    ABS_nom_group: str
+      The ABS visa group being extracted from the unit record data
+
+    monthly_data_folder: path object
+      directory location of monthly data used for forecasting
+
+    returns
+    -------
+    monthly: dataframe
+    """
+
     # Make visa_group summation, sum across arrive/departure - which is 2nd level of multiindex
     visa_group = monthly.sum(level=1, axis=1)
 
@@ -1748,25 +2821,31 @@ def tidy__by_visa_subclass(df):
         df {dataframe} -- with columns vsc and rows date
     Returns:
         a tidy dataframe of nom by month, abs_group, visa_label, visa_subclass, nom
+        abs_group, visa_label and visa_subclass are categoricals
     """
 
     # TODO should df be passed in a call to
     #   get_NOM_final_preliminary with a direction parameter?
 
-    reference_visa_dict = get_vsc_reference()
-    abs_3412_mapper = get_abs_3412_mapper()
+    visa_registry = get_visa_registry()
+    visa_subclass_codes = get_visa_subclass_codes(registry=visa_registry)
 
     col_order = ["date", "abs_grouping", "visa_label", "visa_subclass", "nom"]
-    tidy_df = (
-        df.unstack()
-        .rename("nom")
-        .reset_index()
-        .assign(
-            visa_label=lambda x: x.visa_subclass.map(
-                reference_visa_dict.visa_subclass_ds
-            )
-        )
-        .assign(abs_grouping=lambda x: x.visa_subclass.map(abs_3412_mapper))
+    nom = df.unstack().rename("nom")
+
+    # categoricals from the unstacked index - subclass strings aren't repeated or hashed
+    visa_subclass = pd.Categorical.from_codes(
+        nom.index.codes[0], nom.index.levels[0].astype(str)
+    )
+
+    tidy_df = nom.reset_index().assign(
+        visa_subclass=visa_subclass,
+        visa_label=map_visa_subclass(
+            visa_subclass, "label", visa_subclass_codes, visa_registry
+        ),
+        abs_grouping=map_visa_subclass(
+            visa_subclass, "abs_group", visa_subclass_codes, visa_registry
+        ),
     )
 
     ### remove zero entries so contiguous data can be identified later,
@@ -0,0 +1,1923 @@
+"""
+Utilities to convert the ABS NOM SAS files to parquet
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import file_paths
+import mappers
+
+
+dict_data_folder = file_paths.dict_data_folder
+
+
+# variables to convert to ints or strings
+nom_ints_preliminary = [
+    "person_id",
+    "sex",
+    "country_of_birth",
+    "country_of_citizenship",
+    "country_of_stay",
+    "initial_erp_flag",
+    "final_erp_flag",
+    "duration_movement_sort_key",
+    "nom_direction",
+    "duration_in_australia_category",
+    "count_of_movements",
+    "initial_category_of_travel",
+    "age",
+    "status_flag",
+    "reason_for_journey",
+    "odb_time_code",
+]
+
+## For preliminary leave as floats: 'rky_val'
+
+nom_ints_final = [
+    "person_id",
+    "sex",
+    "country_of_birth",
+    "country_of_citizenship",
+    "country_of_stay",
+    "initial_erp_flag",
+    "final_erp_flag",
+    "duration_movement_sort_key",
+    "nom_direction",
+    "duration_in_australia_category",
+    "count_of_movements",
+    "initial_category_of_travel",
+    "age",
+    "status_flag",
+    "reason_for_journey",
+    "odb_time_code",
+    "net_erp_effect",
+    "nom_propensity",
+]
+
+# string vars are the same across preliminary and final
+nom_string_vars = [
+    "visa_group",
+    "visa_subclass",
+    "visa_applicant_type",
+    "visa_stream_code",
+    "stream_code_out",
+    "state",
+    "direction",
+]
+
+nom_date_times = ["Duration_movement_date"]
+
+# State of residence, decoded at ingestion to the state_residence column - a categorical
+# with a fixed dictionary: the codes of mappers.state_residence_original, in its order.
+# Roll-ups (mappers.state_residence_other_territories) are recoded from the same codes
+state_residence_field = "state_residence"
+nom_state_codes = pd.Index(list(mappers.state_residence_original))
+state_residence_dtype = pd.CategoricalDtype(
+    list(mappers.state_residence_original.values())
+)
+state_residence_mappers = {
+    "original": mappers.state_residence_original,
+    "other_territories": mappers.state_residence_other_territories,
+}
+
+# Schema for NOM unit record columns, shared by every traveller characteristics file:
+#   the narrowest integer type for each integer column
+#   (person_id and the sort key are identifiers - not bounded, so left as int64)
+nom_integer_dtypes = {
+    "person_id": "int64",
+    "sex": "int8",
+    "country_of_birth": "int16",  # 4 digit SACC codes
+    "country_of_citizenship": "int16",
+    "country_of_stay": "int16",
+    "initial_erp_flag": "int8",
+    "final_erp_flag": "int8",
+    "duration_movement_sort_key": "int64",
+    "nom_direction": "int8",
+    "duration_in_australia_category": "int8",
+    "count_of_movements": "int16",
+    "initial_category_of_travel": "int8",
+    "age": "int16",
+    "status_flag": "int8",
+    "reason_for_journey": "int8",
+    "odb_time_code": "int16",
+    "net_erp_effect": "int8",
+    "nom_propensity": "int8",
+}
+
+#   and a global dictionary (categories) for each string column, kept in the
+#   schema file. New values are appended, so existing codes never change and every
+#   file read with the schema has identical categorical dtypes
+nom_schema_path = dict_data_folder / "traveller_characteristics_schema.json"
+
+# Chunked reading of SAS files:
+#   rows read first to estimate the in-memory size of a decoded row
+sas_sample_rows = 10_000
+#   peak memory relative to one decoded chunk - the decoded chunk, its dtype converted
+#   copy, the arrow table being written and the next chunk being read can all coexist
+sas_chunk_memory_multiplier = 4
+
+# SAS reader backends: pyreadstat is optional, pandas is the fallback
+sas_readers = ["pandas", "pyreadstat"]
+
+# Parquet layout of NOM files: rows are clustered (sorted) by visa subclass then date,
+# in row groups small enough for their min/max statistics to rule out most row groups
+# when selecting visa subclasses or dates. Page indexes are written for readers that
+# can skip pages within a row group
+nom_cluster_columns = ["visa_subclass", "duration_movement_date"]
+nom_row_group_size = 131_072
+
+# Optional partitioned (hive) layout of the analysis folder:
+#   status=final/year=2019/quarter=3/traveller_characteristics2019q3.parquet
+nom_partition_status = {"f": "final", "p": "preliminary"}
+
+# Index of the row groups holding each person_id, one file per NOM parquet file,
+# kept in this folder of the analysis folder
+person_index_folder_name = "person_index"
+
+# Record of SAS files already converted, kept in the SAS data directory
+ingestion_manifest_name = "traveller_characteristics_manifest.json"
+ingestion_manifest_version = 2
+
+
+def process_original_ABS_data(
+    abs_original_data_folder,
+    analysis_folder,
+    memory_budget_mb=None,
+    sas_reader="pandas",
+    max_workers=1,
+    incremental=False,
+    schema_path=None,
+    partitioned=False,
+    cluster=False,
+    person_index=False,
+):
+    """Process the SAS data, include removing previous preliminary parquet 
+       and replace with final parquet, and add new preliminary parquet for latest quarter
+
+    Parameters
+    ----------
+    abs_original_data_folder : Path ojbect
+        SAS data directory, containing sas7bdat files and/or zip files of sas7bdat files
+    analysis_folder : Path object
+        ABS Traveller characteristics folder pat
+    memory_budget_mb : None or int, default None
+        if None, read each SAS file whole
+        else, read each SAS file in chunks sized to keep peak memory within
+        (approximately) this many megabytes
+    sas_reader : str, default "pandas"
+        "pandas" or "pyreadstat" (multi-process, falls back to pandas if not installed)
+    max_workers : None or int, default 1
+        number of SAS files converted concurrently on a process pool, if None all cpus.
+        Each worker reads with one pyreadstat process
+    incremental : boolean, default False
+        if True, only convert SAS files that are new or changed since they were last
+        converted, as recorded in the manifest in abs_original_data_folder
+    schema_path : None or Path object, default None
+        if not None, the NOM schema file (eg nom_schema_path) to extend with each file
+    partitioned : boolean, default False
+        if True, write the analysis folder as status=/year=/quarter= folders
+    cluster : boolean, default False
+        if True, sort rows by nom_cluster_columns before writing. With memory_budget_mb
+        set, only the rows within each chunk are sorted
+    person_index : boolean, default False
+        if True, index each file by person_id as it is written (see write_person_index)
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError
+        Check ABS NOM files must commence with p or f
+        This differentiates between preliminary and final NOM
+        Raise error to advice user that RTS file name convention not in place
+    ValueError
+        Zip files must contain a single sas7bdat file
+    """
+    sas_reader = get_sas_reader(sas_reader)
+
+    ### For unzipped sas data files and sas data files read straight from their zip file
+    ### Requires both options - older folders may not have the zipped version
+    abs_sas_files = list(gen_abs_sas_files(abs_original_data_folder))
+
+    manifest = read_ingestion_manifest(abs_original_data_folder)
+
+    if incremental:
+        abs_sas_files_changed = [
+            (abs_filepath, zip_filepath)
+            for abs_filepath, zip_filepath in abs_sas_files
+            if not is_sas_file_unchanged(
+                abs_filepath, zip_filepath, manifest, analysis_folder, partitioned
+            )
+        ]
+
+        skipped = [
+            abs_filepath.stem
+            for abs_filepath, zip_filepath in abs_sas_files
+            if (abs_filepath, zip_filepath) not in abs_sas_files_changed
+        ]
+        print(f"Skipping {len(skipped)} unchanged SAS files: {', '.join(skipped)}")
+
+    else:
+        abs_sas_files_changed = abs_sas_files
+
+    # pyreadstat processes in each worker process would oversubscribe the cpus
+    n_processes = None if max_workers == 1 else 1
+
+    # preliminary files are removed after all files are converted (see below)
+    convert_kwargs = dict(
+        abs_original_data_folder=abs_original_data_folder,
+        analysis_folder=analysis_folder,
+        memory_budget_mb=memory_budget_mb,
+        sas_reader=sas_reader,
+        n_processes=n_processes,
+        remove_preliminary=False,
+        partitioned=partitioned,
+        cluster=cluster,
+    )
+
+    if max_workers == 1:
+        for abs_filepath, zip_filepath in abs_sas_files_changed:
+            print(abs_filepath.stem)
+
+            convert_abs_sas_file(abs_filepath, zip_filepath, **convert_kwargs)
+
+            if schema_path is not None:
+                update_nom_schema(
+                    [abs_original_data_folder / get_outfile_name(abs_filepath)],
+                    schema_path,
+                )
+
+            if person_index:
+                write_person_index(
+                    get_analysis_path(
+                        get_outfile_name(abs_filepath), analysis_folder, partitioned
+                    ),
+                    analysis_folder,
+                )
+
+            update_ingestion_manifest(
+                manifest, abs_filepath, zip_filepath, abs_original_data_folder
+            )
+
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    convert_abs_sas_file, abs_filepath, zip_filepath, **convert_kwargs
+                ): (abs_filepath, zip_filepath)
+                for abs_filepath, zip_filepath in abs_sas_files_changed
+            }
+
+            for future in as_completed(futures):
+                # raise any error from converting the file
+                future.result()
+
+                abs_filepath, zip_filepath = futures[future]
+                print(abs_filepath.stem)
+
+                # the schema is only updated here - one process at a time
+                if schema_path is not None:
+                    update_nom_schema(
+                        [abs_original_data_folder / get_outfile_name(abs_filepath)],
+                        schema_path,
+                    )
+
+                if person_index:
+                    write_person_index(
+                        get_analysis_path(
+                            get_outfile_name(abs_filepath), analysis_folder, partitioned
+                        ),
+                        analysis_folder,
+                    )
+
+                update_ingestion_manifest(
+                    manifest, abs_filepath, zip_filepath, abs_original_data_folder
+                )
+
+    # Commit the final files: delete the preliminary files they replace.
+    # Done once all files are written so a final file always wins over its
+    # preliminary file - whatever order the files were converted in
+    for abs_filepath, _ in abs_sas_files:
+        remove_preliminary_outfile(abs_filepath, analysis_folder, person_index)
+
+    write_ingestion_manifest(manifest, abs_original_data_folder)
+
+    return None
+
+
+def read_ingestion_manifest(abs_original_data_folder):
+    """
+    Read the manifest of converted SAS files, an empty manifest if there isn't one
+
+    Parameters
+    ----------
+    abs_original_data_folder: Path object of SAS data directory
+
+    Returns
+    -------
+    manifest: dict with keys: version, files
+        files is a dict keyed by SAS (or zip) file name of dicts with keys:
+        size, mtime_ns, sha256, parquet
+    """
+
+    manifest_path = abs_original_data_folder / ingestion_manifest_name
+
+    if manifest_path.exists():
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+
+        # rebuild rather than trust a manifest from a different layout
+        if manifest.get("version") == ingestion_manifest_version:
+            return manifest
+
+    return {"version": ingestion_manifest_version, "files": {}}
+
+
+def write_ingestion_manifest(manifest, abs_original_data_folder):
+    """
+    Write the manifest of converted SAS files, replacing the old manifest atomically
+
+    Parameters
+    ----------
+    manifest: dict, see read_ingestion_manifest
+    abs_original_data_folder: Path object of SAS data directory
+
+    Returns
+    -------
+    None
+    """
+
+    manifest_path = abs_original_data_folder / ingestion_manifest_name
+    temp_path = manifest_path.with_suffix(".json.tmp")
+
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+    os.replace(temp_path, manifest_path)
+
+    return None
+
+
+def get_file_hash(file_path, block_size=2 ** 20):
+    """
+    Return the sha256 hash of a file's content
+
+    Parameters
+    ----------
+    file_path: Path object
+    block_size: int, bytes read at a time
+
+    Returns
+    -------
+    str, hex digest
+    """
+
+    file_hash = hashlib.sha256()
+
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def get_sas_source_record(source_path, previous_record=None):
+    """
+    Return the size, mtime and content hash of a SAS or zip file, reusing the hash of
+    previous_record if size and mtime are unchanged
+
+    Parameters
+    ----------
+    source_path: Path object of the SAS file, or of the zip file holding it
+    previous_record: None or dict from the manifest
+
+    Returns
+    -------
+    dict with keys: size, mtime_ns, sha256
+    """
+
+    record = get_cache_source(source_path)
+
+    if (
+        previous_record is not None
+        and previous_record["size"] == record["size"]
+        and previous_record["mtime_ns"] == record["mtime_ns"]
+    ):
+        record["sha256"] = previous_record["sha256"]
+    else:
+        record["sha256"] = get_file_hash(source_path)
+
+    return record
+
+
+def is_sas_file_unchanged(
+    abs_filepath, zip_filepath, manifest, analysis_folder, partitioned=False
+):
+    """
+    Check whether a SAS file is unchanged (size and content hash) since it was last
+    converted to parquet, and its parquet files are still in place
+
+    Parameters
+    ----------
+    abs_filepath: Path object of the (unzipped) SAS file
+    zip_filepath: None or Path object of the zip file holding the SAS file
+    manifest: dict, see read_ingestion_manifest
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+    partitioned: boolean, whether the analysis folder is partitioned
+
+    Returns
+    -------
+    boolean
+    """
+
+    source_path = abs_filepath if zip_filepath is None else zip_filepath
+    previous_record = manifest["files"].get(source_path.name)
+
+    if previous_record is None:
+        return False
+
+    parquet_filename = get_outfile_name(abs_filepath)
+
+    if parquet_filename != previous_record["parquet"]:
+        return False
+
+    if not (abs_filepath.parent / parquet_filename).exists():
+        return False
+
+    if not get_analysis_path(parquet_filename, analysis_folder, partitioned).exists():
+        final_filename = parquet_filename.replace("_p.parquet", ".parquet")
+        if not get_analysis_path(final_filename, analysis_folder, partitioned).exists():
+            return False
+
+    record = get_sas_source_record(source_path, previous_record)
+
+    unchanged = (
+        record["size"] == previous_record["size"]
+        and record["sha256"] == previous_record["sha256"]
+    )
+
+    # a touched but unchanged file: save rehashing it next time
+    if unchanged:
+        previous_record["mtime_ns"] = record["mtime_ns"]
+
+    return unchanged
+
+
+def update_ingestion_manifest(
+    manifest, abs_filepath, zip_filepath, abs_original_data_folder
+):
+    """
+    Record a converted SAS file in the manifest and write the manifest
+
+    Parameters
+    ----------
+    manifest: dict, see read_ingestion_manifest
+    abs_filepath: Path object of the (unzipped) SAS file
+    zip_filepath: None or Path object of the zip file holding the SAS file
+    abs_original_data_folder: Path object of SAS data directory
+
+    Returns
+    -------
+    None
+    """
+
+    source_path = abs_filepath if zip_filepath is None else zip_filepath
+
+    record = get_sas_source_record(source_path)
+    record["parquet"] = get_outfile_name(abs_filepath)
+
+    manifest["files"][source_path.name] = record
+
+    write_ingestion_manifest(manifest, abs_original_data_folder)
+
+    return None
+
+
+def gen_abs_sas_files(abs_original_data_folder):
+    """
+    A generator of the ABS SAS files, unzipped or zipped (one SAS file per zip file).
+    If a SAS file exists both unzipped and zipped, the unzipped file is used
+
+    Parameters
+    ----------
+    abs_original_data_folder: Path object of SAS data directory
+
+    Yields
+    ------
+    abs_filepath: Path object named for the SAS file (whether or not it's unzipped)
+    zip_filepath: Path object of the zip file holding the SAS file, None if unzipped
+    """
+
+    sas_files = {
+        abs_filepath.name: (abs_filepath, None)
+        for abs_filepath in abs_original_data_folder.glob("*.sas7bdat")
+    }
+
+    for zip_filepath in abs_original_data_folder.glob("*.zip"):
+        with zipfile.ZipFile(zip_filepath, "r") as zipped_file:
+            zipped_names = zipped_file.namelist()
+
+        # There's only expected to be one file in each zip
+        if len(zipped_names) != 1:
+            raise ValueError(
+                f"Chris: zipped file {zip_filepath.name} has more than one file"
+                "...recode!"
+            )
+
+        abs_filepath = abs_original_data_folder / Path(zipped_names[0]).name
+
+        if abs_filepath.suffix != ".sas7bdat":
+            raise ValueError(
+                f"Chris: zipped file {zip_filepath.name} does not contain a "
+                "sas7bdat file"
+            )
+
+        sas_files.setdefault(abs_filepath.name, (abs_filepath, zip_filepath))
+
+    for sas_filename in sorted(sas_files):
+        yield sas_files[sas_filename]
+
+
+@contextmanager
+def open_abs_sas_file(abs_filepath, zip_filepath=None):
+    """
+    Open an ABS SAS file - streaming it from its zip file without extracting it to disk
+
+    Parameters
+    ----------
+    abs_filepath: Path object of the (unzipped) SAS file
+    zip_filepath: None or Path object of the zip file holding the SAS file
+
+    Yields
+    ------
+    Path object of the unzipped SAS file, or a file-like object of the zipped SAS file
+    """
+
+    if zip_filepath is None:
+        yield abs_filepath
+
+    else:
+        with zipfile.ZipFile(zip_filepath, "r") as zipped_file:
+            with zipped_file.open(zipped_file.namelist()[0]) as sas_file:
+                yield sas_file
+
+
+def convert_abs_sas_file(
+    abs_filepath,
+    zip_filepath,
+    abs_original_data_folder,
+    analysis_folder,
+    memory_budget_mb=None,
+    sas_reader="pandas",
+    n_processes=None,
+    remove_preliminary=True,
+    partitioned=False,
+    cluster=False,
+):
+    """
+    Read an ABS SAS file, adjust datatypes and write it out as parquet
+
+    Parameters
+    ----------
+    abs_filepath: Path object of the (unzipped) SAS file
+    zip_filepath: None or Path object of the zip file holding the SAS file
+    abs_original_data_folder: Path object of path to ABS data folder
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+    memory_budget_mb: None or int, see process_original_ABS_data
+    sas_reader: str, "pandas" or "pyreadstat"
+    n_processes: None or int, number of pyreadstat processes
+    remove_preliminary: boolean, default True
+        if True and a final file, delete the preliminary parquet file it replaces
+    partitioned: boolean, default False
+        if True, write to the partitioned layout of the analysis folder
+    cluster: boolean, default False
+        if True, sort rows by nom_cluster_columns - the whole file, or with
+        memory_budget_mb set, each chunk on its own (see process_original_ABS_data)
+
+    Returns
+    -------
+    None
+    """
+
+    nom_status = get_nom_status(abs_filepath)
+
+    # pyreadstat reads from a file path, so zipped files are streamed by pandas
+    if zip_filepath is not None:
+        sas_reader = "pandas"
+
+    with open_abs_sas_file(abs_filepath, zip_filepath) as sas_file:
+        if memory_budget_mb is None:
+            df = read_sas_file(sas_file, sas_reader, n_processes)
+
+            df = convert_nom_dtypes(df, nom_status)
+
+            if cluster:
+                df = cluster_nom_rows(df)
+
+            write_outfile(
+                df,
+                abs_filepath,
+                abs_original_data_folder,
+                analysis_folder,
+                remove_preliminary,
+                partitioned,
+            )
+
+        else:
+            df_chunks = gen_sas_chunks(
+                sas_file, memory_budget_mb, sas_reader, n_processes
+            )
+
+            if cluster:
+                df_chunks = (cluster_nom_rows(df) for df in df_chunks)
+
+            write_outfile_chunked(
+                df_chunks,
+                abs_filepath,
+                abs_original_data_folder,
+                analysis_folder,
+                remove_preliminary,
+                partitioned,
+            )
+
+    return None
+
+
+def get_nom_status(abs_filepath):
+    """
+    Return whether an ABS NOM file is preliminary ("p") or final ("f") NOM
+
+    Parameters
+    ----------
+    abs_filepath: Path object of original ABS file
+
+    Returns
+    -------
+    "p" or "f"
+    """
+
+    nom_status = abs_filepath.stem[0]
+
+    if nom_status not in ["p", "f"]:
+        raise ValueError(
+            f"Chris - ABS NOM files must commence with p or f: {abs_filepath.stem} "
+            "does not!"
+        )
+
+    return nom_status
+
+
+def convert_nom_dtypes(df, nom_status):
+    """
+    Adjust the datatypes of SAS NOM data (or a chunk of it)
+
+    Parameters
+    ----------
+    df: dataframe of SAS NOM data with lower case column names
+    nom_status: "p" for preliminary NOM, "f" for final NOM
+
+    Returns
+    -------
+    df: dataframe with strings as categories, integers as ints and the decoded
+    state_residence column
+    """
+
+    # string vars are the same across preliminary and final
+    for col in nom_string_vars:
+        df[col] = df[col].astype("category")
+
+    df[state_residence_field] = decode_state(df["state"])
+
+    # integer variables differ across final and preliminary data
+    if nom_status == "p":  # preliminary NOM
+        ints = nom_ints_preliminary
+    else:  # final NOM
+        ints = nom_ints_final
+
+    for col in ints:
+        df[col] = cast_nom_integer(df[col])
+
+    return df
+
+
+def get_nom_writer_schema(schema):
+    """
+    Return the schema for a parquet writer of NOM chunks: dictionary (categorical)
+    columns are given int32 indices, wide enough for the categories of later chunks
+
+    Parameters
+    ----------
+    schema: pyarrow schema of the first chunk
+
+    Returns
+    -------
+    pyarrow schema
+    """
+
+    return pa.schema(
+        [
+            field.with_type(pa.dictionary(pa.int32(), pa.string()))
+            if pa.types.is_dictionary(field.type)
+            else field
+            for field in schema
+        ],
+        metadata=schema.metadata,
+    )
+
+
+def decode_state(state):
+    """
+    Decode NOM state codes (keys of mappers.state_residence_original) to the
+    state_residence categorical
+
+    Parameters
+    ----------
+    state: series or categorical of state codes, eg "01", "I"
+
+    Returns
+    -------
+    categorical with state_residence_dtype, NaN for codes not in the mapper
+    """
+
+    state = pd.Categorical(state)
+
+    # a missing value (code -1) takes the appended -1
+    recode = np.append(
+        nom_state_codes.get_indexer(state.categories.astype(str).str.strip()), -1
+    )
+
+    return pd.Categorical.from_codes(
+        recode.take(state.codes), dtype=state_residence_dtype
+    )
+
+
+def get_state_residence(df, mapping="original"):
+    """
+    Return the state of residence of NOM unit records, from the state_residence
+    column (decoded at ingestion) or, for files without it, the state column
+
+    Parameters
+    ----------
+    df: dataframe of NOM unit records with a state_residence or state column
+    mapping: str, "original" or "other_territories" - see state_residence_mappers
+
+    Returns
+    -------
+    categorical series, indexed like df
+    """
+
+    if mapping not in state_residence_mappers:
+        raise ValueError(
+            f"Chris - mapping must be one of {list(state_residence_mappers)}, "
+            f"not {mapping}"
+        )
+
+    if state_residence_field in df.columns:
+        state_residence = pd.Categorical(
+            df[state_residence_field], dtype=state_residence_dtype
+        )
+    else:
+        state_residence = decode_state(df["state"])
+
+    if mapping != "original":
+        # the roll-up of each fixed code, categories in order of first appearance
+        rollup_codes, categories = pd.factorize(
+            nom_state_codes.map(state_residence_mappers[mapping])
+        )
+        state_residence = pd.Categorical.from_codes(
+            np.append(rollup_codes, -1).take(state_residence.codes), categories
+        )
+
+    return pd.Series(state_residence, index=df.index, name=state_residence_field)
+
+
+def cluster_nom_rows(df):
+    """
+    Sort NOM rows by nom_cluster_columns, so each row group covers a narrow range
+    of visa subclasses and dates
+
+    Parameters
+    ----------
+    df: dataframe of NOM unit records
+
+    Returns
+    -------
+    df: sorted dataframe
+    """
+
+    return df.sort_values(nom_cluster_columns, ignore_index=True)
+
+
+def cast_nom_integer(series, value_range=None):
+    """
+    Cast a NOM column to its integer type in nom_integer_dtypes
+
+    Parameters
+    ----------
+    series: pandas Series, named for a column in nom_integer_dtypes
+    value_range: None or [min, max] of the column, eg from the schema ranges.
+        If None, the series' min and max are checked
+
+    Returns
+    -------
+    series cast to its schema integer type
+
+    Raises
+    ------
+    ValueError
+        if values don't fit the schema integer type (they'd wrap around silently),
+        or are floats that aren't whole numbers (they'd be truncated)
+    """
+
+    dtype = np.dtype(nom_integer_dtypes[series.name])
+
+    if series.dtype == dtype:
+        return series
+
+    if pd.api.types.is_float_dtype(series) and (series % 1 > 0).any():
+        raise ValueError(
+            f"Chris - {series.name} has values that aren't whole numbers, "
+            f"can't cast to {dtype}"
+        )
+
+    if value_range is None and len(series):
+        value_range = [series.min(), series.max()]
+
+    check_nom_integer_range(series.name, value_range)
+
+    return series.astype(dtype)
+
+
+def check_nom_integer_range(col, value_range):
+    """
+    Check a column's range fits its integer type in nom_integer_dtypes
+
+    Parameters
+    ----------
+    col: str, column in nom_integer_dtypes
+    value_range: None or [min, max] of the column
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError
+        if the range doesn't fit the schema integer type
+    """
+
+    dtype = np.dtype(nom_integer_dtypes[col])
+    dtype_info = np.iinfo(dtype)
+
+    if value_range is not None and (
+        value_range[0] < dtype_info.min or value_range[1] > dtype_info.max
+    ):
+        raise ValueError(
+            f"Chris - {col} values {value_range} outside {dtype} range, "
+            "adjust nom_integer_dtypes"
+        )
+
+    return None
+
+
+def get_parquet_column_ranges(file_path, columns):
+    """
+    Return the min and max of columns of a parquet file, from the row group
+    statistics - a column is only read if a row group has no statistics
+
+    Parameters
+    ----------
+    file_path: Path object of a parquet file
+    columns: list of numeric columns
+
+    Returns
+    -------
+    dict of column: [min, max], columns with no values are left out
+    """
+
+    metadata = pq.ParquetFile(file_path).metadata
+    ranges = {}
+
+    for col in columns:
+        col_index = metadata.schema.names.index(col)
+        col_min, col_max = None, None
+
+        for i in range(metadata.num_row_groups):
+            column = metadata.row_group(i).column(col_index)
+            statistics = column.statistics
+
+            if column.num_values == 0:
+                continue
+
+            if statistics is None or not statistics.has_min_max:
+                series = pd.read_parquet(file_path, columns=[col])[col]
+                col_min, col_max = series.min(), series.max()
+                break
+
+            if col_min is None:
+                col_min, col_max = statistics.min, statistics.max
+            else:
+                col_min = min(col_min, statistics.min)
+                col_max = max(col_max, statistics.max)
+
+        if col_min is not None and not pd.isna(col_min):
+            ranges[col] = [np.asarray(col_min).item(), np.asarray(col_max).item()]
+
+    return ranges
+
+
+def read_nom_schema(schema_path=None):
+    """
+    Read the NOM schema file - an empty schema (version 0) if there isn't one
+
+    Parameters
+    ----------
+    schema_path: None or Path object, if None use nom_schema_path
+
+    Returns
+    -------
+    schema: dict with keys:
+        version: int, incremented each time categories are added
+        categories: dict of column name: list of categories, in code order
+        ranges: dict of integer column name: [min, max] over all files
+    """
+
+    if schema_path is None:
+        schema_path = nom_schema_path
+
+    if schema_path.exists():
+        with open(schema_path, "r") as schema_file:
+            schema = json.load(schema_file)
+
+        # schemas written before ranges were recorded
+        schema.setdefault("ranges", {})
+
+        return schema
+
+    return {"version": 0, "categories": {}, "ranges": {}}
+
+
+def write_nom_schema(schema, schema_path=None):
+    """
+    Write the NOM schema file, replacing the old schema atomically
+
+    Parameters
+    ----------
+    schema: dict, see read_nom_schema
+    schema_path: None or Path object, if None use nom_schema_path
+
+    Returns
+    -------
+    None
+    """
+
+    if schema_path is None:
+        schema_path = nom_schema_path
+
+    temp_path = get_staging_path(schema_path)
+
+    with open(temp_path, "w") as schema_file:
+        json.dump(schema, schema_file, indent=2)
+
+    os.replace(temp_path, schema_path)
+
+    return None
+
+
+def update_nom_schema(file_paths, schema_path=None):
+    """
+    Add values of the string columns in NOM parquet files to the schema categories
+    (appended, so existing codes are stable), and the min and max of the integer
+    columns to the schema ranges
+
+    Parameters
+    ----------
+    file_paths: iterable of Path objects to NOM parquet files
+    schema_path: None or Path object, if None use nom_schema_path
+
+    Returns
+    -------
+    schema: dict, see read_nom_schema
+
+    Raises
+    ------
+    ValueError
+        if an integer column's range doesn't fit its type in nom_integer_dtypes
+    """
+
+    schema = read_nom_schema(schema_path)
+    categories_added = False
+    ranges_changed = False
+
+    for file_path in file_paths:
+        file_schema = pq.read_schema(file_path)
+        file_columns = file_schema.names
+        string_vars = [col for col in nom_string_vars if col in file_columns]
+
+        integer_vars = [
+            col
+            for col in nom_integer_dtypes
+            if col in file_columns and pa.types.is_integer(file_schema.field(col).type)
+        ]
+
+        for col, (col_min, col_max) in get_parquet_column_ranges(
+            file_path, integer_vars
+        ).items():
+            value_range = schema["ranges"].get(col, [col_min, col_max])
+            value_range = [min(value_range[0], col_min), max(value_range[1], col_max)]
+
+            check_nom_integer_range(col, value_range)
+
+            if value_range != schema["ranges"].get(col):
+                schema["ranges"][col] = value_range
+                ranges_changed = True
+
+        df = pd.read_parquet(file_path, columns=string_vars)
+
+        for col in string_vars:
+            categories = schema["categories"].setdefault(col, [])
+            new_categories = sorted(
+                set(df[col].dropna().unique()).difference(categories)
+            )
+
+            if new_categories:
+                categories.extend(new_categories)
+                categories_added = True
+
+    if categories_added:
+        schema["version"] += 1
+
+    if categories_added or ranges_changed:
+        write_nom_schema(schema, schema_path)
+
+    return schema
+
+
+def apply_nom_schema(df, schema=None):
+    """
+    Cast NOM columns to the schema types, so every file has identical dtypes.
+    state_residence is always cast to state_residence_dtype
+
+    Parameters
+    ----------
+    df: dataframe of NOM unit records
+    schema: None or dict, see read_nom_schema. If None, columns are left as read
+
+    Returns
+    -------
+    df: dataframe with schema dtypes
+    """
+
+    for col in df.columns:
+        if col == state_residence_field:
+            # parquet keeps only the used categories, so restore the fixed dictionary
+            df[col] = df[col].astype(state_residence_dtype)
+
+        elif schema is None:
+            continue
+
+        elif col in nom_integer_dtypes and pd.api.types.is_integer_dtype(df[col]):
+            # a range checked at ingestion saves scanning the column for its min and max
+            df[col] = cast_nom_integer(df[col], schema.get("ranges", {}).get(col))
+
+        elif col in schema["categories"]:
+            categories = schema["categories"][col]
+
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                values = df[col].cat.remove_unused_categories().cat.categories
+            else:
+                values = df[col].dropna().unique()
+
+            # widen rather than lose values of a file the schema wasn't updated with
+            missing = sorted(set(values).difference(categories))
+
+            df[col] = df[col].astype(pd.CategoricalDtype(categories + missing))
+
+    return df
+
+
+def get_cache_source(file_path):
+    """
+    Return the size and modification time of a file a cache is built from,
+    None if the file is missing
+    """
+
+    if not file_path.exists():
+        return None
+
+    stat = file_path.stat()
+
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def set_cache_source(table, source):
+    """
+    Return the table with source (see get_cache_source, or a dict of them) recorded
+    in its schema metadata
+    """
+
+    return table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            b"nom_cache_source": json.dumps(source).encode(),
+        }
+    )
+
+
+def read_cache_source(cache_path):
+    """
+    Return the source recorded in a cache file - Arrow IPC or parquet - by
+    set_cache_source, or None if there's no cache file
+    """
+
+    if not cache_path.exists():
+        return None
+
+    if cache_path.suffix == ".parquet":
+        metadata = pq.read_schema(cache_path).metadata or {}
+    else:
+        with pa.memory_map(str(cache_path)) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+
+    if b"nom_cache_source" not in metadata:
+        return None
+
+    return json.loads(metadata[b"nom_cache_source"])
+
+
+def get_person_index_path(file_path, analysis_folder):
+    """
+    Return the path of a NOM parquet file's person index
+
+    Parameters
+    ----------
+    file_path: Path object to a NOM parquet file
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+
+    Returns
+    -------
+    Path object
+    """
+
+    return analysis_folder / person_index_folder_name / f"{file_path.stem}.arrow"
+
+
+def write_person_index(file_path, analysis_folder):
+    """
+    Index the row groups of a NOM parquet file holding each person_id - an Arrow IPC
+    file sorted by person_id with columns: person_id, row_group, row_start, row_stop.
+    Rows aren't sorted by person_id, so row_start to row_stop (exclusive) can span
+    most of the row group - the saving is from the row groups that aren't read
+
+    Parameters
+    ----------
+    file_path: Path object to a NOM parquet file
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+
+    Returns
+    -------
+    index_path: Path object of the person index
+    """
+
+    index_path = get_person_index_path(file_path, analysis_folder)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    staging_path = get_staging_path(index_path)
+
+    source = get_cache_source(file_path)
+    parquet_file = pq.ParquetFile(file_path)
+
+    row_groups = []
+    for row_group in range(parquet_file.num_row_groups):
+        person_ids = (
+            parquet_file.read_row_group(row_group, columns=["person_id"])
+            .column("person_id")
+            .to_numpy()
+        )
+
+        row_groups.append(
+            pd.DataFrame({"person_id": person_ids, "row": np.arange(len(person_ids))})
+            .groupby("person_id")
+            .row.agg(row_start="min", row_stop="max")
+            .assign(row_group=row_group, row_stop=lambda x: x.row_stop + 1)
+            .reset_index()
+        )
+
+    columns = ["person_id", "row_group", "row_start", "row_stop"]
+
+    if row_groups:
+        person_index = pd.concat(row_groups, ignore_index=True).sort_values(
+            "person_id", kind="mergesort", ignore_index=True
+        )[columns]
+    else:
+        person_index = pd.DataFrame(columns=columns, dtype="int64")
+
+    table = set_cache_source(
+        pa.Table.from_pandas(person_index.astype("int64"), preserve_index=False),
+        source,
+    )
+
+    with pa.OSFile(str(staging_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    publish_outfile(staging_path, [index_path])
+
+    return index_path
+
+
+def get_sas_reader(sas_reader="pandas"):
+    """
+    Check the SAS reader backend, falling back to pandas if pyreadstat is not installed
+
+    Parameters
+    ----------
+    sas_reader: str, "pandas" or "pyreadstat"
+
+    Returns
+    -------
+    sas_reader: str, the SAS reader backend available
+    """
+
+    if sas_reader not in sas_readers:
+        raise ValueError(
+            f"Chris: sas_reader must be one of {sas_readers}. You tried {sas_reader}."
+        )
+
+    if sas_reader == "pyreadstat" and importlib.util.find_spec("pyreadstat") is None:
+        print("pyreadstat is not installed - reading SAS files with pandas")
+        sas_reader = "pandas"
+
+    return sas_reader
+
+
+def read_sas_file(sas_file, sas_reader="pandas", n_processes=None):
+    """
+    Read a whole SAS file
+
+    Parameters
+    ----------
+    sas_file: Path object (or file-like object for the pandas reader) of the SAS file
+    sas_reader: str, "pandas" or "pyreadstat"
+    n_processes: None or int, number of pyreadstat processes, if None use all cpus
+
+    Returns
+    -------
+    df: dataframe of the SAS file, with lower case column names
+    """
+
+    if sas_reader == "pyreadstat":
+        import pyreadstat
+
+        df, _ = pyreadstat.read_file_multiprocessing(
+            pyreadstat.read_sas7bdat,
+            sas_file,
+            num_processes=n_processes,
+            encoding="LATIN1",
+            dates_as_pandas_datetime=True,
+        )
+        df = blank_pyreadstat_strings(df)
+    else:
+        df = pd.read_sas(sas_file, encoding="latin-1", format="sas7bdat")
+
+    return df.rename(columns=str.lower)
+
+
+def blank_pyreadstat_strings(df):
+    """
+    Make missing strings read by pyreadstat ("") missing values (NaN), as pandas
+    read_sas reads them, so both readers give the same categories
+
+    Parameters
+    ----------
+    df: dataframe read by pyreadstat
+
+    Returns
+    -------
+    df
+    """
+
+    for col in df.select_dtypes("object").columns:
+        df[col] = df[col].replace("", np.nan)
+
+    return df
+
+
+def get_chunk_rows(df_sample, memory_budget_mb):
+    """
+    Return the number of rows per chunk that fit in the memory budget
+
+    Parameters
+    ----------
+    df_sample: dataframe of the first rows of a SAS file
+    memory_budget_mb: int
+
+    Returns
+    -------
+    int
+    """
+
+    budget_bytes = memory_budget_mb * 2 ** 20
+    bytes_per_row = df_sample.memory_usage(deep=True).sum() / len(df_sample)
+
+    return max(1, int(budget_bytes / (bytes_per_row * sas_chunk_memory_multiplier)))
+
+
+def gen_sas_chunks(sas_file, memory_budget_mb, sas_reader="pandas", n_processes=None):
+    """
+    A generator to read a SAS file in chunks sized to fit a memory budget, measured
+    from the first sas_sample_rows rows
+
+    Parameters
+    ----------
+    sas_file: Path object (or file-like object for the pandas reader) of the SAS file
+    memory_budget_mb: int
+        approximate upper bound on memory used while reading and writing a chunk
+    sas_reader: str, "pandas" or "pyreadstat"
+    n_processes: None or int, number of pyreadstat processes, if None use all cpus
+
+    Yields
+    ------
+    df: dataframe chunk of the SAS file, with lower case column names
+    """
+
+    if sas_reader == "pyreadstat":
+        import pyreadstat
+
+        df, _ = pyreadstat.read_sas7bdat(
+            sas_file,
+            row_limit=sas_sample_rows,
+            encoding="LATIN1",
+            dates_as_pandas_datetime=True,
+        )
+
+        if df.empty:
+            return
+
+        chunk_rows = get_chunk_rows(df, memory_budget_mb)
+
+        yield blank_pyreadstat_strings(df).rename(columns=str.lower)
+        del df
+
+        # each chunk is split by row ranges across the processes
+        for df, _ in pyreadstat.read_file_in_chunks(
+            pyreadstat.read_sas7bdat,
+            sas_file,
+            chunksize=chunk_rows,
+            offset=sas_sample_rows,
+            multiprocess=True,
+            num_processes=n_processes or os.cpu_count(),
+            encoding="LATIN1",
+            dates_as_pandas_datetime=True,
+        ):
+            yield blank_pyreadstat_strings(df).rename(columns=str.lower)
+
+        return
+
+    with pd.read_sas(
+        sas_file, encoding="latin-1", format="sas7bdat", chunksize=sas_sample_rows
+    ) as reader:
+        df = reader.read(sas_sample_rows)
+
+        if df.empty:
+            return
+
+        chunk_rows = get_chunk_rows(df, memory_budget_mb)
+
+        while not df.empty:
+            yield df.rename(columns=str.lower)
+
+            # release the chunk before decoding the next one
+            del df
+            df = reader.read(chunk_rows)
+
+
+def benchmark_sas_readers(sas_file, n_processes=None):
+    """
+    Compare rows per second of the SAS reader backends reading the same file
+
+    Parameters
+    ----------
+    sas_file: Path object of the SAS file
+    n_processes: None or int, number of pyreadstat processes, if None use all cpus
+
+    Returns
+    -------
+    dataframe indexed by sas_reader with columns: rows, seconds, rows_per_second
+    """
+
+    benchmark = {}
+
+    for sas_reader in sas_readers:
+        # skip readers that aren't installed
+        if get_sas_reader(sas_reader) != sas_reader:
+            continue
+
+        start = time.perf_counter()
+        rows = len(read_sas_file(sas_file, sas_reader, n_processes))
+        seconds = time.perf_counter() - start
+
+        benchmark[sas_reader] = {
+            "rows": rows,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds,
+        }
+
+    return pd.DataFrame.from_dict(benchmark, orient="index").rename_axis("sas_reader")
+
+
+def get_row_groups_read(file_path, vsc_list, nom_fields=None):
+    """
+    Return the row groups of a NOM parquet file, and their bytes, read to select
+    visa subclasses when row groups are skipped using visa_subclass min/max statistics
+
+    Parameters
+    ----------
+    file_path: Path object to a NOM parquet file
+    vsc_list: list of visa subclasses to select
+    nom_fields: None or list of fields read, if None all fields
+
+    Returns
+    -------
+    dict with keys: row_groups, row_groups_read, bytes, bytes_read
+    """
+
+    metadata = pq.ParquetFile(file_path).metadata
+
+    row_groups_read = 0
+    bytes_total = 0
+    bytes_read = 0
+
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        columns = {
+            row_group.column(j).path_in_schema: row_group.column(j)
+            for j in range(row_group.num_columns)
+        }
+
+        row_group_bytes = sum(
+            column.total_compressed_size
+            for name, column in columns.items()
+            if nom_fields is None or name in nom_fields
+        )
+        bytes_total += row_group_bytes
+
+        statistics = columns["visa_subclass"].statistics
+
+        if (
+            statistics is None
+            or not statistics.has_min_max
+            or any(statistics.min <= vsc <= statistics.max for vsc in vsc_list)
+        ):
+            row_groups_read += 1
+            bytes_read += row_group_bytes
+
+    return {
+        "row_groups": metadata.num_row_groups,
+        "row_groups_read": row_groups_read,
+        "bytes": bytes_total,
+        "bytes_read": bytes_read,
+    }
+
+
+def benchmark_clustering(file_path, visa_groups, nom_fields=None):
+    """
+    Compare bytes read for visa subclass selections from a NOM parquet file as
+    it is (before), and rewritten clustered with nom_row_group_size row groups (after)
+
+    Parameters
+    ----------
+    file_path: Path object to a NOM parquet file
+    visa_groups: dict of visa group name: list of visa subclasses,
+        eg {"student": ["570", "571", "572", "573", "574", "575", "576"]}
+    nom_fields: None or list of fields read, eg as passed to get_visa_groups
+
+    Returns
+    -------
+    dataframe indexed by (visa_group, layout) with columns:
+        row_groups, row_groups_read, bytes, bytes_read, share_read
+    """
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        clustered_path = Path(temp_folder) / file_path.name
+
+        cluster_nom_rows(pd.read_parquet(file_path)).to_parquet(
+            clustered_path, row_group_size=nom_row_group_size, write_page_index=True
+        )
+
+        benchmark = {
+            (visa_group, layout): get_row_groups_read(path, vsc_list, nom_fields)
+            for visa_group, vsc_list in visa_groups.items()
+            for layout, path in [("before", file_path), ("after", clustered_path)]
+        }
+
+    return (
+        pd.DataFrame.from_dict(benchmark, orient="index")
+        .rename_axis(["visa_group", "layout"])
+        .assign(share_read=lambda x: x.bytes_read / x.bytes)
+    )
+
+
+def write_nom_parquet_chunks(df_chunks, nom_status, file_path):
+    """
+    Convert datatypes of each chunk and append as a row group to a parquet file
+
+    Parameters
+    ----------
+    df_chunks: iterable of dataframe chunks of SAS NOM data
+    nom_status: "p" for preliminary NOM, "f" for final NOM
+    file_path: Path object of the parquet file to write
+
+    Returns
+    -------
+    None
+    """
+
+    parquet_writer = None
+
+    try:
+        for df in df_chunks:
+            # the first chunk sets the schema (with int32 dictionary indices), later
+            # chunks are cast to it (eg a string column with no values in a chunk)
+            table = pa.Table.from_pandas(
+                convert_nom_dtypes(df, nom_status),
+                schema=None if parquet_writer is None else parquet_writer.schema,
+                preserve_index=False,
+            )
+
+            if parquet_writer is None:
+                table = table.cast(get_nom_writer_schema(table.schema))
+                parquet_writer = pq.ParquetWriter(
+                    file_path, table.schema, write_page_index=True
+                )
+
+            parquet_writer.write_table(table, row_group_size=nom_row_group_size)
+
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+
+    if parquet_writer is None:
+        raise ValueError(f"Chris - no rows to write to {file_path.name}")
+
+    return None
+
+
+def get_outfile_name(abs_filepath):
+    """
+    Return the parquet file name for an original ABS file
+
+    Parameters
+    ----------
+    abs_filepath: Path object of original ABS file
+
+    Returns
+    -------
+    filename: str, of the form traveller_characteristics2018q1.parquet
+              or traveller_characteristics2018q1_p.parquet for preliminary files
+    """
+
+    # ABS NOM filenames are of the type xxxx2018q1.sas...
+    # Want to extract the date compenent: 2018q1
+    date_start = abs_filepath.stem.find("2")
+
+    if date_start != -1:  # if a '2' is found
+        filename_date = abs_filepath.stem[date_start:]
+
+        ## append '_p' if it's a preliminary file
+        if abs_filepath.stem[0] == "p":
+            filename_date = filename_date + "_p"
+    else:
+        raise ValueError(
+            f"Chris - filename {abs_filepath.stem} does not appear to have a 20XXqY "
+            "date in it"
+        )
+
+    return "traveller_characteristics" + filename_date + ".parquet"
+
+
+def get_file_year_quarter(file_path):
+    """
+    Return the year and quarter in a NOM file name, eg traveller_characteristics2019q3
+
+    Parameters
+    ----------
+    file_path: Path object (or name) of a NOM file
+
+    Returns
+    -------
+    year, quarter: ints, or None, None if the name has no 20XXqY date
+    """
+
+    year_quarter = re.search(r"(\d{4})q(\d)", Path(file_path).stem)
+
+    if year_quarter is None:
+        return None, None
+
+    return int(year_quarter.group(1)), int(year_quarter.group(2))
+
+
+def get_analysis_path(filename, analysis_folder, partitioned=False):
+    """
+    Return the path of a parquet file in the analysis folder
+
+    Parameters
+    ----------
+    filename: str, parquet file name from get_outfile_name
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+    partitioned: boolean, default False
+        if True, the path in the partitioned layout:
+        status=final|preliminary/year=YYYY/quarter=Q/filename
+
+    Returns
+    -------
+    Path object
+    """
+
+    if not partitioned:
+        return analysis_folder / filename
+
+    year, quarter = get_file_year_quarter(filename)
+
+    if year is None:
+        raise ValueError(
+            f"Chris - filename {filename} does not appear to have a 20XXqY date in it"
+        )
+
+    nom_status = "p" if Path(filename).stem.endswith("_p") else "f"
+
+    return (
+        analysis_folder
+        / f"status={nom_partition_status[nom_status]}"
+        / f"year={year}"
+        / f"quarter={quarter}"
+        / filename
+    )
+
+
+def remove_analysis_file(file_path, analysis_folder):
+    """
+    Delete a file from the analysis folder, and any partition folders left empty
+
+    Parameters
+    ----------
+    file_path: Path object of the file in the analysis folder
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+
+    Returns
+    -------
+    None
+    """
+
+    if file_path.exists():
+        file_path.unlink()
+
+    folder = file_path.parent
+
+    while folder != analysis_folder and folder.exists() and not any(folder.iterdir()):
+        folder.rmdir()
+        folder = folder.parent
+
+    return None
+
+
+def remove_preliminary_outfile(abs_filepath, analysis_folder, person_index=False):
+    """
+    If a final file replaces a preliminary file - delete it from the analysis folder
+    (in both the flat and partitioned layouts)
+
+    Parameters
+    ----------
+    abs_filepath: Path object of original ABS file
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+    person_index: boolean, default False
+        if True, also delete the preliminary file's person index
+
+    Returns
+    -------
+    None
+    """
+
+    if abs_filepath.stem[0] == "f":
+        preliminary_filename = get_outfile_name(abs_filepath).replace(
+            ".parquet", "_p.parquet"
+        )
+
+        for partitioned in [False, True]:
+            remove_analysis_file(
+                get_analysis_path(preliminary_filename, analysis_folder, partitioned),
+                analysis_folder,
+            )
+
+        if person_index:
+            person_index_path = get_person_index_path(
+                Path(preliminary_filename), analysis_folder
+            )
+            if person_index_path.exists():
+                person_index_path.unlink()
+
+    return None
+
+
+def publish_analysis_outfile(
+    staging_path, filename, abs_original_data_folder, analysis_folder, partitioned=False
+):
+    """
+    Publish a staged parquet file to the ABS data folder and the analysis folder,
+    removing any copy in the other analysis folder layout
+
+    Parameters
+    ----------
+    staging_path: Path object of the fully written file
+    filename: str, parquet file name from get_outfile_name
+    abs_original_data_folder: Path object of path to ABS data folder
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+    partitioned: boolean, default False
+        if True, publish to the partitioned layout of the analysis folder
+
+    Returns
+    -------
+    None
+    """
+
+    analysis_path = get_analysis_path(filename, analysis_folder, partitioned)
+    analysis_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Publish to original ABS folder:
+    #    to keep as history for comparison with updated preliminary/final files
+    # and to folder for analysis
+    publish_outfile(staging_path, [analysis_path, abs_original_data_folder / filename])
+
+    remove_analysis_file(
+        get_analysis_path(filename, analysis_folder, not partitioned), analysis_folder
+    )
+
+    return None
+
+
+def get_staging_path(file_path):
+    """
+    Return the temporary path a file is written to before it is renamed into place
+    (the .tmp suffix keeps it out of globs for *.parquet)
+
+    Parameters
+    ----------
+    file_path: Path object of the file to be published
+
+    Returns
+    -------
+    Path object
+    """
+
+    return file_path.with_name(file_path.name + ".tmp")
+
+
+def publish_outfile(staging_path, destinations):
+    """
+    Publish a written (staged) file to each destination with atomic renames - hard
+    linked (or copied) beside each destination, then renamed over it
+
+    Parameters
+    ----------
+    staging_path: Path object of the fully written file, removed once published
+    destinations: list of Path objects to publish the file to
+
+    Returns
+    -------
+    None
+    """
+
+    for destination in destinations:
+        destination_staging_path = get_staging_path(destination)
+
+        if destination_staging_path != staging_path:
+            if destination_staging_path.exists():
+                destination_staging_path.unlink()
+
+            try:
+                os.link(staging_path, destination_staging_path)
+            except OSError:
+                shutil.copyfile(staging_path, destination_staging_path)
+
+        os.replace(destination_staging_path, destination)
+
+    # the last destination may have consumed the staged file by renaming it
+    if staging_path.exists():
+        staging_path.unlink()
+
+    return None
+
+
+def write_outfile(
+    df,
+    abs_filepath,
+    abs_original_data_folder,
+    analysis_folder,
+    remove_preliminary=True,
+    partitioned=False,
+):
+    """
+    write out the processed ABS data to the ABS data folder and the analysis folder,
+    encoded once and published to both with atomic renames
+
+    Parameters
+    ----------
+    df: pandas dataframe to write out
+    abs_filepath: Path object of original ABS file
+    abs_original_data_folder: Path object of path to ABS data folder
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+    remove_preliminary: boolean, default True
+        if True and a final file, delete the preliminary parquet file it replaces
+    partitioned: boolean, default False
+        if True, write to the partitioned layout of the analysis folder
+
+    Returns
+    -------
+    None
+    """
+
+    filename = get_outfile_name(abs_filepath)
+    staging_path = get_staging_path(abs_original_data_folder / filename)
+
+    try:
+        df.to_parquet(
+            staging_path, row_group_size=nom_row_group_size, write_page_index=True
+        )
+    except BaseException:
+        if staging_path.exists():
+            staging_path.unlink()
+        raise
+
+    publish_analysis_outfile(
+        staging_path, filename, abs_original_data_folder, analysis_folder, partitioned
+    )
+
+    if remove_preliminary:
+        remove_preliminary_outfile(abs_filepath, analysis_folder)
+
+    return None
+
+
+def write_outfile_chunked(
+    df_chunks,
+    abs_filepath,
+    abs_original_data_folder,
+    analysis_folder,
+    remove_preliminary=True,
+    partitioned=False,
+):
+    """
+    write out the processed ABS data, chunk by chunk, to the ABS data folder
+    and the analysis folder. Rows are not sorted across chunks
+
+    Parameters
+    ----------
+    df_chunks: iterable of dataframe chunks of SAS NOM data
+    abs_filepath: Path object of original ABS file
+    abs_original_data_folder: Path object of path to ABS data folder
+    analysis_folder: Path to folder containing all NOM unit record parquet files
+    remove_preliminary: boolean, default True
+        if True and a final file, delete the preliminary parquet file it replaces
+    partitioned: boolean, default False
+        if True, write to the partitioned layout of the analysis folder
+
+    Returns
+    -------
+    None
+    """
+
+    filename = get_outfile_name(abs_filepath)
+    staging_path = get_staging_path(abs_original_data_folder / filename)
+
+    try:
+        write_nom_parquet_chunks(df_chunks, get_nom_status(abs_filepath), staging_path)
+    except BaseException:
+        if staging_path.exists():
+            staging_path.unlink()
+        raise
+
+    publish_analysis_outfile(
+        staging_path, filename, abs_original_data_folder, analysis_folder, partitioned
+    )
+
+    if remove_preliminary:
+        remove_preliminary_outfile(abs_filepath, analysis_folder)
+
+    return None
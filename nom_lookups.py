@@ -0,0 +1,845 @@
+"""
+Utilities to look up visa subclasses, visa code descriptions and SACC country codes
+"""
+
+import json
+import pickle
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+
+import file_paths
+import mappers
+import nom_ingestion
+
+
+dict_data_folder = file_paths.dict_data_folder
+
+# Visa dictionaries compiled into one registry, rebuilt when a dictionary changes
+visa_registry_path = dict_data_folder / "visa_mapping_registry.arrow"
+visa_registry_sources = ["ABS - Visacode3412mapping.xlsx", "REF_VISA_SUBCLASS.parquet"]
+#   registries read this session, by path: (sources when read, registry)
+visa_registry_cache = {}
+#   global visa subclass codes, by schema path:
+#   (schema size and mtime, registry sources, codes)
+visa_subclass_codes_cache = {}
+
+# Visa code descriptions, kept as a sorted store (rebuilt when the pickle changes)
+visa_description_source = "dict_visa_code_descriptions.pickle"
+visa_description_store_path = dict_data_folder / "visa_code_descriptions.arrow"
+#   stores read this session, by path:
+#   (pickle size and mtime, store size and mtime, codes, descriptions)
+visa_description_cache = {}
+
+# SACC country codes - 4 digit int16 codes on the unit records, decoded to country,
+# sub_region and region (see mappers.sacc_sub_region, mappers.sacc_region)
+sacc_fields = ["country_of_birth", "country_of_citizenship", "country_of_stay"]
+sacc_levels = ["country", "sub_region", "region"]
+#   csv of code, country - needed to decode countries, not sub_region or region
+sacc_country_path = dict_data_folder / "SACC 2016 countries.csv"
+#   lookups built this session, by level: (csv size and mtime, lookup, categories)
+sacc_lookup_cache = {}
+
+
+def get_visa_code_descriptions(vsc_list):
+    """
+    get visa code descriptions
+
+    parameters
+    ----------
+    vsc_list: list
+       visa suc codes as strings - not used, see get_visa_descriptions to look up
+       the descriptions of a list of codes
+
+    returns
+    -------
+    a dictionary matching visa subcode to description
+    """
+
+    with open(dict_data_folder / visa_description_source, "rb") as pickle_file:
+        dict_visa_code_descriptions = pickle.load(pickle_file)
+
+    return dict_visa_code_descriptions
+
+
+def build_visa_description_store(store_path=None):
+    """
+    Write the visa code descriptions pickle as an Arrow IPC file of code, description,
+    sorted by code
+
+    Parameters
+    ----------
+    store_path: None or Path object of the store, if None visa_description_store_path
+
+    Returns
+    -------
+    None
+    """
+
+    if store_path is None:
+        store_path = visa_description_store_path
+
+    pickle_path = dict_data_folder / visa_description_source
+
+    source = nom_ingestion.get_cache_source(pickle_path)
+
+    with open(pickle_path, "rb") as pickle_file:
+        dict_visa_code_descriptions = pickle.load(pickle_file)
+
+    descriptions = pd.Series(
+        {str(key): str(value) for key, value in dict_visa_code_descriptions.items()}
+    ).sort_index()
+
+    table = nom_ingestion.set_cache_source(
+        pa.table(
+            {
+                "code": descriptions.index.to_numpy(),
+                "description": descriptions.to_numpy(),
+            }
+        ),
+        source,
+    )
+
+    staging_path = nom_ingestion.get_staging_path(store_path)
+
+    with pa.OSFile(str(staging_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    nom_ingestion.publish_outfile(staging_path, [store_path])
+
+    return None
+
+
+def get_visa_description_store(store_path=None):
+    """
+    Return the visa code description store as sorted arrays, rebuilding it if the
+    pickle has changed. Kept in memory until the pickle or the store changes
+
+    Parameters
+    ----------
+    store_path: None or Path object of the store, if None visa_description_store_path
+
+    Returns
+    -------
+    codes: sorted numpy array of visa codes
+    descriptions: numpy array of descriptions, aligned with codes
+    """
+
+    if store_path is None:
+        store_path = visa_description_store_path
+
+    pickle_path = dict_data_folder / visa_description_source
+
+    pickle_source = nom_ingestion.get_cache_source(pickle_path)
+    store_source = nom_ingestion.get_cache_source(store_path)
+    cached = visa_description_cache.get(store_path)
+
+    if cached is not None and cached[:2] == (pickle_source, store_source):
+        return cached[2], cached[3]
+
+    # without the pickle, use the store as it is
+    if (
+        pickle_source is not None
+        and nom_ingestion.read_cache_source(store_path) != pickle_source
+    ):
+        build_visa_description_store(store_path)
+        store_source = nom_ingestion.get_cache_source(store_path)
+
+    with pa.memory_map(str(store_path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    cached = (
+        pickle_source,
+        store_source,
+        table.column("code").to_numpy(zero_copy_only=False),
+        table.column("description").to_numpy(zero_copy_only=False),
+    )
+    visa_description_cache[store_path] = cached
+
+    return cached[2], cached[3]
+
+
+def get_visa_descriptions(vsc_list, store_path=None):
+    """
+    Look up the descriptions of many visa codes at once
+
+    Parameters
+    ----------
+    vsc_list: list of visa codes as strings
+    store_path: None or Path object of the store, if None visa_description_store_path
+
+    Returns
+    -------
+    series of descriptions indexed by vsc_list, NaN for codes without a description
+    """
+
+    codes, descriptions = get_visa_description_store(store_path)
+    vsc_array = np.asarray(vsc_list, dtype=str)
+
+    mapped = np.full(len(vsc_array), np.nan, dtype=object)
+
+    if len(codes):
+        positions = np.searchsorted(codes, vsc_array).clip(max=len(codes) - 1)
+        found = codes[positions] == vsc_array
+        mapped[found] = descriptions[positions[found]]
+
+    return pd.Series(mapped, index=pd.Index(vsc_array, name="code"), name="description")
+
+
+def search_visa_descriptions(prefix, store_path=None):
+    """
+    Return the visa codes starting with prefix, and their descriptions
+
+    Parameters
+    ----------
+    prefix: str, eg "57"
+    store_path: None or Path object of the store, if None visa_description_store_path
+
+    Returns
+    -------
+    series of descriptions indexed by code
+    """
+
+    codes, descriptions = get_visa_description_store(store_path)
+
+    # codes starting with prefix are contiguous in the sorted codes
+    start = np.searchsorted(codes, prefix, side="left")
+    stop = np.searchsorted(codes, prefix + "\uffff", side="left")
+
+    return pd.Series(
+        descriptions[start:stop],
+        index=pd.Index(codes[start:stop], name="code"),
+        name="description",
+    )
+
+
+# Dictionary utilities
+def get_vsc_reference(file_path=None):
+    """
+    Return a dataframe containing definitions and groupings for visa subclasses
+    The reference definitions and groupings is the sql table 'REF_VISA_SUBCLASS'
+    It is maintained by the visa stats team.
+
+    Parameters:
+    -----------
+    file_path: Path or str object
+        filepath to parquet file
+
+    Returns:
+    -------
+    dataframe
+    """
+
+    if file_path == None:
+        file_path = dict_data_folder / "REF_VISA_SUBCLASS.parquet"
+
+    reference_visa_dict = (
+        pd.read_parquet(file_path)
+        .rename(columns=str.lower)
+        .rename(columns=lambda x: x.replace(" ", "_"))
+    )
+
+    return reference_visa_dict
+
+
+def get_ABS_visa_grouping(file_path=None):
+    """
+    Return a dataframe with ABS visa groupings (in cat no. 3412) by subclass
+    See ABS Migration unit for updated copies of excel file
+
+    Parameters:
+    -----------
+    file_path: None or Path object to 'ABS - Visacode3412mapping.xlsx'
+
+    Returns:
+    -------
+    dataframe
+    """
+
+    if file_path is None:
+        file_path = dict_data_folder / "ABS - Visacode3412mapping.xlsx"
+
+    abs_3412 = (
+        pd.read_excel(file_path)
+        .rename(columns=str.lower)
+        .rename(columns=lambda x: x.replace(" ", "_"))
+        # make sure visa subclass code is a string
+        .assign(visa_subclass_code=lambda x: x.visa_subclass_code.astype(str))
+    )
+
+    return abs_3412
+
+
+def get_abs_3412_mapper(df_abs_3412=None):
+    """
+    Return a dictionary to map subclass strings to modified ABS groupings
+
+    Parameters
+    ----------
+    df_abs_3412: None or dataframe, output from get_ABS_visa_grouping
+        3 columns in the dataframe: visa_subclass_code,
+                                    visa_subclass_label,
+                                    migration_publication_category
+
+    If None, the mapper compiled from the excel file in the visa registry
+        (see get_visa_registry)
+
+    Returns:
+    --------
+    abs_3412_mapper
+    """
+    # TODO: add in test that dataframe contains the expected columns
+
+    if df_abs_3412 is None:
+        return get_visa_registry()["abs_group"].copy()
+
+    idx = ["visa_subclass_code", "migration_publication_category"]
+    abs_3412_mapper = df_abs_3412[idx].set_index("visa_subclass_code").squeeze()
+
+    # Thhe ABS migration_publication_category splits students out - put them back into one group
+    student_mapper = {
+        "Higher education sector": "Student",
+        "Student  VET": "Student",
+        "Student other": "Student",
+    }
+
+    abs_3412_mapper[abs_3412_mapper.isin(student_mapper.keys())] = "Student"
+
+    ## break out a bridging category
+    bridging = {
+        "10": "Bridging",
+        "010": "Bridging",
+        "020": "Bridging",
+        "20": "Bridging",
+        "030": "Bridging",
+        "30": "Bridging",
+        "040": "Bridging",
+        "40": "Bridging",
+        "041": "Bridging",
+        "41": "Bridging",
+        "42": "Bridging",
+        "042": "Bridging",
+        "050": "Bridging",
+        "50": "Bridging",
+        "051": "Bridging",
+        "51": "Bridging",
+        "060": "Bridging",
+        "60": "Bridging",
+        "070": "Bridging",
+    }
+
+    idx = abs_3412_mapper.index.isin(bridging.keys())
+    abs_3412_mapper[idx] = "Bridging"
+
+    # as the mapper is used to generate variable names (in columns), make lowercase, no breaks
+    abs_3412_mapper = abs_3412_mapper.str.lower().str.replace(" ", "_")
+
+    return abs_3412_mapper
+
+
+def get_visa_registry_sources():
+    """
+    Return the size and modification time of each visa dictionary the registry is
+    built from, None for a dictionary that is missing
+    """
+
+    return {
+        file_name: nom_ingestion.get_cache_source(dict_data_folder / file_name)
+        for file_name in visa_registry_sources
+    }
+
+
+def build_visa_registry(registry_path=None):
+    """
+    Compile the visa dictionaries into the visa registry - an Arrow IPC file of
+    (mapping, visa_subclass, value) rows, for the mappings:
+        abs_group: subclass to modified ABS grouping, see get_abs_3412_mapper
+        label: subclass to label, the visa_subclass_ds of get_vsc_reference
+        reporting_category: subclass to ABS migration_publication_category
+    A mapping whose source is missing is left empty
+
+    Parameters
+    ----------
+    registry_path: None or Path object of the registry, if None visa_registry_path
+
+    Returns
+    -------
+    registry: dict of mapping name to series indexed by visa subclass
+    """
+
+    if registry_path is None:
+        registry_path = visa_registry_path
+
+    sources = get_visa_registry_sources()
+    abs_3412_file, vsc_file = visa_registry_sources
+
+    if all(source is None for source in sources.values()):
+        raise ValueError(
+            f"Chris - no visa dictionaries in {dict_data_folder} to build the visa "
+            "registry"
+        )
+
+    empty = pd.Series([], dtype=object)
+
+    registry = {"abs_group": empty, "label": empty, "reporting_category": empty}
+
+    if sources[abs_3412_file] is not None:
+        abs_3412 = get_ABS_visa_grouping()
+        registry["abs_group"] = get_abs_3412_mapper(abs_3412)
+        registry["reporting_category"] = abs_3412.set_index(
+            "visa_subclass_code"
+        ).migration_publication_category
+
+    if sources[vsc_file] is not None:
+        registry["label"] = get_vsc_reference().visa_subclass_ds
+
+    table = pa.Table.from_pandas(
+        pd.concat(
+            [
+                pd.DataFrame(
+                    {
+                        "mapping": mapping,
+                        "visa_subclass": mapper.index.astype(str),
+                        "value": mapper.values,
+                    }
+                )
+                for mapping, mapper in registry.items()
+            ],
+            ignore_index=True,
+        ),
+        preserve_index=False,
+    )
+    # series and index names, to return the mappers as they were read
+    names = {
+        mapping: [mapper.name, mapper.index.name]
+        for mapping, mapper in registry.items()
+    }
+    table = nom_ingestion.set_cache_source(
+        table.replace_schema_metadata({b"visa_registry": json.dumps(names).encode()}),
+        sources,
+    )
+
+    registry_path.parent.mkdir(parents=True, exist_ok=True)
+    staging_path = nom_ingestion.get_staging_path(registry_path)
+
+    with pa.OSFile(str(staging_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    nom_ingestion.publish_outfile(staging_path, [registry_path])
+
+    return read_visa_registry(registry_path)
+
+
+def read_visa_registry(registry_path=None):
+    """
+    Read the visa registry written by build_visa_registry
+
+    Parameters
+    ----------
+    registry_path: None or Path object of the registry, if None visa_registry_path
+
+    Returns
+    -------
+    registry: dict of mapping name to series indexed by visa subclass,
+        and "sources": the sources' sizes and modification times when it was built
+    """
+
+    if registry_path is None:
+        registry_path = visa_registry_path
+
+    with pa.memory_map(str(registry_path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    names = json.loads(table.schema.metadata[b"visa_registry"])
+    df = table.to_pandas()
+
+    groups = dict(list(df.groupby("mapping", sort=False)))
+
+    # an empty mapping (its source was missing) has no rows
+    registry = {
+        mapping: pd.Series(
+            groups[mapping].value.values if mapping in groups else [],
+            index=pd.Index(
+                groups[mapping].visa_subclass.values if mapping in groups else [],
+                dtype=object,
+                name=index_name,
+            ),
+            dtype=object,
+            name=name,
+        )
+        for mapping, (name, index_name) in names.items()
+    }
+    registry["sources"] = json.loads(table.schema.metadata[b"nom_cache_source"])
+
+    return registry
+
+
+def get_visa_registry(registry_path=None):
+    """
+    Return the visa registry (see build_visa_registry), rebuilding it if a visa
+    dictionary has changed. If a dictionary is missing, the registry already built is
+    used. Kept in memory until a dictionary changes
+
+    Parameters
+    ----------
+    registry_path: None or Path object of the registry, if None visa_registry_path
+
+    Returns
+    -------
+    registry: dict of mapping name to series indexed by visa subclass
+    """
+
+    if registry_path is None:
+        registry_path = visa_registry_path
+
+    sources = get_visa_registry_sources()
+
+    # cached with the sources it was read for - a registry used in place of a
+    # missing dictionary has different sources
+    cached_sources, registry = visa_registry_cache.get(registry_path, (None, None))
+
+    if registry is None or cached_sources != sources:
+        registry = None
+
+        if registry_path.exists():
+            registry = read_visa_registry(registry_path)
+
+        if registry is None or registry["sources"] != sources:
+            missing = [
+                file_name for file_name, source in sources.items() if source is None
+            ]
+
+            if missing and registry is not None:
+                print(
+                    f"{', '.join(missing)} missing from {dict_data_folder} - "
+                    f"using the visa registry already built, {registry_path}"
+                )
+            else:
+                registry = build_visa_registry(registry_path)
+
+        visa_registry_cache[registry_path] = (sources, registry)
+
+    return registry
+
+
+def get_visa_mapping_arrays(mapping, registry=None):
+    """
+    Return a visa registry mapping as arrays, for vectorised lookups
+
+    Parameters
+    ----------
+    mapping: str, "abs_group", "label" or "reporting_category"
+    registry: None or dict from get_visa_registry, if None get_visa_registry()
+
+    Returns
+    -------
+    visa_subclasses: sorted numpy array of visa subclasses (the first of any duplicates)
+    values: numpy array of the mapped values, aligned with visa_subclasses
+    """
+
+    if registry is None:
+        registry = get_visa_registry()
+
+    if mapping not in registry or mapping == "sources":
+        raise ValueError(f"Chris - {mapping} is not a visa registry mapping")
+
+    mapper = registry[mapping]
+    mapper = mapper[~mapper.index.duplicated()].sort_index()
+
+    return mapper.index.to_numpy(dtype=str), mapper.to_numpy()
+
+
+def lookup_visa_subclass(visa_subclasses, mapping="abs_group", registry=None):
+    """
+    Map visa subclasses through a visa registry mapping
+
+    Parameters
+    ----------
+    visa_subclasses: array-like of visa subclasses as strings
+    mapping: str, "abs_group", "label" or "reporting_category"
+    registry: None or dict from get_visa_registry, if None get_visa_registry()
+
+    Returns
+    -------
+    numpy array of mapped values, None where a subclass isn't in the mapping
+    """
+
+    keys, values = get_visa_mapping_arrays(mapping, registry)
+    visa_subclasses = np.asarray(visa_subclasses, dtype=str)
+
+    mapped = np.full(len(visa_subclasses), None, dtype=object)
+
+    if len(keys):
+        positions = np.searchsorted(keys, visa_subclasses).clip(max=len(keys) - 1)
+        found = keys[positions] == visa_subclasses
+        mapped[found] = values[positions[found]]
+
+    return mapped
+
+
+def get_visa_subclass_codes(schema=None, registry=None):
+    """
+    Return the global visa subclass codes - an index whose positions are the codes:
+    the NOM schema's visa_subclass categories, then the other subclasses in the registry
+
+    Parameters
+    ----------
+    schema: None or dict, see nom_ingestion.read_nom_schema. If None, read
+    nom_ingestion.nom_schema_path
+    registry: None or dict from get_visa_registry, if None get_visa_registry()
+
+    Returns
+    -------
+    index of visa subclasses
+    """
+
+    if registry is None:
+        registry = get_visa_registry()
+
+    # codes from nom_schema_path are kept until the schema or the registry changes
+    if schema is None:
+        schema_path = nom_ingestion.nom_schema_path
+        schema_source = nom_ingestion.get_cache_source(schema_path)
+        cached = visa_subclass_codes_cache.get(schema_path)
+
+        if cached is not None and cached[:2] == (schema_source, registry["sources"]):
+            return cached[2]
+
+        schema = nom_ingestion.read_nom_schema(schema_path)
+        visa_subclass_codes = get_visa_subclass_codes(schema, registry)
+        visa_subclass_codes_cache[schema_path] = (
+            schema_source,
+            registry["sources"],
+            visa_subclass_codes,
+        )
+
+        return visa_subclass_codes
+
+    schema_subclasses = list(schema["categories"].get("visa_subclass", []))
+
+    registry_subclasses = {
+        vsc
+        for mapping, mapper in registry.items()
+        if mapping != "sources"
+        for vsc in mapper.index
+    }
+
+    return pd.Index(
+        schema_subclasses + sorted(registry_subclasses.difference(schema_subclasses))
+    )
+
+
+def encode_visa_subclass(visa_subclass, visa_subclass_codes):
+    """
+    Return the global codes of visa subclasses, -1 for subclasses without a code.
+    Recoded by category, not row by row
+
+    Parameters
+    ----------
+    visa_subclass: array-like, series or categorical of visa subclasses as strings
+    visa_subclass_codes: index from get_visa_subclass_codes
+
+    Returns
+    -------
+    numpy array of integer codes
+    """
+
+    if not isinstance(getattr(visa_subclass, "dtype", None), pd.CategoricalDtype):
+        visa_subclass = pd.Series(visa_subclass).astype("category")
+
+    visa_subclass = pd.Categorical(visa_subclass)
+
+    # a missing value (code -1) takes the appended -1
+    recode = np.append(
+        visa_subclass_codes.get_indexer(visa_subclass.categories.astype(str)), -1
+    )
+
+    return recode.take(visa_subclass.codes)
+
+
+def map_visa_subclass(
+    visa_subclass, mapping="abs_group", visa_subclass_codes=None, registry=None
+):
+    """
+    Map visa subclasses through a visa registry mapping, by a numpy take of value
+    codes aligned with the global visa subclass codes
+
+    Parameters
+    ----------
+    visa_subclass: array-like, series or categorical of visa subclasses as strings
+    mapping: str, "abs_group", "label" or "reporting_category"
+    visa_subclass_codes: None or index from get_visa_subclass_codes
+    registry: None or dict from get_visa_registry, if None get_visa_registry()
+
+    Returns
+    -------
+    categorical of the mapped values, NaN where a subclass isn't mapped
+    """
+
+    if registry is None:
+        registry = get_visa_registry()
+
+    if visa_subclass_codes is None:
+        visa_subclass_codes = get_visa_subclass_codes(registry=registry)
+
+    values = pd.Categorical(
+        lookup_visa_subclass(visa_subclass_codes, mapping, registry)
+    )
+
+    # subclasses without a code (-1) take the appended -1 (unmapped)
+    value_codes = np.append(values.codes, -1)
+
+    return pd.Categorical.from_codes(
+        value_codes.take(encode_visa_subclass(visa_subclass, visa_subclass_codes)),
+        values.categories,
+    )
+
+
+def read_sacc_countries(country_path=None):
+    """
+    Read the SACC country names
+
+    Parameters
+    ----------
+    country_path: None or Path object of a csv with columns code, country.
+    If None, sacc_country_path
+
+    Returns
+    -------
+    series of country names indexed by integer SACC code
+
+    Raises
+    ------
+    ValueError
+        if there's no csv
+    """
+
+    if country_path is None:
+        country_path = sacc_country_path
+
+    if not country_path.exists():
+        raise ValueError(
+            f"Chris - no SACC country names at {country_path}, a csv of code, country"
+            " is needed to decode countries"
+        )
+
+    return (
+        pd.read_csv(country_path, dtype={"code": "int64", "country": str})
+        .drop_duplicates("code", keep="last")
+        .set_index("code")
+        .country
+    )
+
+
+def get_sacc_lookup(level="country", country_path=None):
+    """
+    Return a lookup from SACC code (0 to 9999) to category code, for a level of the
+    SACC hierarchy (see mappers.sacc_sub_region, mappers.sacc_region)
+
+    Parameters
+    ----------
+    level: str, "country", "sub_region" or "region"
+    country_path: None or Path object of the SACC country names csv, see
+    read_sacc_countries
+
+    Returns
+    -------
+    lookup: numpy array of 10,000 category codes, -1 for codes without a category
+    categories: index of the categories
+    """
+
+    if level not in sacc_levels:
+        raise ValueError(f"Chris - level must be one of {sacc_levels}, not {level}")
+
+    if country_path is None:
+        country_path = sacc_country_path
+
+    source = nom_ingestion.get_cache_source(country_path)
+    cached = sacc_lookup_cache.get((level, country_path))
+
+    if cached is not None and cached[0] == source:
+        return cached[1], cached[2]
+
+    sacc_codes = np.arange(10_000)
+
+    if level == "country":
+        values = read_sacc_countries(country_path).reindex(sacc_codes)
+
+    elif level == "sub_region":
+        values = pd.Series(sacc_codes // 100).map(mappers.sacc_sub_region)
+
+    else:
+        values = pd.Series(sacc_codes // 1000).map(mappers.sacc_region)
+
+    # factorize keeps the order of first appearance - code order; NaN is -1
+    lookup, categories = pd.factorize(np.asarray(values, dtype=object))
+
+    sacc_lookup_cache[(level, country_path)] = (source, lookup, categories)
+
+    return lookup, categories
+
+
+def decode_sacc(codes, level="country", country_path=None):
+    """
+    Decode SACC country codes to a level of the SACC hierarchy, via get_sacc_lookup
+
+    Parameters
+    ----------
+    codes: array-like or series of integer SACC codes, may contain missing values
+    level: str, "country", "sub_region" or "region"
+    country_path: None or Path object of the SACC country names csv, see
+    read_sacc_countries
+
+    Returns
+    -------
+    categorical, NaN for missing or unknown codes
+    """
+
+    lookup, categories = get_sacc_lookup(level, country_path)
+
+    # missing values are NaN, and compare False
+    codes = pd.to_numeric(pd.Series(codes, copy=False), errors="coerce").to_numpy(
+        dtype=float, na_value=np.nan
+    )
+    valid = (codes >= 0) & (codes < len(lookup))
+
+    category_codes = np.full(len(codes), -1, dtype=lookup.dtype)
+    category_codes[valid] = lookup.take(codes[valid].astype(np.int64))
+
+    return pd.Categorical.from_codes(category_codes, categories)
+
+
+def decode_sacc_columns(df, fields=None, levels=None, country_path=None):
+    """
+    Add decoded SACC columns to a dataframe of NOM unit records, named
+    {field}_{level}, eg country_of_birth_region
+
+    Parameters
+    ----------
+    df: dataframe of NOM unit records
+    fields: None or list of SACC code columns, if None those of sacc_fields in df
+    levels: None or list of levels, "country", "sub_region" and/or "region".
+    If None, all of sacc_levels
+    country_path: None or Path object of the SACC country names csv, see
+    read_sacc_countries
+
+    Returns
+    -------
+    dataframe
+    """
+
+    if fields is None:
+        fields = [field for field in sacc_fields if field in df.columns]
+
+    if levels is None:
+        levels = sacc_levels
+
+    return df.assign(
+        **{
+            f"{field}_{level}": decode_sacc(df[field].to_numpy(), level, country_path)
+            for field in fields
+            for level in levels
+        }
+    )
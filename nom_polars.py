@@ -0,0 +1,195 @@
+"""
+Polars backend for the NOM unit record pipeline
+"""
+
+import importlib.util
+
+import nom_ingestion
+
+
+# Backends for the unit record pipeline: polars is optional, pandas is the fallback
+nom_backends = ["pandas", "polars"]
+
+
+def get_nom_backend(backend="pandas"):
+    """
+    Check the unit record pipeline backend, falling back to pandas if polars is not
+    installed, or is too old to have pl.ScanCastOptions (used by scan_nom_polars)
+
+    Parameters
+    ----------
+    backend: str, "pandas" or "polars"
+
+    Returns
+    -------
+    backend: str, the backend available
+    """
+
+    if backend not in nom_backends:
+        raise ValueError(
+            f"Chris: backend must be one of {nom_backends}. You tried {backend}."
+        )
+
+    if backend == "polars" and importlib.util.find_spec("polars") is None:
+        print("polars is not installed - running the pandas backend")
+        backend = "pandas"
+
+    elif backend == "polars" and not hasattr(
+        importlib.import_module("polars"), "ScanCastOptions"
+    ):
+        print("polars has no ScanCastOptions, upgrade it - running the pandas backend")
+        backend = "pandas"
+
+    return backend
+
+
+def scan_nom_polars(file_paths, nom_fields, net_erp_effect=True, vsc_list=None):
+    """
+    A polars lazy query of the NOM unit record files, the polars backend equivalent of
+    nom_forecast.gen_get_visa_group(nom_forecast.gen_nom_fields(...), vsc_list)
+
+    Parameters
+    ----------
+    file_paths: iterable of Path objects to NOM parquet files
+    nom_fields: None or list of fields to select, if None all fields
+    net_erp_effect: boolean, default=True
+      if True, only return if net_erp = 1 or -1
+    vsc_list: None or list of visa subclasses to select, if None select all
+
+    Returns
+    -------
+    polars LazyFrame
+    """
+    import polars as pl
+
+    file_paths = [str(file_path) for file_path in file_paths]
+
+    if not file_paths:
+        raise ValueError("Chris - no NOM parquet files to scan")
+
+    # integer widths can differ between files written by different pipeline versions
+    lazy_frame = pl.scan_parquet(
+        file_paths,
+        missing_columns="insert",
+        cast_options=pl.ScanCastOptions(integer_cast="upcast"),
+    )
+
+    if net_erp_effect:
+        lazy_frame = lazy_frame.filter(pl.col("net_erp_effect") != 0)
+
+    if vsc_list is not None:
+        lazy_frame = lazy_frame.filter(
+            pl.col("visa_subclass").cast(pl.String).is_in(list(vsc_list))
+        )
+
+    if nom_fields is not None:
+        lazy_frame = lazy_frame.select(nom_fields)
+
+    return lazy_frame
+
+
+def collect_nom_polars(lazy_frame, schema=None):
+    """
+    Run a polars lazy query with the streaming engine and return a pandas dataframe
+    with the NOM schema dtypes if a schema is given, as from nom_forecast.gen_nom_fields
+
+    Parameters
+    ----------
+    lazy_frame: polars LazyFrame, eg from scan_nom_polars
+    schema: None or dict, see nom_ingestion.read_nom_schema and apply_nom_schema
+
+    Returns
+    -------
+    dataframe
+    """
+
+    df = lazy_frame.collect(engine="streaming").to_pandas()
+
+    # polars categoricals come back with their own categories
+    for col in df.select_dtypes("category"):
+        df[col] = df[col].astype(str)
+
+    return nom_ingestion.apply_nom_schema(df, schema)
+
+
+def get_monthly_polars(lazy_frame):
+    """
+    Sum NOM records by month, visa subclass and direction in a polars lazy query,
+    the polars backend equivalent of merging nom_forecast.gen_monthly_partials
+
+    Parameters
+    ----------
+    lazy_frame: polars LazyFrame of NOM records with duration_movement_date,
+      visa_subclass and net_erp_effect, eg from scan_nom_polars
+
+    Returns
+    -------
+    series: net_erp_effect summed by (month period, visa_subclass, direction),
+      or None if there are no records
+    """
+    import polars as pl
+
+    df = (
+        lazy_frame.with_columns(
+            pl.col("visa_subclass").cast(pl.String),
+            direction=pl.when(pl.col("net_erp_effect") == 1)
+            .then(pl.lit("arrival"))
+            .when(pl.col("net_erp_effect") == -1)
+            .then(pl.lit("departure")),
+        )
+        .drop_nulls("direction")
+        .group_by(
+            pl.col("duration_movement_date").dt.truncate("1mo").alias("month"),
+            "visa_subclass",
+            "direction",
+        )
+        .agg(pl.col("net_erp_effect").sum())
+        .collect(engine="streaming")
+        .to_pandas()
+    )
+
+    if df.empty:
+        return None
+
+    return (
+        df.assign(month=df.month.dt.to_period("M"))
+        .set_index(["month", "visa_subclass", "direction"])
+        .net_erp_effect.sort_index()
+    )
+
+
+def get_daily_polars(lazy_frame):
+    """
+    Sum unique movements by date, visa subclass and direction in a polars lazy query,
+    the polars backend equivalent of the daily sums in nom_forecast.get_NOM_monthly
+
+    Parameters
+    ----------
+    lazy_frame: polars LazyFrame of unique movements with date, visa_subclass
+      and net_erp_effect
+
+    Returns
+    -------
+    series: net_erp_effect summed by (date, visa_subclass, direction)
+    """
+    import polars as pl
+
+    df = (
+        lazy_frame.with_columns(
+            pl.col("visa_subclass").cast(pl.String),
+            direction=pl.when(pl.col("net_erp_effect") == 1)
+            .then(pl.lit("arrival"))
+            .when(pl.col("net_erp_effect") == -1)
+            .then(pl.lit("departure")),
+        )
+        .drop_nulls("direction")
+        .group_by("date", "visa_subclass", "direction")
+        .agg(pl.col("net_erp_effect").sum())
+        .collect(engine="streaming")
+        .to_pandas()
+    )
+
+    return (
+        df.set_index(["date", "visa_subclass", "direction"])
+        .net_erp_effect.sort_index()
+    )
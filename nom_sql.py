@@ -0,0 +1,361 @@
+"""
+SQL (DuckDB) backend for queries of the NOM parquet files
+"""
+
+import time
+import pandas as pd
+
+import nom_forecast as nomf
+import nom_lookups
+
+
+# DuckDB is optional, pandas is the fallback: threads used, if None all cpus
+sql_threads = None
+
+
+def connect_nom_sql(threads=None):
+    """
+    Return an in-process DuckDB connection, or None if duckdb is not installed
+
+    Parameters
+    ----------
+    threads: None or int, number of threads DuckDB uses, if None sql_threads
+
+    Returns
+    -------
+    duckdb connection or None
+    """
+
+    try:
+        import duckdb
+    except ImportError:
+        print("duckdb is not installed - running the pandas implementation")
+        return None
+
+    connection = duckdb.connect()
+
+    if threads is None:
+        threads = sql_threads
+
+    if threads is not None:
+        connection.execute(f"SET threads TO {int(threads)}")
+
+    return connection
+
+
+def sql_parquet_files(file_paths):
+    """
+    Return the DuckDB read_parquet table function over a list of parquet files
+
+    Parameters
+    ----------
+    file_paths: iterable of Path objects
+
+    Returns
+    -------
+    str: eg "read_parquet(['a.parquet'], union_by_name=true, filename=true)"
+    """
+
+    file_list = ", ".join(
+        "'" + str(file_path).replace("'", "''") + "'" for file_path in file_paths
+    )
+
+    if not file_list:
+        raise ValueError("Chris - no parquet files to query")
+
+    return f"read_parquet([{file_list}], union_by_name=true, filename=true)"
+
+
+def get_nom_file_fields_sql(data_folder, abs_visagroup_exists=False, connection=None):
+    """
+    NOM by ABS visa group, year and visa subclass for each NOM file, using DuckDB.
+    The DuckDB equivalent of pd.concat(nom_forecast.get_nom_file_fields(...))
+
+    Parameters
+    ----------
+    data_folder: path object (pathlib.Path) to folder of parquet files
+    abs_visagroup_exists: boolean, True if only loop over post 2011Q2 files
+    connection: None or DuckDB connection, if None use connect_nom_sql
+
+    Returns
+    -------
+    series: net_erp_effect indexed by visa_group, duration_movement_date (year),
+    visa_subclass
+    """
+
+    nom_fields = [
+        "visa_group",
+        "duration_movement_date",
+        "visa_subclass",
+        "net_erp_effect",
+    ]
+
+    if connection is None:
+        connection = connect_nom_sql()
+
+    if connection is None:
+        return pd.concat(
+            nomf.get_nom_file_fields(data_folder, nom_fields, abs_visagroup_exists)
+        )
+
+    file_paths = nomf.get_nom_parquet_files(data_folder, abs_visagroup_exists)
+
+    query = f"""
+        SELECT
+            filename,
+            visa_group,
+            year(duration_movement_date) AS duration_movement_date,
+            visa_subclass,
+            sum(net_erp_effect) AS net_erp_effect
+        FROM {sql_parquet_files(file_paths)}
+        WHERE net_erp_effect != 0 AND visa_group IS NOT NULL
+        GROUP BY ALL
+        ORDER BY filename, visa_group, duration_movement_date, visa_subclass
+    """
+
+    return (
+        connection.sql(query)
+        .df()
+        .set_index(["visa_group", "duration_movement_date", "visa_subclass"])
+        .net_erp_effect
+    )
+
+
+def query_NOM_final_preliminary_sql(data_folder, arrival, connection):
+    """
+    Monthly arrivals or departures by visa subclass from the final and preliminary
+    unique movement files, as a DuckDB relation with columns: date, visa_subclass, nom
+    """
+
+    file_paths = [
+        data_folder / "NOM unique movement - final.parquet",
+        data_folder / "NOM unique movement - preliminary.parquet",
+    ]
+
+    # propensity values in the preliminary file, final NOM has 1, -1
+    direction = "net_erp_effect > 0" if arrival else "net_erp_effect < 0"
+
+    # round_even rounds half to even, as does pandas round
+    query = f"""
+        SELECT
+            last_day(date) AS date,
+            visa_subclass,
+            abs(round_even(sum(net_erp_effect), 0)) AS nom
+        FROM {sql_parquet_files(file_paths)}
+        WHERE {direction}
+        GROUP BY ALL
+    """
+
+    return connection.sql(query)
+
+
+def get_NOM_final_preliminary_sql(
+    data_folder=nomf.individual_movements_folder, arrival=True, connection=None
+):
+    """
+    Return dataframe of monthly data by visa subclass, using DuckDB.
+    The DuckDB equivalent of nom_forecast.get_NOM_final_preliminary
+
+    Parameters
+    ----------
+    data_folder: Path object to the folder of the unique movement files
+    arrival: Boolean, flag to get departure or arrival data
+    connection: None or DuckDB connection, if None use connect_nom_sql
+
+    Returns
+    -------
+    dataframe
+    """
+
+    if connection is None:
+        connection = connect_nom_sql()
+
+    if connection is None:
+        return nomf.get_NOM_final_preliminary(data_folder, arrival)
+
+    return (
+        query_NOM_final_preliminary_sql(data_folder, arrival, connection)
+        .df()
+        .set_index(["date", "visa_subclass"])
+        .nom.unstack("visa_subclass")
+        .sort_index(axis="columns")
+        .resample("M")
+        .sum()
+        .astype(int)
+    )
+
+
+def tidy_NOM_final_preliminary_sql(
+    data_folder=nomf.individual_movements_folder, arrival=True, connection=None
+):
+    """
+    Return tidy monthly data by visa subclass, using DuckDB. The DuckDB equivalent of
+    nom_forecast.tidy__by_visa_subclass(nom_forecast.get_NOM_final_preliminary(...))
+
+    Parameters
+    ----------
+    data_folder: Path object to the folder of the unique movement files
+    arrival: Boolean, flag to get departure or arrival data
+    connection: None or DuckDB connection, if None use connect_nom_sql
+
+    Returns
+    -------
+    a tidy dataframe of nom by month, abs_group, visa_label, visa_subclass, nom
+    """
+
+    if connection is None:
+        connection = connect_nom_sql()
+
+    if connection is None:
+        return nomf.tidy__by_visa_subclass(
+            nomf.get_NOM_final_preliminary(data_folder, arrival)
+        )
+
+    # the mappers as key, value tables
+    visa_registry = nom_lookups.get_visa_registry()
+
+    visa_labels = (
+        visa_registry["label"]
+        .rename_axis("key")
+        .rename("value")
+        .reset_index()
+        .astype({"key": str})
+    )
+    abs_groupings = (
+        visa_registry["abs_group"]
+        .rename_axis("key")
+        .rename("value")
+        .reset_index()
+        .astype({"key": str})
+    )
+
+    query_NOM_final_preliminary_sql(data_folder, arrival, connection).create_view(
+        "monthly"
+    )
+    connection.register("visa_labels", visa_labels)
+    connection.register("abs_groupings", abs_groupings)
+
+    # zero entries are removed, so contiguous data can be identified later
+    return connection.sql(
+        """
+        SELECT
+            monthly.date,
+            abs_groupings.value AS abs_grouping,
+            visa_labels.value AS visa_label,
+            monthly.visa_subclass,
+            CAST(monthly.nom AS BIGINT) AS nom
+        FROM monthly
+        LEFT JOIN visa_labels ON monthly.visa_subclass = visa_labels.key
+        LEFT JOIN abs_groupings ON monthly.visa_subclass = abs_groupings.key
+        WHERE monthly.nom != 0
+        ORDER BY monthly.visa_subclass, monthly.date
+        """
+    ).df()
+
+
+def benchmark_sql_backend(
+    data_folder=nomf.individual_movements_folder,
+    characteristics_folder=nomf.abs_traveller_characteristics_folder,
+):
+    """
+    Compare the DuckDB queries with the pandas implementations: are the results equal,
+    and the seconds each takes. No cached results (eg the monthly cube) are used
+
+    Parameters
+    ----------
+    data_folder: Path object to the folder of the unique movement files
+    characteristics_folder: Path object to folder of NOM unit record parquet files
+
+    Returns
+    -------
+    dataframe indexed by query with columns: equal, pandas_seconds, sql_seconds, speedup
+    """
+
+    connection = connect_nom_sql()
+
+    if connection is None:
+        raise ValueError("Chris - benchmark_sql_backend needs duckdb installed")
+
+    nom_fields = [
+        "visa_group",
+        "duration_movement_date",
+        "visa_subclass",
+        "net_erp_effect",
+    ]
+
+    def normalise(result):
+        # compare values, not the order or categorical dtypes of the labels,
+        # nor the resolution of dates (DuckDB dates are datetime64[us])
+        if isinstance(result, pd.DataFrame):
+            result = result.astype(
+                {col: object for col in result.select_dtypes("category")}
+            )
+            result = result.astype(
+                {col: "datetime64[ns]" for col in result.select_dtypes("datetime")}
+            )
+
+        if isinstance(result.index, pd.DatetimeIndex):
+            result.index = result.index.astype("datetime64[ns]")
+
+        if isinstance(result, pd.Series):
+            # NOM by visa group, year and visa subclass
+            result = result.reset_index()
+            labels = list(result.columns[:-1])
+            # the same labels can come from several NOM files, so sort on values too
+            result = result.astype({col: str for col in labels}).sort_values(
+                list(result.columns), ignore_index=True
+            )
+
+        elif "visa_subclass" in result.columns:
+            # tidy data
+            result = result.astype({"visa_subclass": str}).sort_values(
+                ["visa_subclass", "date"], ignore_index=True
+            )
+
+        else:
+            # monthly data with a column for each visa subclass
+            result = result.rename(columns=str).sort_index(axis="columns")
+            result.columns = pd.Index(list(result.columns), name=result.columns.name)
+
+        return result.astype({col: "int64" for col in result.select_dtypes("number")})
+
+    queries = {
+        "get_nom_file_fields": (
+            lambda: pd.concat(
+                nomf.get_nom_file_fields(characteristics_folder, nom_fields)
+            ),
+            lambda: get_nom_file_fields_sql(
+                characteristics_folder, connection=connection
+            ),
+        ),
+        "get_NOM_final_preliminary": (
+            lambda: nomf.get_NOM_final_preliminary(data_folder),
+            lambda: get_NOM_final_preliminary_sql(data_folder, connection=connection),
+        ),
+        "tidy__by_visa_subclass": (
+            lambda: nomf.tidy__by_visa_subclass(
+                nomf.get_NOM_final_preliminary(data_folder)
+            ),
+            lambda: tidy_NOM_final_preliminary_sql(data_folder, connection=connection),
+        ),
+    }
+
+    benchmark = {}
+
+    for query, (get_pandas, get_sql) in queries.items():
+        start = time.perf_counter()
+        pandas_result = get_pandas()
+        pandas_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sql_result = get_sql()
+        sql_seconds = time.perf_counter() - start
+
+        benchmark[query] = {
+            "equal": normalise(pandas_result).equals(normalise(sql_result)),
+            "pandas_seconds": pandas_seconds,
+            "sql_seconds": sql_seconds,
+            "speedup": pandas_seconds / sql_seconds,
+        }
+
+    return pd.DataFrame.from_dict(benchmark, orient="index").rename_axis("query")
@@ -0,0 +1,315 @@
+"""
+Shared fixtures for the NOM pipeline tests: small synthetic SAS frames and a
+fake pandas SAS reader, so ingestion runs without ABS data, and a writer of
+real sas7bdat files for the readers themselves
+"""
+
+import ctypes
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import nom_forecast as nf  # noqa: E402
+import nom_ingestion  # noqa: E402
+import nom_lookups  # noqa: E402
+
+
+def make_sas_df(n, final=True, seed=0, visa_subclasses=None):
+    """
+    Return a synthetic SAS NOM dataframe, as pd.read_sas returns it (numbers as floats)
+
+    Parameters
+    ----------
+    n: int, rows
+    final: boolean, True for final NOM columns, False for preliminary
+    seed: int, random seed
+    visa_subclasses: None or list of visa subclasses to draw from
+    """
+
+    rng = np.random.default_rng(seed)
+
+    if visa_subclasses is None:
+        visa_subclasses = ["010", "417", "500", "572", "600", "820"]
+
+    ints = nom_ingestion.nom_ints_final if final else nom_ingestion.nom_ints_preliminary
+    df = {col: rng.integers(0, 2, n).astype(float) for col in ints}
+
+    df["person_id"] = np.arange(n, dtype=float)
+    df["net_erp_effect"] = rng.choice([-1.0, 0.0, 1.0], n)
+    df["nom_propensity"] = rng.choice([-1.0, 0.0, 1.0], n)
+    for col in ["country_of_birth", "country_of_citizenship", "country_of_stay"]:
+        df[col] = rng.choice([1101.0, 1201.0, 2102.0, 5105.0, 7103.0], n)
+
+    for col in nom_ingestion.nom_string_vars:
+        df[col] = rng.choice(["A", "B"], n).astype(object)
+    df["visa_subclass"] = rng.choice(visa_subclasses, n).astype(object)
+    df["state"] = rng.choice(["01", "02", "05", "I", "09"], n).astype(object)
+    df["direction"] = rng.choice(["A", "D"], n).astype(object)
+
+    df["Duration_movement_date"] = pd.Timestamp("2019-01-01") + pd.to_timedelta(
+        rng.integers(0, 365, n), "D"
+    )
+
+    return pd.DataFrame(df)
+
+
+def write_sas7bdat(df, sas_path):
+    """
+    Write the numeric and string columns of df as a real sas7bdat file, with the
+    readstat writer shipped in pyreadstat (the test is skipped without pyreadstat)
+
+    Column labels are set to the column names, as pandas reads the names from them
+
+    Parameters
+    ----------
+    df: dataframe of float and object (string) columns, missing values as NaN
+    sas_path: Path object of the sas7bdat file
+    """
+
+    pyreadstat_writer = pytest.importorskip("pyreadstat._readstat_writer")
+    lib = ctypes.CDLL(pyreadstat_writer.__file__)
+    data_writer_type = ctypes.CFUNCTYPE(
+        ctypes.c_ssize_t, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p
+    )
+
+    lib.readstat_writer_init.restype = ctypes.c_void_p
+    lib.readstat_set_data_writer.argtypes = [ctypes.c_void_p, data_writer_type]
+    lib.readstat_add_variable.restype = ctypes.c_void_p
+    lib.readstat_add_variable.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_size_t,
+    ]
+    lib.readstat_variable_set_label.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+    lib.readstat_begin_writing_sas7bdat.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_void_p,
+        ctypes.c_long,
+    ]
+    lib.readstat_insert_double_value.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_void_p,
+        ctypes.c_double,
+    ]
+    lib.readstat_insert_string_value.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_void_p,
+        ctypes.c_char_p,
+    ]
+    lib.readstat_insert_missing_value.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+    for function in [
+        "readstat_begin_row",
+        "readstat_end_row",
+        "readstat_end_writing",
+        "readstat_writer_free",
+    ]:
+        getattr(lib, function).argtypes = [ctypes.c_void_p]
+
+    with open(sas_path, "wb") as sas_file:
+
+        @data_writer_type
+        def data_writer(data, length, ctx):
+            sas_file.write(ctypes.string_at(data, length))
+            return length
+
+        writer = lib.readstat_writer_init()
+        lib.readstat_set_data_writer(writer, data_writer)
+
+        variables = []
+        for col in df.columns:
+            if pd.api.types.is_numeric_dtype(df[col]):
+                variable = lib.readstat_add_variable(writer, col.encode(), 5, 8)
+            else:
+                width = max(1, df[col].dropna().str.len().max())
+                variable = lib.readstat_add_variable(writer, col.encode(), 0, width)
+            lib.readstat_variable_set_label(variable, col.encode())
+            variables.append((variable, df[col].to_numpy()))
+
+        assert lib.readstat_begin_writing_sas7bdat(writer, None, len(df)) == 0
+
+        for i in range(len(df)):
+            lib.readstat_begin_row(writer)
+            for variable, values in variables:
+                if pd.isna(values[i]):
+                    lib.readstat_insert_missing_value(writer, variable)
+                elif isinstance(values[i], str):
+                    lib.readstat_insert_string_value(
+                        writer, variable, values[i].encode("latin-1")
+                    )
+                else:
+                    lib.readstat_insert_double_value(writer, variable, values[i])
+            lib.readstat_end_row(writer)
+
+        assert lib.readstat_end_writing(writer) == 0
+        lib.readstat_writer_free(writer)
+
+    return sas_path
+
+
+class FakeSASReader:
+    """
+    Stands in for the reader pd.read_sas returns with chunksize
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return None
+
+    def read(self, nrows):
+        df = self.df.iloc[self.position : self.position + nrows].reset_index(drop=True)
+        self.position += nrows
+        return df
+
+
+@pytest.fixture
+def sas_frames(monkeypatch):
+    """
+    Dict of SAS file name to dataframe - pd.read_sas reads from it
+    """
+
+    frames = {}
+
+    def read_sas(sas_file, encoding=None, format=None, chunksize=None):
+        df = frames[Path(getattr(sas_file, "name", sas_file)).name]
+
+        if chunksize:
+            return FakeSASReader(df)
+
+        return df.copy()
+
+    monkeypatch.setattr(pd, "read_sas", read_sas)
+
+    return frames
+
+
+@pytest.fixture
+def nom_folders(tmp_path, monkeypatch):
+    """
+    A SAS data folder and analysis folder, and a NOM schema file in tmp_path
+    """
+
+    sas_folder = tmp_path / "sas"
+    analysis_folder = tmp_path / "analysis"
+    sas_folder.mkdir()
+    analysis_folder.mkdir()
+
+    monkeypatch.setattr(nom_ingestion, "nom_schema_path", tmp_path / "schema.json")
+
+    return sas_folder, analysis_folder
+
+
+def add_sas_file(sas_folder, sas_frames, name, df):
+    """
+    Register a synthetic SAS file (an empty file named for it, read from sas_frames)
+    """
+
+    (sas_folder / name).touch()
+    sas_frames[name] = df
+
+    return sas_folder / name
+
+
+@pytest.fixture
+def nom_analysis_folder(sas_frames, nom_folders):
+    """
+    An analysis folder of NOM parquet files: final 2018q4 and 2019q1 and
+    preliminary 2019q2, ingested from synthetic SAS files
+    """
+
+    sas_folder, analysis_folder = nom_folders
+
+    add_sas_file(sas_folder, sas_frames, "fnom2018q4.sas7bdat", make_sas_df(2_000))
+    add_sas_file(
+        sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(2_000, seed=1)
+    )
+    add_sas_file(
+        sas_folder, sas_frames, "pnom2019q2.sas7bdat", make_sas_df(1_000, False, seed=2)
+    )
+
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder)
+
+    return analysis_folder
+
+
+@pytest.fixture
+def visa_dictionaries(tmp_path, monkeypatch):
+    """
+    A dictionary folder with synthetic visa dictionaries: the ABS 3412 mapping and
+    the visa subclass reference
+    """
+
+    dict_folder = tmp_path / "dictionaries"
+    dict_folder.mkdir()
+
+    monkeypatch.setattr(nom_lookups, "dict_data_folder", dict_folder)
+    monkeypatch.setattr(
+        nom_lookups, "visa_registry_path", dict_folder / "visa_mapping_registry.arrow"
+    )
+    monkeypatch.setattr(nom_lookups, "visa_registry_cache", {})
+    monkeypatch.setattr(nom_lookups, "visa_subclass_codes_cache", {})
+
+    pd.DataFrame(
+        {
+            "Visa subclass code": ["010", "417", "500", "572", "600", "820"],
+            "Visa subclass label": [
+                "Bridging A",
+                "Working Holiday",
+                "Student",
+                "VET",
+                "Visitor",
+                "Partner",
+            ],
+            "Migration publication category": [
+                "Other",
+                "Working holiday",
+                "Higher education sector",
+                "Student  VET",
+                "Visitor",
+                "Family",
+            ],
+        }
+    ).to_excel(dict_folder / "ABS - Visacode3412mapping.xlsx", index=False)
+
+    pd.DataFrame(
+        {
+            "VISA_SUBCLASS_DS": [
+                "Bridging A",
+                "Working Holiday",
+                "Student",
+                "VET",
+                "Visitor",
+                "Partner",
+            ]
+        },
+        index=pd.Index(["010", "417", "500", "572", "600", "820"], name="visa_subclass"),
+    ).to_parquet(dict_folder / "REF_VISA_SUBCLASS.parquet")
+
+    return dict_folder
+
+
+@pytest.fixture
+def unique_movements_folder(nom_analysis_folder, tmp_path, monkeypatch):
+    """
+    A folder of the final and preliminary unique movement files of nom_analysis_folder
+    """
+
+    movements_folder = tmp_path / "movements"
+    movements_folder.mkdir()
+    monkeypatch.setattr(nf, "individual_movements_folder", movements_folder)
+
+    nf.make_unique_movement_files(nom_analysis_folder, nom_final=True)
+    nf.make_unique_movement_files(nom_analysis_folder, nom_final=False)
+
+    return movements_folder
@@ -0,0 +1,80 @@
+"""
+Tests of the external merge sort of unique movement files
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import nom_forecast as nf
+
+
+def test_external_sort_matches_in_memory_sort(nom_analysis_folder, tmp_path, monkeypatch):
+    movements_folder = tmp_path / "movements"
+    movements_folder.mkdir()
+    monkeypatch.setattr(nf, "individual_movements_folder", movements_folder)
+
+    df = nf.make_unique_movement_files(nom_analysis_folder)
+    file_path = nf.make_unique_movement_files_external(
+        nom_analysis_folder, batch_rows=100
+    )
+
+    sorted_df = pd.read_parquet(file_path)
+
+    assert list(movements_folder.iterdir()) == [file_path]
+    pd.testing.assert_frame_equal(
+        sorted_df[["date", "person_id"]], df[["date", "person_id"]].reset_index(drop=True)
+    )
+    assert sorted(sorted_df.visa_subclass.astype(str)) == sorted(
+        df.visa_subclass.astype(str)
+    )
+
+
+def test_merge_runs_with_different_categories(tmp_path):
+    rng = np.random.default_rng(0)
+    vsc_lists = [["000", "001"], [f"{vsc:03d}" for vsc in range(300)]]
+
+    run_paths = []
+    for i, vsc_list in enumerate(vsc_lists):
+        run = pd.DataFrame(
+            {
+                "date": pd.Timestamp("2019-01-01")
+                + pd.to_timedelta(rng.integers(0, 100, 1_000), "D"),
+                "person_id": rng.integers(0, 10_000, 1_000),
+                "visa_subclass": pd.Categorical(rng.choice(vsc_list, 1_000)),
+            }
+        ).sort_values(["date", "person_id"])
+
+        run_paths.append(tmp_path / f"run_{i}.parquet")
+        run.to_parquet(run_paths[-1], index=False)
+
+    file_path = tmp_path / "merged.parquet"
+    nf.merge_sorted_runs(run_paths, ["date", "person_id"], file_path, batch_rows=64)
+
+    merged = pd.read_parquet(file_path)
+    runs = pd.concat([pd.read_parquet(run_path) for run_path in run_paths])
+
+    assert len(merged) == 2_000
+    assert merged.set_index(["date", "person_id"]).index.is_monotonic_increasing
+    assert sorted(merged.visa_subclass.astype(str)) == sorted(
+        runs.visa_subclass.astype(str)
+    )
+
+
+def test_failed_merge_removes_staging_and_run_files(
+    nom_analysis_folder, tmp_path, monkeypatch
+):
+    movements_folder = tmp_path / "movements"
+    movements_folder.mkdir()
+    monkeypatch.setattr(nf, "individual_movements_folder", movements_folder)
+
+    def merge_sorted_runs(run_paths, sort_columns, file_path, batch_rows):
+        file_path.write_bytes(b"partly written")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(nf, "merge_sorted_runs", merge_sorted_runs)
+
+    with pytest.raises(OSError):
+        nf.make_unique_movement_files_external(nom_analysis_folder)
+
+    assert list(movements_folder.iterdir()) == []
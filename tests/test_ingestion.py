@@ -0,0 +1,188 @@
+"""
+Tests of converting SAS NOM files to parquet (process_original_ABS_data)
+"""
+
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import nom_ingestion
+from conftest import add_sas_file, make_sas_df
+
+
+def read_sorted(file_path):
+    return pd.read_parquet(file_path).sort_values("person_id", ignore_index=True)
+
+
+def test_chunked_matches_whole(sas_frames, nom_folders, monkeypatch):
+    sas_folder, analysis_folder = nom_folders
+    monkeypatch.setattr(nom_ingestion, "sas_sample_rows", 500)
+
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(5_000))
+
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder)
+    whole = read_sorted(analysis_folder / "traveller_characteristics2019q1.parquet")
+
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, memory_budget_mb=1
+    )
+    file_path = analysis_folder / "traveller_characteristics2019q1.parquet"
+
+    pd.testing.assert_frame_equal(
+        read_sorted(file_path), whole, check_categorical=False
+    )
+
+
+def test_chunked_more_categories_than_first_chunk(sas_frames, nom_folders, monkeypatch):
+    # the first chunk has 2 visa subclasses, later chunks 300 - more than an
+    # int8 dictionary index can hold
+    sas_folder, analysis_folder = nom_folders
+    monkeypatch.setattr(nom_ingestion, "sas_sample_rows", 100)
+
+    vsc_list = [f"{vsc:03d}" for vsc in range(300)]
+    df = make_sas_df(3_000, visa_subclasses=vsc_list)
+    df.loc[:99, "visa_subclass"] = "010"
+    df.loc[100:, "visa_subclass"] = [vsc_list[i % 300] for i in range(2_900)]
+
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", df)
+
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, memory_budget_mb=1
+    )
+
+    file_path = analysis_folder / "traveller_characteristics2019q1.parquet"
+    assert pq.ParquetFile(file_path).metadata.num_row_groups > 1
+
+    written = read_sorted(file_path)
+    assert written.visa_subclass.astype(str).tolist() == df.visa_subclass.tolist()
+
+
+def test_zipped_sas_file_is_read_from_the_zip(sas_frames, nom_folders):
+    sas_folder, analysis_folder = nom_folders
+    sas_frames["fnom2019q1.sas7bdat"] = make_sas_df(1_000)
+
+    with zipfile.ZipFile(sas_folder / "fnom2019q1.zip", "w") as zipped_file:
+        zipped_file.writestr("fnom2019q1.sas7bdat", b"sas")
+
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder)
+
+    assert not (sas_folder / "fnom2019q1.sas7bdat").exists()
+    file_path = analysis_folder / "traveller_characteristics2019q1.parquet"
+    assert len(read_sorted(file_path)) == 1_000
+
+
+def test_zip_with_several_files_raises(nom_folders):
+    sas_folder, analysis_folder = nom_folders
+
+    with zipfile.ZipFile(sas_folder / "fnom2019q1.zip", "w") as zipped_file:
+        zipped_file.writestr("fnom2019q1.sas7bdat", b"sas")
+        zipped_file.writestr("fnom2019q2.sas7bdat", b"sas")
+
+    with pytest.raises(ValueError):
+        list(nom_ingestion.gen_abs_sas_files(sas_folder))
+
+
+def test_worker_pool_commits_final_over_preliminary(sas_frames, nom_folders, monkeypatch):
+    # the fake SAS reader only exists in this process, so workers are threads
+    sas_folder, analysis_folder = nom_folders
+    monkeypatch.setattr(nom_ingestion, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+    add_sas_file(sas_folder, sas_frames, "pnom2019q1.sas7bdat", make_sas_df(500, False))
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder)
+    (sas_folder / "pnom2019q1.sas7bdat").unlink()
+
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(800))
+    add_sas_file(sas_folder, sas_frames, "pnom2019q2.sas7bdat", make_sas_df(300, False))
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder, max_workers=2)
+
+    assert sorted(file_path.name for file_path in analysis_folder.glob("*.parquet")) == [
+        "traveller_characteristics2019q1.parquet",
+        "traveller_characteristics2019q2_p.parquet",
+    ]
+
+
+def test_incremental_skips_unchanged_files(sas_frames, nom_folders, monkeypatch):
+    sas_folder, analysis_folder = nom_folders
+    q1_path = add_sas_file(
+        sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(200)
+    )
+    add_sas_file(sas_folder, sas_frames, "fnom2019q2.sas7bdat", make_sas_df(200, seed=1))
+
+    converted = []
+
+    def convert_abs_sas_file(abs_filepath, zip_filepath, **kwargs):
+        converted.append(abs_filepath.name)
+        return convert(abs_filepath, zip_filepath, **kwargs)
+
+    convert = nom_ingestion.convert_abs_sas_file
+    monkeypatch.setattr(nom_ingestion, "convert_abs_sas_file", convert_abs_sas_file)
+
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, incremental=True
+    )
+    assert converted == ["fnom2019q1.sas7bdat", "fnom2019q2.sas7bdat"]
+    assert (sas_folder / nom_ingestion.ingestion_manifest_name).exists()
+
+    # touched, but the same content
+    converted.clear()
+    os.utime(q1_path, ns=(0, 0))
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, incremental=True
+    )
+    assert converted == []
+
+    # a new delivery
+    converted.clear()
+    q1_path.write_bytes(b"new delivery")
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, incremental=True
+    )
+    assert converted == ["fnom2019q1.sas7bdat"]
+
+    # the parquet file was deleted
+    converted.clear()
+    (analysis_folder / "traveller_characteristics2019q2.parquet").unlink()
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, incremental=True
+    )
+    assert converted == ["fnom2019q2.sas7bdat"]
+
+
+def test_parquet_published_to_both_folders(sas_frames, nom_folders):
+    sas_folder, analysis_folder = nom_folders
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(300))
+
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder)
+
+    filename = "traveller_characteristics2019q1.parquet"
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(sas_folder / filename), pd.read_parquet(analysis_folder / filename)
+    )
+    assert not list(sas_folder.glob("*.tmp")) and not list(analysis_folder.glob("*.tmp"))
+
+
+def test_failed_write_keeps_the_published_file(sas_frames, nom_folders):
+    sas_folder, analysis_folder = nom_folders
+    abs_filepath = add_sas_file(
+        sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(300)
+    )
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder)
+
+    file_path = analysis_folder / "traveller_characteristics2019q1.parquet"
+    published = pd.read_parquet(file_path)
+
+    def gen_failing_chunks():
+        yield make_sas_df(100, seed=1).rename(columns=str.lower)
+        raise OSError("SAS file truncated")
+
+    with pytest.raises(OSError):
+        nom_ingestion.write_outfile_chunked(
+            gen_failing_chunks(), abs_filepath, sas_folder, analysis_folder
+        )
+
+    pd.testing.assert_frame_equal(pd.read_parquet(file_path), published)
+    assert not list(sas_folder.glob("*.tmp")) and not list(analysis_folder.glob("*.tmp"))
@@ -0,0 +1,107 @@
+"""
+Tests of the analysis folder layouts and row clustering
+"""
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import nom_forecast as nf
+import nom_ingestion
+from conftest import add_sas_file, make_sas_df
+
+
+def test_partitioned_layout(sas_frames, nom_folders):
+    sas_folder, analysis_folder = nom_folders
+    add_sas_file(sas_folder, sas_frames, "fnom2018q4.sas7bdat", make_sas_df(100))
+    add_sas_file(sas_folder, sas_frames, "pnom2019q1.sas7bdat", make_sas_df(100, False))
+
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, partitioned=True
+    )
+
+    final_path = (
+        analysis_folder
+        / "status=final/year=2018/quarter=4/traveller_characteristics2018q4.parquet"
+    )
+    preliminary_path = (
+        analysis_folder
+        / "status=preliminary/year=2019/quarter=1/traveller_characteristics2019q1_p.parquet"
+    )
+
+    assert final_path.exists() and preliminary_path.exists()
+    assert list(nf.gen_nom_files(analysis_folder)) == [final_path]
+    assert list(nf.gen_nom_files(analysis_folder, nom_final=False)) == [preliminary_path]
+    assert list(nf.gen_nom_files(analysis_folder, year_start=2019)) == []
+
+
+def test_final_file_replaces_partitioned_preliminary_file(sas_frames, nom_folders):
+    sas_folder, analysis_folder = nom_folders
+    add_sas_file(sas_folder, sas_frames, "pnom2019q1.sas7bdat", make_sas_df(100, False))
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, partitioned=True
+    )
+
+    (sas_folder / "pnom2019q1.sas7bdat").unlink()
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(100))
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, partitioned=True
+    )
+
+    assert not (analysis_folder / "status=preliminary").exists()
+    assert [file_path.name for file_path in nf.gen_nom_files(analysis_folder)] == [
+        "traveller_characteristics2019q1.parquet"
+    ]
+
+
+def ingest_one_file(sas_frames, nom_folders, **kwargs):
+    sas_folder, analysis_folder = nom_folders
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(2_000))
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder, **kwargs)
+
+    return analysis_folder / "traveller_characteristics2019q1.parquet"
+
+
+def is_clustered(file_path):
+    df = pd.read_parquet(file_path, columns=nom_ingestion.nom_cluster_columns)
+
+    return (
+        df.visa_subclass.astype(str) + df.duration_movement_date.astype(str)
+    ).is_monotonic_increasing
+
+
+def test_rows_not_clustered_by_default(sas_frames, nom_folders):
+    assert not is_clustered(ingest_one_file(sas_frames, nom_folders))
+
+
+def test_rows_clustered_by_visa_subclass_and_date(sas_frames, nom_folders):
+    assert is_clustered(ingest_one_file(sas_frames, nom_folders, cluster=True))
+
+
+def test_chunks_clustered_on_their_own(sas_frames, nom_folders, monkeypatch):
+    monkeypatch.setattr(nom_ingestion, "sas_sample_rows", 500)
+
+    file_path = ingest_one_file(
+        sas_frames, nom_folders, cluster=True, memory_budget_mb=0.5
+    )
+
+    assert pq.ParquetFile(file_path).metadata.num_row_groups > 1
+    assert not is_clustered(file_path)
+    for i in range(pq.ParquetFile(file_path).metadata.num_row_groups):
+        row_group = pq.ParquetFile(file_path).read_row_group(i).to_pandas()
+        assert (
+            row_group.visa_subclass.astype(str)
+            + row_group.duration_movement_date.astype(str)
+        ).is_monotonic_increasing
+
+
+def test_row_groups_skipped_by_visa_subclass(sas_frames, nom_folders):
+    file_path = ingest_one_file(sas_frames, nom_folders, cluster=True)
+    clustered = pd.read_parquet(file_path)
+
+    small_groups_path = file_path.parent.parent / "small_groups.parquet"
+    clustered.to_parquet(small_groups_path, row_group_size=100)
+    assert pq.ParquetFile(small_groups_path).metadata.num_row_groups == 20
+
+    row_groups = nom_ingestion.get_row_groups_read(small_groups_path, ["010"])
+
+    assert 0 < row_groups["row_groups_read"] < row_groups["row_groups"]
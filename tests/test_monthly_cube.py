@@ -0,0 +1,94 @@
+"""
+Tests of the monthly cube against get_NOM_final_preliminary
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import nom_forecast as nf
+
+
+def get_expected(data_folder, arrival):
+    # get_NOM_final_preliminary before the monthly cube
+    final = pd.read_parquet(data_folder / "NOM unique movement - final.parquet")
+    prelim = pd.read_parquet(data_folder / "NOM unique movement - preliminary.parquet")
+
+    if arrival:
+        idx_final, idx_prelim = final.net_erp_effect > 0, prelim.net_erp_effect > 0
+    else:
+        idx_final, idx_prelim = final.net_erp_effect < 0, prelim.net_erp_effect < 0
+
+    df = pd.concat([final[idx_final], prelim[idx_prelim]], axis="rows")
+
+    return (
+        df.astype({"visa_subclass": str})
+        .groupby(["date", "visa_subclass"])
+        .net_erp_effect.sum()
+        .unstack("visa_subclass")
+        .sort_index(axis="columns")
+        .resample("M")
+        .sum()
+        .round()
+        .abs()
+        .astype(int)
+    )
+
+
+def normalise(df):
+    df = df.rename(columns=str)
+    df.columns = pd.Index(list(df.columns), name="visa_subclass")
+
+    return df
+
+
+def slice_cube(cube, direction):
+    return (
+        cube[cube.direction == direction]
+        .set_index(["date", "visa_subclass"])
+        .net_erp_effect.unstack("visa_subclass")
+        .resample("M")
+        .sum()
+        .round()
+        .abs()
+        .astype(int)
+    )
+
+
+@pytest.mark.parametrize("direction", ["arrival", "departure"])
+def test_cube_matches_unique_movements(unique_movements_folder, direction):
+    cube = nf.get_NOM_monthly_cube(unique_movements_folder)
+    expected = get_expected(unique_movements_folder, direction == "arrival")
+
+    pd.testing.assert_frame_equal(
+        normalise(slice_cube(cube, direction)), normalise(expected), check_freq=False
+    )
+    assert (unique_movements_folder / nf.nom_monthly_cube_name).exists()
+
+
+def test_get_NOM_final_preliminary_reads_the_unique_movements(unique_movements_folder):
+    df = nf.get_NOM_final_preliminary(unique_movements_folder, arrival=False)
+    expected = get_expected(unique_movements_folder, False)
+
+    pd.testing.assert_frame_equal(
+        normalise(df).sort_index(axis="columns"), normalise(expected), check_freq=False
+    )
+    assert not (unique_movements_folder / nf.nom_monthly_cube_name).exists()
+
+
+def test_cube_rebuilt_when_movements_change(unique_movements_folder):
+    cube = nf.get_NOM_monthly_cube(unique_movements_folder)
+    assert nf.get_NOM_monthly_cube(unique_movements_folder).equals(cube)
+
+    final_path = unique_movements_folder / "NOM unique movement - final.parquet"
+    final = pd.read_parquet(final_path)
+    final.iloc[: len(final) // 2].to_parquet(final_path)
+    os.utime(final_path, ns=(1, 1))
+
+    cube = nf.get_NOM_monthly_cube(unique_movements_folder)
+    expected = get_expected(unique_movements_folder, True)
+
+    pd.testing.assert_frame_equal(
+        normalise(slice_cube(cube, "arrival")), normalise(expected), check_freq=False
+    )
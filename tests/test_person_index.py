@@ -0,0 +1,113 @@
+"""
+Tests of the person_id index and get_person_history
+"""
+
+import pandas as pd
+
+import nom_forecast as nf
+import nom_ingestion
+from conftest import add_sas_file, make_sas_df
+
+
+def get_expected_history(analysis_folder, person_ids):
+    dfs = []
+
+    for file_path in nf.gen_nom_files(analysis_folder):
+        df = pd.read_parquet(file_path)
+        dfs.append(df[df.person_id.isin(person_ids)].assign(file=file_path.name))
+
+    return pd.concat(dfs, ignore_index=True)
+
+
+def normalise(df):
+    return (
+        df.astype({col: str for col in df.select_dtypes("category")})
+        .sort_values(["file", "person_id", "duration_movement_date"], ignore_index=True)
+        .reindex(columns=sorted(df.columns))
+    )
+
+
+def test_person_history_matches_full_scan(nom_analysis_folder):
+    # ingestion doesn't index files unless asked
+    assert not (nom_analysis_folder / nom_ingestion.person_index_folder_name).exists()
+
+    assert sorted(
+        index_path.name for index_path in nf.build_person_index(nom_analysis_folder)
+    ) == [
+        "traveller_characteristics2018q4.arrow",
+        "traveller_characteristics2019q1.arrow",
+        "traveller_characteristics2019q2_p.arrow",
+    ]
+
+    df = nf.get_person_history([3, 17, 1_999, 5_000], nom_analysis_folder)
+    expected = get_expected_history(nom_analysis_folder, [3, 17, 1_999, 5_000])
+
+    assert len(df) == 6
+    pd.testing.assert_frame_equal(normalise(df), normalise(expected), check_dtype=False)
+
+
+def test_stale_person_index_is_rebuilt(nom_analysis_folder):
+    file_path = nom_analysis_folder / "traveller_characteristics2019q1.parquet"
+    pd.read_parquet(file_path).query("person_id != 17").to_parquet(file_path)
+
+    df = nf.get_person_history([17], nom_analysis_folder, ["duration_movement_date"])
+
+    assert list(df.columns) == ["person_id", "duration_movement_date", "file"]
+    assert df.file.tolist() == ["traveller_characteristics2018q4.parquet"]
+
+
+def test_final_file_removes_preliminary_person_index(sas_frames, nom_folders):
+    sas_folder, analysis_folder = nom_folders
+    add_sas_file(sas_folder, sas_frames, "pnom2019q1.sas7bdat", make_sas_df(100, False))
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, person_index=True
+    )
+
+    assert [
+        index_path.name
+        for index_path in (
+            analysis_folder / nom_ingestion.person_index_folder_name
+        ).iterdir()
+    ] == ["traveller_characteristics2019q1_p.arrow"]
+
+    (sas_folder / "pnom2019q1.sas7bdat").unlink()
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(100))
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, person_index=True
+    )
+
+    assert [
+        index_path.name
+        for index_path in (
+            analysis_folder / nom_ingestion.person_index_folder_name
+        ).iterdir()
+    ] == ["traveller_characteristics2019q1.arrow"]
+
+
+def test_person_index_kept_unless_indexing(sas_frames, nom_folders):
+    sas_folder, analysis_folder = nom_folders
+    add_sas_file(sas_folder, sas_frames, "pnom2019q1.sas7bdat", make_sas_df(100, False))
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, person_index=True
+    )
+
+    (sas_folder / "pnom2019q1.sas7bdat").unlink()
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(100))
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder)
+
+    assert [
+        index_path.name
+        for index_path in (
+            analysis_folder / nom_ingestion.person_index_folder_name
+        ).iterdir()
+    ] == ["traveller_characteristics2019q1_p.arrow"]
+
+    # the stale index is removed when the folder is indexed
+    nf.build_person_index(analysis_folder)
+
+    assert [
+        index_path.name
+        for index_path in (
+            analysis_folder / nom_ingestion.person_index_folder_name
+        ).iterdir()
+    ] == ["traveller_characteristics2019q1.arrow"]
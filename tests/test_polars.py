@@ -0,0 +1,93 @@
+"""
+Tests of the polars backend against the pandas backend
+"""
+
+import importlib.util
+
+import pandas as pd
+import pytest
+
+import nom_forecast as nf
+import nom_polars
+
+pytest.importorskip("polars")
+
+nom_fields = ["person_id", "duration_movement_date", "visa_subclass", "net_erp_effect"]
+
+
+def test_get_nom_backend_falls_back_to_pandas(monkeypatch):
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+
+    assert nom_polars.get_nom_backend("polars") == "pandas"
+
+
+def test_visa_groups_match_pandas(nom_analysis_folder, tmp_path):
+    df = {
+        backend: nf.get_visa_groups(
+            "Student",
+            ["500", "572"],
+            nom_fields,
+            nom_analysis_folder,
+            tmp_path,
+            backend=backend,
+        )
+        for backend in nom_polars.nom_backends
+    }
+
+    pd.testing.assert_frame_equal(
+        df["polars"].astype({"visa_subclass": str}).reset_index(drop=True),
+        df["pandas"].astype({"visa_subclass": str}).reset_index(drop=True),
+    )
+
+
+def test_unique_movements_match_pandas(nom_analysis_folder, tmp_path, monkeypatch):
+    monkeypatch.setattr(nf, "individual_movements_folder", tmp_path)
+
+    df = {
+        backend: nf.make_unique_movement_files(nom_analysis_folder, backend=backend)
+        for backend in nom_polars.nom_backends
+    }
+
+    for backend in nom_polars.nom_backends:
+        df[backend] = (
+            df[backend]
+            .astype({"visa_subclass": str})
+            # rows with the same date and person_id are in file order
+            .sort_values(df[backend].columns.tolist(), ignore_index=True)
+        )
+
+    pd.testing.assert_frame_equal(df["polars"], df["pandas"])
+
+
+def test_streamed_monthly_matches_pandas(nom_analysis_folder, tmp_path):
+    monthly = {
+        backend: nf.get_NOM_monthly_streamed(
+            "Student", ["500", "572"], nom_analysis_folder, tmp_path, backend=backend
+        )
+        for backend in nom_polars.nom_backends
+    }
+
+    pd.testing.assert_frame_equal(monthly["polars"], monthly["pandas"])
+
+
+def test_monthly_matches_pandas(nom_analysis_folder, tmp_path):
+    df = nf.get_visa_groups(
+        "Student", ["500", "572"], nom_fields, nom_analysis_folder, tmp_path
+    ).astype({"visa_subclass": str})
+    assert (tmp_path / "Student unique movement.parquet").exists()
+
+    monthly = {
+        backend: nf.get_NOM_monthly("Student", tmp_path, tmp_path, df, backend=backend)
+        for backend in nom_polars.nom_backends
+    }
+    scanned = nf.get_NOM_monthly("Student", tmp_path, tmp_path, backend="polars")
+
+    pd.testing.assert_frame_equal(monthly["polars"], monthly["pandas"])
+    pd.testing.assert_frame_equal(scanned, monthly["pandas"])
+
+
+def test_polars_without_scan_cast_options_falls_back_to_pandas(monkeypatch):
+    polars = pytest.importorskip("polars")
+    monkeypatch.delattr(polars, "ScanCastOptions")
+
+    assert nom_polars.get_nom_backend("polars") == "pandas"
@@ -0,0 +1,96 @@
+"""
+Tests of NomQuery and get_NOM_query
+"""
+
+import pandas as pd
+import pyarrow.compute as pc
+
+import nom_forecast as nf
+import nom_lookups
+
+
+def read_final(analysis_folder):
+    df = pd.concat(
+        [pd.read_parquet(file_path) for file_path in nf.gen_nom_files(analysis_folder)],
+        ignore_index=True,
+    )
+
+    return df[df.net_erp_effect != 0]
+
+
+def test_query_selects_and_filters(nom_analysis_folder):
+    df = (
+        nf.NomQuery(nom_analysis_folder)
+        .select(["person_id", "duration_movement_date", "visa_subclass"])
+        .where_visa_subclass(["500", "600"])
+        .where_date(start="2019-01-01", end="2019-06-30")
+        .where_direction("arrival")
+        .where(pc.field("country_of_birth") == 1101)
+        .run()
+    )
+
+    final = read_final(nom_analysis_folder)
+    expected = final[
+        final.visa_subclass.isin(["500", "600"])
+        & final.duration_movement_date.between("2019-01-01", "2019-06-30")
+        & (final.net_erp_effect > 0)
+        & (final.country_of_birth == 1101)
+    ]
+
+    assert list(df.columns) == ["person_id", "date", "visa_subclass"]
+    assert sorted(df.person_id) == sorted(expected.person_id)
+
+
+def test_query_groups_by_month(nom_analysis_folder):
+    df = (
+        nf.NomQuery(nom_analysis_folder)
+        .group_by(["visa_subclass"], freq="M")
+        .agg({"net_erp_effect": "sum"})
+        .run()
+    )
+
+    expected = (
+        read_final(nom_analysis_folder)
+        .groupby(
+            [pd.Grouper(key="duration_movement_date", freq="M"), "visa_subclass"],
+            observed=True,
+        )
+        .net_erp_effect.sum()
+    )
+
+    pd.testing.assert_series_equal(
+        df.astype({"visa_subclass": str, "net_erp_effect": "int64"})
+        .set_index(["date", "visa_subclass"])
+        .net_erp_effect.sort_index(),
+        expected.astype("int64")
+        .rename_axis(["date", "visa_subclass"])
+        .reset_index()
+        .astype({"visa_subclass": str})
+        .set_index(["date", "visa_subclass"])
+        .net_erp_effect.sort_index(),
+    )
+
+
+def test_query_preliminary_files(nom_analysis_folder):
+    query = nf.NomQuery(nom_analysis_folder).preliminary()
+
+    assert [file_path.name for file_path in query.get_file_paths()] == [
+        "traveller_characteristics2019q2_p.parquet"
+    ]
+
+
+def test_get_NOM_query(nom_analysis_folder, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        nf, "get_abs_3412_mapper", lambda: pd.Series({"500": "Student", "600": "Visitor"})
+    )
+    monkeypatch.setattr(nom_lookups, "sacc_country_path", tmp_path / "countries.csv")
+    monkeypatch.setattr(nom_lookups, "sacc_lookup_cache", {})
+    pd.DataFrame(
+        {"code": [1101, 1201], "country": ["Australia", "New Zealand"]}
+    ).to_csv(nom_lookups.sacc_country_path, index=False)
+
+    df = nf.get_NOM_query(nom_analysis_folder, vsc_list=["500"], countries=[1101])
+
+    assert set(df.abs_visa_group) == {"Student"}
+    assert set(df.country_of_citizenship) == {"Australia"}
+    assert isinstance(df.country_of_stay.dtype, pd.CategoricalDtype)
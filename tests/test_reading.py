@@ -0,0 +1,136 @@
+"""
+Tests of reading NOM unit records (filters, prefetching and the column cache)
+"""
+
+import threading
+
+import pandas as pd
+import pyarrow.compute as pc
+
+import nom_forecast as nf
+
+nom_fields = ["person_id", "duration_movement_date", "visa_subclass", "net_erp_effect"]
+
+
+def read_all(analysis_folder, nom_fields):
+    return pd.concat(
+        [
+            pd.read_parquet(file_path, columns=nom_fields)
+            for file_path in nf.gen_nom_files(analysis_folder)
+        ],
+        ignore_index=True,
+    )
+
+
+def assert_same_rows(df, expected):
+    pd.testing.assert_frame_equal(
+        df.astype({"visa_subclass": str})
+        .sort_values("person_id", ignore_index=True)
+        .reset_index(drop=True),
+        expected.astype({"visa_subclass": str})
+        .sort_values("person_id", ignore_index=True)
+        .reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_filters_pushed_into_the_scan(nom_analysis_folder):
+    file_path = nom_analysis_folder / "traveller_characteristics2019q1.parquet"
+    df = pd.read_parquet(file_path)
+
+    scan_filter = nf.make_nom_filter(
+        ["500", "572"],
+        net_erp_effect=True,
+        filters=pc.field("country_of_stay") == 1101,
+    )
+    filtered = nf.read_nom_parquet(file_path, nom_fields, filters=scan_filter)
+
+    expected = df[
+        df.visa_subclass.isin(["500", "572"])
+        & (df.net_erp_effect != 0)
+        & (df.country_of_stay == 1101)
+    ][nom_fields]
+
+    assert list(filtered.columns) == nom_fields
+    assert_same_rows(filtered, expected)
+
+
+def test_gen_nom_fields_selects_nom_movements(nom_analysis_folder):
+    df = pd.concat(
+        nf.gen_nom_fields(nf.gen_nom_files(nom_analysis_folder), nom_fields),
+        ignore_index=True,
+    )
+
+    expected = read_all(nom_analysis_folder, nom_fields)
+
+    assert_same_rows(df, expected[expected.net_erp_effect != 0])
+
+
+def test_prefetch_matches_serial_read(nom_analysis_folder):
+    file_paths = list(nf.gen_nom_files(nom_analysis_folder))
+
+    serial = list(nf.gen_nom_fields(file_paths, nom_fields))
+    prefetched = list(nf.gen_nom_fields(file_paths, nom_fields, prefetch=1))
+
+    assert len(prefetched) == len(serial) == 2
+    for df, expected in zip(prefetched, serial):
+        pd.testing.assert_frame_equal(df, expected)
+
+
+def test_prefetch_reads_the_next_file_while_one_is_consumed(monkeypatch):
+    started = {file_path: threading.Event() for file_path in ["q1", "q2", "q3"]}
+
+    def read_nom_parquet(file_path, *args):
+        started[file_path].set()
+        return pd.DataFrame({"file": [file_path]})
+
+    monkeypatch.setattr(nf, "read_nom_parquet", read_nom_parquet)
+
+    class NomFile(str):
+        stem = property(str.__str__)
+
+    df_fields = nf.gen_nom_fields([NomFile(name) for name in started], None, prefetch=1)
+
+    assert next(df_fields).file[0] == "q1"
+    # q2 is read while q1 is consumed - before the next DataFrame is asked for
+    assert started["q2"].wait(timeout=5)
+    assert [df.file[0] for df in df_fields] == ["q2", "q3"]
+
+
+def test_column_cache_matches_parquet(nom_analysis_folder, tmp_path):
+    cache_folder = tmp_path / "cache"
+    nf.build_nom_column_cache(nom_analysis_folder, cache_folder)
+
+    file_path = nom_analysis_folder / "traveller_characteristics2019q1.parquet"
+    scan_filter = nf.make_nom_filter(["500"], net_erp_effect=True)
+
+    assert nf.read_nom_column_cache(file_path, cache_folder, nom_fields) is not None
+    pd.testing.assert_frame_equal(
+        nf.read_nom_parquet(file_path, nom_fields, None, scan_filter, cache_folder),
+        nf.read_nom_parquet(file_path, nom_fields, None, scan_filter),
+    )
+
+
+def test_column_cache_falls_back_to_parquet(nom_analysis_folder, tmp_path):
+    cache_folder = tmp_path / "cache"
+    nf.build_nom_column_cache(nom_analysis_folder, cache_folder)
+
+    file_path = nom_analysis_folder / "traveller_characteristics2019q1.parquet"
+
+    # a filter on a field that isn't cached
+    scan_filter = pc.field("country_of_stay") == 1101
+    assert (
+        nf.read_nom_column_cache(file_path, cache_folder, nom_fields, scan_filter) is None
+    )
+    pd.testing.assert_frame_equal(
+        nf.read_nom_parquet(file_path, nom_fields, None, scan_filter, cache_folder),
+        nf.read_nom_parquet(file_path, nom_fields, None, scan_filter),
+    )
+
+    # a field that isn't cached
+    assert nf.read_nom_column_cache(file_path, cache_folder, ["age"]) is None
+
+    # the parquet file has changed since it was cached
+    pd.read_parquet(file_path).head(10).to_parquet(file_path)
+    assert nf.read_nom_column_cache(file_path, cache_folder, nom_fields) is None
+    assert len(nf.read_nom_parquet(file_path, nom_fields, None, None, cache_folder)) == 10
@@ -0,0 +1,97 @@
+"""
+Tests of decoding SACC country codes
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import mappers
+import nom_lookups
+
+
+@pytest.fixture
+def sacc_country_path(tmp_path, monkeypatch):
+    """
+    Path of a SACC country names csv (not written), and an empty lookup cache
+    """
+
+    country_path = tmp_path / "SACC 2016 countries.csv"
+    monkeypatch.setattr(nom_lookups, "sacc_country_path", country_path)
+    monkeypatch.setattr(nom_lookups, "sacc_lookup_cache", {})
+
+    return country_path
+
+
+def expected_map(codes, mapper):
+    return [mapper.get(code) if code is not None else None for code in codes]
+
+
+def test_region_and_sub_region_match_the_mappers(sacc_country_path):
+    codes = pd.Series([1101, 2102, np.nan, 5105, 12_000, -1, 913])
+
+    region = nom_lookups.decode_sacc(codes, "region")
+    sub_region = nom_lookups.decode_sacc(codes, "sub_region")
+
+    assert isinstance(region, pd.Categorical)
+    assert pd.Series(region).astype(object).where(pd.notna(region), None).tolist() == (
+        expected_map([1, 2, None, 5, None, None, 0], mappers.sacc_region)
+    )
+    assert pd.Series(sub_region).astype(object).where(
+        pd.notna(sub_region), None
+    ).tolist() == expected_map([11, 21, None, 51, None, None, 9], mappers.sacc_sub_region)
+
+
+def test_supplementary_codes_have_their_own_sub_regions(sacc_country_path):
+    sub_region = nom_lookups.decode_sacc([1, 3, 913, 100, 1101], "sub_region")
+
+    assert sub_region[:3].tolist() == [
+        mappers.sacc_sub_region[0],
+        mappers.sacc_sub_region[0],
+        mappers.sacc_sub_region[9],
+    ]
+    # 01xx isn't a SACC sub-region
+    assert pd.isna(sub_region[3])
+
+
+def test_countries_from_the_csv(sacc_country_path):
+    pd.DataFrame(
+        {"code": [1101, 1201, 1101], "country": ["Old Australia", "New Zealand", "Australia"]}
+    ).to_csv(sacc_country_path, index=False)
+
+    country = nom_lookups.decode_sacc([1101, 1201, 2102], "country")
+
+    assert country[:2].tolist() == ["Australia", "New Zealand"]
+    assert pd.isna(country[2])
+
+
+def test_countries_without_the_csv_raise(sacc_country_path):
+    with pytest.raises(ValueError, match="SACC country names"):
+        nom_lookups.decode_sacc(pd.Series([1101, 913, None]), "country")
+
+    # the other levels don't need it
+    assert nom_lookups.decode_sacc([1101], "region").tolist() == [
+        mappers.sacc_region[1]
+    ]
+
+
+def test_unknown_level_raises(sacc_country_path):
+    with pytest.raises(ValueError):
+        nom_lookups.decode_sacc([1101], "continent")
+
+
+def test_decode_sacc_columns(sacc_country_path):
+    df = pd.DataFrame(
+        {field: [1101, 2102] for field in nom_lookups.sacc_fields} | {"age": [20, 30]}
+    )
+
+    decoded = nom_lookups.decode_sacc_columns(df, levels=["region"])
+
+    assert decoded.columns.tolist() == df.columns.tolist() + [
+        f"{field}_region" for field in nom_lookups.sacc_fields
+    ]
+    for field in nom_lookups.sacc_fields:
+        assert decoded[f"{field}_region"].tolist() == [
+            mappers.sacc_region[1],
+            mappers.sacc_region[2],
+        ]
@@ -0,0 +1,119 @@
+"""
+Tests of the SAS reader backends
+"""
+
+import importlib.util
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import nom_ingestion
+from conftest import add_sas_file, make_sas_df, write_sas7bdat
+
+
+def test_get_sas_reader_falls_back_to_pandas(monkeypatch):
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+
+    assert nom_ingestion.get_sas_reader("pyreadstat") == "pandas"
+
+
+def test_get_sas_reader_rejects_unknown_reader():
+    with pytest.raises(ValueError):
+        nom_ingestion.get_sas_reader("sas")
+
+
+def test_pyreadstat_missing_strings_match_pandas(monkeypatch, tmp_path):
+    pyreadstat = pytest.importorskip("pyreadstat")
+
+    df_pandas = pd.DataFrame({"VISA_SUBCLASS": ["500", np.nan], "AGE": [20.0, 30.0]})
+
+    def read_file_multiprocessing(read_function, sas_file, **kwargs):
+        return df_pandas.fillna(""), None
+
+    monkeypatch.setattr(pyreadstat, "read_file_multiprocessing", read_file_multiprocessing)
+
+    df = nom_ingestion.read_sas_file(tmp_path / "fnom2019q1.sas7bdat", "pyreadstat")
+
+    pd.testing.assert_frame_equal(df, df_pandas.rename(columns=str.lower))
+
+
+@pytest.fixture
+def real_sas_file(tmp_path):
+    """
+    A real sas7bdat file of synthetic NOM columns (without the date column, which
+    pandas reads as a number from readstat written files), with missing strings
+    """
+
+    df = make_sas_df(300).drop(columns="Duration_movement_date")
+    df.loc[::7, "visa_subclass"] = np.nan
+    df.loc[::11, "person_id"] = np.nan
+
+    return write_sas7bdat(df.rename(columns=str.upper), tmp_path / "fnom2019q1.sas7bdat")
+
+
+def test_readers_agree_on_a_real_sas_file(real_sas_file):
+    df_pandas = nom_ingestion.read_sas_file(real_sas_file)
+    df_pyreadstat = nom_ingestion.read_sas_file(
+        real_sas_file, "pyreadstat", n_processes=1
+    )
+
+    assert df_pandas.visa_subclass.isna().sum() == 43
+    pd.testing.assert_frame_equal(df_pyreadstat, df_pandas)
+
+
+@pytest.mark.parametrize("sas_reader", ["pandas", "pyreadstat"])
+def test_real_sas_file_read_in_chunks(real_sas_file, monkeypatch, sas_reader):
+    monkeypatch.setattr(nom_ingestion, "sas_sample_rows", 50)
+
+    chunks = list(
+        nom_ingestion.gen_sas_chunks(real_sas_file, 0.01, sas_reader, n_processes=1)
+    )
+
+    assert len(chunks) > 2
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True), nom_ingestion.read_sas_file(real_sas_file)
+    )
+
+
+def test_real_sas_file_streamed_from_its_zip(real_sas_file, monkeypatch):
+    sas_folder = real_sas_file.parent / "zipped"
+    sas_folder.mkdir()
+    with zipfile.ZipFile(sas_folder / "fnom2019q1.zip", "w") as zipped_file:
+        zipped_file.write(real_sas_file, real_sas_file.name)
+
+    monkeypatch.setattr(nom_ingestion, "sas_sample_rows", 50)
+
+    [(abs_filepath, zip_filepath)] = nom_ingestion.gen_abs_sas_files(sas_folder)
+    assert not abs_filepath.exists()
+
+    with nom_ingestion.open_abs_sas_file(abs_filepath, zip_filepath) as sas_file:
+        chunks = list(nom_ingestion.gen_sas_chunks(sas_file, 0.01))
+
+    with nom_ingestion.open_abs_sas_file(abs_filepath, zip_filepath) as sas_file:
+        df = nom_ingestion.read_sas_file(sas_file)
+
+    expected = nom_ingestion.read_sas_file(real_sas_file)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_worker_processes_read_with_one_process(sas_frames, nom_folders, monkeypatch):
+    sas_folder, analysis_folder = nom_folders
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(100))
+
+    n_processes = []
+
+    def convert_abs_sas_file(abs_filepath, zip_filepath, **kwargs):
+        n_processes.append(kwargs["n_processes"])
+        return convert(abs_filepath, zip_filepath, **kwargs)
+
+    convert = nom_ingestion.convert_abs_sas_file
+    monkeypatch.setattr(nom_ingestion, "convert_abs_sas_file", convert_abs_sas_file)
+    monkeypatch.setattr(nom_ingestion, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder, max_workers=2)
+
+    assert n_processes == [1]
@@ -0,0 +1,130 @@
+"""
+Tests of the shared NOM schema (categories and integer types)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import nom_forecast as nf
+import nom_ingestion
+from conftest import add_sas_file, make_sas_df
+
+
+def write_nom_file(file_path, visa_subclass, age):
+    df = pd.DataFrame(
+        {
+            "person_id": np.arange(len(age), dtype="int64"),
+            "visa_subclass": visa_subclass,
+            "age": np.asarray(age, dtype="int64"),
+        }
+    )
+    df.to_parquet(file_path)
+
+    return file_path
+
+
+def test_categories_are_appended_and_codes_stable(tmp_path):
+    schema_path = tmp_path / "schema.json"
+    first = write_nom_file(tmp_path / "first.parquet", ["600", "500"], [20, 30])
+    second = write_nom_file(tmp_path / "second.parquet", ["820", "500"], [40, 50])
+
+    schema = nom_ingestion.update_nom_schema([first], schema_path)
+    assert schema["categories"]["visa_subclass"] == ["500", "600"]
+    assert schema["version"] == 1
+
+    schema = nom_ingestion.update_nom_schema([second], schema_path)
+    assert schema["categories"]["visa_subclass"] == ["500", "600", "820"]
+    assert schema["version"] == 2
+
+    # no new categories, no new version
+    assert nom_ingestion.update_nom_schema([first, second], schema_path)["version"] == 2
+
+
+def test_files_read_with_identical_dtypes(tmp_path):
+    schema_path = tmp_path / "schema.json"
+    file_paths = [
+        write_nom_file(tmp_path / "first.parquet", ["600", "500"], [20, 30]),
+        write_nom_file(tmp_path / "second.parquet", ["820"], [40]),
+    ]
+    schema = nom_ingestion.update_nom_schema(file_paths, schema_path)
+
+    dtypes = [
+        nf.read_nom_parquet(file_path, schema=schema).dtypes for file_path in file_paths
+    ]
+
+    pd.testing.assert_series_equal(dtypes[0], dtypes[1])
+    assert dtypes[0]["age"] == np.dtype("int16")
+
+
+def test_integer_ranges_recorded_and_checked_at_ingestion(tmp_path):
+    schema_path = tmp_path / "schema.json"
+    first = write_nom_file(tmp_path / "first.parquet", ["500"] * 3, [0, 20, 99])
+
+    schema = nom_ingestion.update_nom_schema([first], schema_path)
+    assert schema["ranges"]["age"] == [0, 99]
+    assert nom_ingestion.read_nom_schema(schema_path)["ranges"]["age"] == [0, 99]
+
+    too_old = write_nom_file(tmp_path / "too_old.parquet", ["500"], [40_000])
+
+    with pytest.raises(ValueError):
+        nom_ingestion.update_nom_schema([too_old], schema_path)
+
+
+def test_cast_nom_integer_refuses_values_that_dont_fit():
+    with pytest.raises(ValueError):
+        nom_ingestion.cast_nom_integer(pd.Series([1, 200], name="sex"))
+
+    with pytest.raises(ValueError):
+        nom_ingestion.cast_nom_integer(pd.Series([1.0, 0.4], name="sex"))
+
+    assert (
+        nom_ingestion.cast_nom_integer(pd.Series([1.0, 2.0], name="sex")).dtype
+        == np.int8
+    )
+
+
+def test_values_missing_from_the_schema_widen_the_categories(tmp_path):
+    schema_path = tmp_path / "schema.json"
+    first = write_nom_file(tmp_path / "first.parquet", ["600", "500"], [20, 30])
+    second = write_nom_file(tmp_path / "second.parquet", ["820", "400"], [40, 50])
+    schema = nom_ingestion.update_nom_schema([first], schema_path)
+
+    df = nf.read_nom_parquet(second, schema=schema)
+
+    assert df.visa_subclass.cat.categories.tolist() == ["500", "600", "400", "820"]
+    assert df.visa_subclass.tolist() == ["820", "400"]
+
+
+def test_no_schema_no_cast(tmp_path):
+    file_path = write_nom_file(tmp_path / "first.parquet", ["600", "500"], [20, 30])
+
+    pd.testing.assert_frame_equal(
+        nf.read_nom_parquet(file_path), pd.read_parquet(file_path)
+    )
+
+
+def test_schema_only_written_when_asked(sas_frames, nom_folders, tmp_path):
+    sas_folder, analysis_folder = nom_folders
+    add_sas_file(sas_folder, sas_frames, "fnom2019q1.sas7bdat", make_sas_df(100))
+    schema_path = tmp_path / "ingested schema.json"
+
+    nom_ingestion.process_original_ABS_data(sas_folder, analysis_folder)
+
+    assert not nom_ingestion.nom_schema_path.exists()
+    assert not schema_path.exists()
+
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, schema_path=schema_path
+    )
+
+    assert nom_ingestion.read_nom_schema(schema_path)["categories"][
+        "visa_subclass"
+    ] == [
+        "010",
+        "417",
+        "500",
+        "572",
+        "600",
+        "820",
+    ]
@@ -0,0 +1,54 @@
+"""
+Tests of the DuckDB SQL backend against the pandas implementations
+"""
+
+import pandas as pd
+import pytest
+
+import nom_forecast as nf
+import nom_ingestion
+import nom_sql
+from conftest import add_sas_file, make_sas_df
+
+pytest.importorskip("duckdb")
+
+nom_fields = ["visa_group", "duration_movement_date", "visa_subclass", "net_erp_effect"]
+
+
+def sort_file_fields(series):
+    return (
+        series.reset_index()
+        .astype({"visa_group": str, "visa_subclass": str, "net_erp_effect": "int64"})
+        .sort_values(nom_fields, ignore_index=True)
+    )
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_file_fields_match_pandas(sas_frames, nom_folders, partitioned):
+    sas_folder, analysis_folder = nom_folders
+    df_final = make_sas_df(500)
+    # pandas groupby drops records without a visa group
+    df_final.loc[::10, "visa_group"] = None
+    add_sas_file(sas_folder, sas_frames, "fnom2018q4.sas7bdat", df_final)
+    add_sas_file(sas_folder, sas_frames, "pnom2019q1.sas7bdat", make_sas_df(500, False))
+
+    nom_ingestion.process_original_ABS_data(
+        sas_folder, analysis_folder, partitioned=partitioned
+    )
+
+    sql = nom_sql.get_nom_file_fields_sql(analysis_folder)
+    expected = pd.concat(nf.get_nom_file_fields(analysis_folder, nom_fields))
+
+    assert len(sql) > 0
+    pd.testing.assert_frame_equal(sort_file_fields(sql), sort_file_fields(expected))
+
+
+def test_benchmark_results_equal(
+    nom_analysis_folder, unique_movements_folder, visa_dictionaries
+):
+    benchmark = nom_sql.benchmark_sql_backend(
+        unique_movements_folder, nom_analysis_folder
+    )
+
+    assert benchmark.equal.all()
+    assert not (unique_movements_folder / nf.nom_monthly_cube_name).exists()
@@ -0,0 +1,65 @@
+"""
+Tests of decoding state of residence
+"""
+
+import pandas as pd
+import pytest
+
+import mappers
+import nom_forecast as nf
+import nom_ingestion
+
+
+def as_strings(values):
+    return pd.Series(values).astype(object).where(pd.notna(values), None).tolist()
+
+
+STATES = ["01", "I", " 05", "X", None, "J", "09"]
+
+
+def test_decode_state_matches_the_mapper():
+    expected = [
+        None if s is None else mappers.state_residence_original.get(s.strip())
+        for s in STATES
+    ]
+
+    for state in [pd.Series(STATES), pd.Series(STATES, dtype="category")]:
+        decoded = nom_ingestion.decode_state(state)
+
+        assert decoded.dtype == nom_ingestion.state_residence_dtype
+        assert as_strings(decoded) == expected
+
+
+def test_other_territories_from_either_column():
+    df = pd.DataFrame({"state": STATES}, index=range(10, 17))
+    expected = [
+        None if s is None else mappers.state_residence_other_territories.get(s.strip())
+        for s in STATES
+    ]
+
+    from_state = nom_ingestion.get_state_residence(df, "other_territories")
+    from_residence = nom_ingestion.get_state_residence(
+        df.assign(state_residence=nom_ingestion.decode_state(df.state)).drop(
+            columns="state"
+        ),
+        "other_territories",
+    )
+
+    assert from_state.index.equals(df.index)
+    assert as_strings(from_state) == expected
+    assert as_strings(from_residence) == expected
+
+    with pytest.raises(ValueError):
+        nom_ingestion.get_state_residence(df, "states")
+
+
+def test_state_residence_added_at_ingestion(nom_analysis_folder):
+    file_path = nom_analysis_folder / "traveller_characteristics2019q1.parquet"
+
+    df = nf.read_nom_parquet(file_path)
+
+    assert df.state_residence.dtype == nom_ingestion.state_residence_dtype
+    assert as_strings(df.state_residence) == (
+        df.state.astype(str).map(mappers.state_residence_original).tolist()
+    )
+    assert nom_ingestion.get_state_residence(df).equals(df.state_residence)
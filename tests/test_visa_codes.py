@@ -0,0 +1,118 @@
+"""
+Tests of mapping visa subclasses by global integer codes
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import nom_forecast as nf
+import nom_ingestion
+import nom_lookups
+
+
+def test_schema_categories_come_first(visa_dictionaries):
+    schema = {"categories": {"visa_subclass": ["820", "500", "999"]}}
+
+    codes = nom_lookups.get_visa_subclass_codes(schema=schema)
+    registry = nom_lookups.get_visa_registry()
+
+    assert codes[:3].tolist() == ["820", "500", "999"]
+    assert codes.is_unique
+    assert codes[3:].is_monotonic_increasing
+    assert set(codes) == {"999"}.union(
+        *(registry[mapping].index for mapping in ["abs_group", "label"])
+    )
+
+
+def test_codes_cached_until_the_schema_changes(visa_dictionaries, tmp_path, monkeypatch):
+    schema_path = tmp_path / "schema.json"
+    schema_path.write_text(json.dumps({"categories": {"visa_subclass": ["820"]}}))
+    monkeypatch.setattr(nom_ingestion, "nom_schema_path", schema_path)
+
+    codes = nom_lookups.get_visa_subclass_codes()
+
+    reads = []
+    read_schema = nom_ingestion.read_nom_schema
+    monkeypatch.setattr(
+        nom_ingestion,
+        "read_nom_schema",
+        lambda *args: reads.append(1) or read_schema(*args),
+    )
+
+    assert nom_lookups.get_visa_subclass_codes() is codes
+    assert reads == []
+
+    schema_path.write_text(json.dumps({"categories": {"visa_subclass": ["500"]}}))
+    os.utime(schema_path, ns=(1, 1))
+
+    assert nom_lookups.get_visa_subclass_codes()[0] == "500"
+    assert reads == [1]
+
+
+def test_encode_categorical_by_its_categories(visa_dictionaries):
+    codes = nom_lookups.get_visa_subclass_codes(schema={"categories": {}})
+    visa_subclass = pd.Series(["500", None, "123", "010"], dtype="category")
+
+    encoded = nom_lookups.encode_visa_subclass(visa_subclass, codes)
+
+    np.testing.assert_array_equal(
+        encoded, nom_lookups.encode_visa_subclass(["500", "nan", "123", "010"], codes)
+    )
+    np.testing.assert_array_equal(
+        encoded,
+        nom_lookups.encode_visa_subclass(pd.Series(["500", None, "123", "010"]), codes),
+    )
+    assert encoded.tolist() == [codes.get_loc("500"), -1, -1, codes.get_loc("010")]
+
+
+def test_map_visa_subclass_matches_lookup(visa_dictionaries):
+    visa_subclass = ["572", "999", "010", "572", "820"]
+
+    for mapping in ["abs_group", "label", "reporting_category"]:
+        expected = pd.Series(nom_lookups.lookup_visa_subclass(visa_subclass, mapping))
+
+        for values in [visa_subclass, pd.Categorical(visa_subclass)]:
+            mapped = nom_lookups.map_visa_subclass(values, mapping)
+
+            assert isinstance(mapped, pd.Categorical)
+            pd.testing.assert_series_equal(
+                pd.Series(mapped).astype(object).where(pd.notna(mapped), None),
+                expected,
+            )
+
+
+def test_tidy_by_visa_subclass(visa_dictionaries, nom_folders):
+    df = pd.DataFrame(
+        {"500": [1.0, 0.0], "417": [2.0, 3.0]},
+        index=pd.Index(pd.to_datetime(["2019-01-31", "2019-02-28"]), name="date"),
+    )
+    df.columns.name = "vsc"
+
+    tidy = nf.tidy__by_visa_subclass(df)
+
+    assert tidy.columns.tolist() == [
+        "date",
+        "abs_grouping",
+        "visa_label",
+        "visa_subclass",
+        "nom",
+    ]
+    for col in ["abs_grouping", "visa_label", "visa_subclass"]:
+        assert isinstance(tidy[col].dtype, pd.CategoricalDtype)
+
+    # the zero entry is removed
+    assert tidy.visa_subclass.astype(str).tolist() == ["500", "417", "417"]
+    assert tidy.nom.tolist() == [1.0, 2.0, 3.0]
+    assert tidy.visa_label.astype(str).tolist() == [
+        "Student",
+        "Working Holiday",
+        "Working Holiday",
+    ]
+
+    abs_mapper = nom_lookups.get_visa_registry()["abs_group"]
+    assert tidy.abs_grouping.astype(str).tolist() == abs_mapper[
+        ["500", "417", "417"]
+    ].tolist()
@@ -0,0 +1,95 @@
+"""
+Tests of the visa code description store
+"""
+
+import os
+import pickle
+
+import pytest
+
+import nom_ingestion
+import nom_lookups
+
+
+def write_descriptions(dict_folder, descriptions):
+    with open(dict_folder / nom_lookups.visa_description_source, "wb") as pickle_file:
+        pickle.dump(descriptions, pickle_file)
+
+
+@pytest.fixture
+def description_folder(tmp_path, monkeypatch):
+    """
+    A dictionary folder with a visa code descriptions pickle
+    """
+
+    monkeypatch.setattr(nom_lookups, "dict_data_folder", tmp_path)
+    monkeypatch.setattr(
+        nom_lookups,
+        "visa_description_store_path",
+        tmp_path / "visa_code_descriptions.arrow",
+    )
+    monkeypatch.setattr(nom_lookups, "visa_description_cache", {})
+
+    write_descriptions(
+        tmp_path, {"500": "Student", "572": "VET", "417": "Working holiday", 600: "Visitor"}
+    )
+
+    return tmp_path
+
+
+def test_descriptions_looked_up_from_the_sorted_store(description_folder):
+    descriptions = nom_lookups.get_visa_descriptions(["572", "999", "600"])
+
+    assert descriptions.tolist()[0] == "VET"
+    assert descriptions.isna().tolist() == [False, True, False]
+    assert descriptions["600"] == "Visitor"
+    assert nom_lookups.visa_description_store_path.exists()
+
+    assert nom_lookups.search_visa_descriptions("5").to_dict() == {
+        "500": "Student",
+        "572": "VET",
+    }
+
+
+def test_get_visa_code_descriptions(description_folder, capsys):
+    assert nom_lookups.get_visa_code_descriptions(["417", "999"]) == {
+        "500": "Student",
+        "572": "VET",
+        "417": "Working holiday",
+        600: "Visitor",
+    }
+    assert capsys.readouterr().out == ""
+
+
+def test_unchanged_store_is_not_reopened(description_folder, monkeypatch):
+    nom_lookups.get_visa_descriptions(["500"])
+
+    reads = []
+    read_source = nom_ingestion.read_cache_source
+    monkeypatch.setattr(
+        nom_ingestion,
+        "read_cache_source",
+        lambda cache_path: reads.append(cache_path) or read_source(cache_path),
+    )
+
+    for _ in range(3):
+        nom_lookups.get_visa_descriptions(["500"])
+
+    assert reads == []
+
+    # a changed pickle rebuilds the store
+    write_descriptions(description_folder, {"500": "Student visa"})
+    os.utime(description_folder / nom_lookups.visa_description_source, ns=(1, 1))
+
+    assert (
+        nom_lookups.get_visa_descriptions(["500", "572"]).tolist()[0] == "Student visa"
+    )
+    assert len(reads) == 1
+
+
+def test_store_used_without_the_pickle(description_folder, monkeypatch):
+    nom_lookups.get_visa_descriptions(["500"])
+    (description_folder / nom_lookups.visa_description_source).unlink()
+    monkeypatch.setattr(nom_lookups, "visa_description_cache", {})
+
+    assert nom_lookups.get_visa_descriptions(["500"]).tolist() == ["Student"]
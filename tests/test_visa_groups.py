@@ -0,0 +1,87 @@
+"""
+Tests of extracting visa groups and their monthly arrivals and departures
+"""
+
+import pandas as pd
+
+import nom_forecast as nf
+import nom_ingestion
+
+nom_fields = ["person_id", "duration_movement_date", "visa_subclass", "net_erp_effect"]
+
+
+def test_streamed_monthly_matches_unique_movements(nom_analysis_folder, tmp_path):
+    movements_folder = tmp_path / "movements"
+    monthly_folder = tmp_path / "monthly"
+    movements_folder.mkdir()
+    monthly_folder.mkdir()
+
+    df = nf.get_visa_groups(
+        "Student", ["500", "572"], nom_fields, nom_analysis_folder, movements_folder
+    )
+    # as strings, so subclasses only in the categories don't get (zero) columns
+    monthly = nf.get_NOM_monthly(
+        "Student", movements_folder, monthly_folder, df.astype({"visa_subclass": str})
+    )
+
+    streamed = nf.get_NOM_monthly_streamed(
+        "Student", ["500", "572"], nom_analysis_folder, monthly_folder
+    )
+
+    pd.testing.assert_frame_equal(streamed, monthly, check_column_type=False)
+
+
+def test_write_visa_groups_matches_get_visa_groups(nom_analysis_folder, tmp_path):
+    visa_groups = {"Student": ["500", "572"], "Visitor": ["600"], "Empty": ["999"]}
+    movements_folder = tmp_path / "movements"
+    movements_folder.mkdir()
+
+    outfiles = nf.write_visa_groups(
+        visa_groups, nom_fields, nom_analysis_folder, movements_folder
+    )
+    assert sorted(outfiles) == ["Student", "Visitor"]
+
+    for ABS_nom_group in outfiles:
+        expected = nf.get_visa_groups(
+            ABS_nom_group,
+            visa_groups[ABS_nom_group],
+            nom_fields,
+            nom_analysis_folder,
+            tmp_path,
+        )
+
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(outfiles[ABS_nom_group]).astype({"visa_subclass": str}),
+            expected.astype({"visa_subclass": str}),
+        )
+
+
+def test_write_visa_groups_new_categories_in_later_files(tmp_path, monkeypatch):
+    # without a schema file, each file's visa_subclass categories are its own
+    monkeypatch.setattr(nom_ingestion, "nom_schema_path", tmp_path / "no schema.json")
+    data_folder = tmp_path / "analysis"
+    movements_folder = tmp_path / "movements"
+    data_folder.mkdir()
+    movements_folder.mkdir()
+
+    vsc_list = [f"{vsc:03d}" for vsc in range(300)]
+
+    for file_name, visa_subclass in [
+        ("traveller_characteristics2018q4.parquet", ["000", "001"]),
+        ("traveller_characteristics2019q1.parquet", vsc_list),
+    ]:
+        pd.DataFrame(
+            {
+                "person_id": range(len(visa_subclass)),
+                "duration_movement_date": pd.Timestamp("2019-01-01"),
+                "visa_subclass": pd.Categorical(visa_subclass),
+                "net_erp_effect": 1,
+            }
+        ).to_parquet(data_folder / file_name)
+
+    outfiles = nf.write_visa_groups(
+        {"All": vsc_list}, nom_fields, data_folder, movements_folder
+    )
+
+    df = pd.read_parquet(outfiles["All"])
+    assert df.visa_subclass.astype(str).tolist() == ["000", "001"] + vsc_list
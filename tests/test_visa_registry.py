@@ -0,0 +1,80 @@
+"""
+Tests of the compiled visa registry
+"""
+
+import os
+
+import pytest
+
+import nom_lookups
+
+
+def test_registry_built_and_cached(visa_dictionaries, monkeypatch):
+    registry = nom_lookups.get_visa_registry()
+
+    assert nom_lookups.visa_registry_path.exists()
+    assert registry["label"]["500"] == "Student"
+    assert registry["reporting_category"]["500"] == "Higher education sector"
+
+    built = []
+    build = nom_lookups.build_visa_registry
+    monkeypatch.setattr(
+        nom_lookups,
+        "build_visa_registry",
+        lambda *args: built.append(1) or build(*args),
+    )
+
+    assert nom_lookups.get_visa_registry() is registry
+    assert built == []
+
+    # a changed dictionary rebuilds the registry
+    vsc_path = visa_dictionaries / "REF_VISA_SUBCLASS.parquet"
+    os.utime(vsc_path, ns=(0, 0))
+
+    assert nom_lookups.get_visa_registry() is not registry
+    assert built == [1]
+
+
+def test_missing_dictionary_uses_the_built_registry(visa_dictionaries, monkeypatch):
+    registry = nom_lookups.get_visa_registry()
+    (visa_dictionaries / "REF_VISA_SUBCLASS.parquet").unlink()
+    monkeypatch.setattr(nom_lookups, "visa_registry_cache", {})
+
+    fallback = nom_lookups.get_visa_registry()
+
+    assert fallback["label"].equals(registry["label"])
+    assert fallback["abs_group"].equals(registry["abs_group"])
+    assert nom_lookups.get_visa_registry() is fallback
+
+
+def test_missing_dictionary_without_a_registry_builds_from_the_rest(visa_dictionaries):
+    (visa_dictionaries / "ABS - Visacode3412mapping.xlsx").unlink()
+
+    registry = nom_lookups.get_visa_registry()
+
+    assert registry["label"]["417"] == "Working Holiday"
+    assert registry["abs_group"].empty
+    assert nom_lookups.lookup_visa_subclass(["417"], "abs_group").tolist() == [None]
+
+
+def test_no_dictionaries_and_no_registry_raises(visa_dictionaries):
+    for file_name in nom_lookups.visa_registry_sources:
+        (visa_dictionaries / file_name).unlink()
+
+    with pytest.raises(ValueError):
+        nom_lookups.get_visa_registry()
+
+
+def test_lookup_visa_subclass(visa_dictionaries):
+    registry = nom_lookups.get_visa_registry()
+
+    mapped = nom_lookups.lookup_visa_subclass(["820", "999", "010"], "label")
+
+    assert mapped.tolist() == ["Partner", None, "Bridging A"]
+    assert (
+        nom_lookups.lookup_visa_subclass(["417"], "abs_group")[0]
+        == registry["abs_group"]["417"]
+    )
+
+    with pytest.raises(ValueError):
+        nom_lookups.lookup_visa_subclass(["417"], "sources")